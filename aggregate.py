@@ -0,0 +1,137 @@
+"""
+CSV Organizer Pro 集計処理
+キー列ごとの合計・件数・最小・最大・平均・先頭値（チャンク単位の部分集計に対応）
+"""
+
+import pandas as pd
+
+from numeric import as_integer_if_whole, to_numeric
+
+# 集計関数と表示名
+AGG_FUNCS = {
+    'sum': '合計',
+    'count': '件数',
+    'min': '最小',
+    'max': '最大',
+    'mean': '平均',
+    'first': '先頭',
+}
+
+# 数値として集計する関数（数値に変換できない値は無視）
+NUMERIC_FUNCS = {'sum', 'min', 'max', 'mean'}
+
+# 部分集計同士を合算するときの関数
+_COMBINE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max', 'first': 'first'}
+
+
+def output_column(spec):
+    """集計結果の列名"""
+    return spec.get('new_column') or f"{spec['column']}_{spec['func']}"
+
+
+def _validate(columns, group_by, specs):
+    if not group_by:
+        raise ValueError("グループ化する列を選択してください")
+    if not specs:
+        raise ValueError("集計内容を指定してください")
+    for spec in specs:
+        if spec['func'] not in AGG_FUNCS:
+            raise ValueError(f"未対応の集計関数です: {spec['func']}")
+    needed = list(group_by) + [spec['column'] for spec in specs]
+    missing = [col for col in dict.fromkeys(needed) if col not in columns]
+    if missing:
+        raise ValueError(f"集計に使う列が見つかりません: {', '.join(missing)}")
+
+
+def _non_empty(series):
+    """空文字・欠損以外を1とする件数用の列"""
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        return (series.notna() & (series.astype(str) != '')).astype('int64')
+    return series.notna().astype('int64')
+
+
+class PartialAggregator:
+    """チャンクごとに部分集計し、グループ数分の状態だけを保持する"""
+
+    def __init__(self, group_by, specs):
+        self.group_by = list(group_by)
+        self.specs = list(specs)
+        self._state = None
+        self._combine = {}
+        for i, spec in enumerate(self.specs):
+            if spec['func'] == 'mean':
+                self._combine[f'_s{i}'] = 'sum'
+                self._combine[f'_c{i}'] = 'sum'
+            else:
+                self._combine[f'_v{i}'] = _COMBINE[spec['func']]
+
+    def _partial(self, chunk):
+        data = {col: chunk[col] for col in self.group_by}
+        agg = {}
+        numeric = {}
+        for i, spec in enumerate(self.specs):
+            source = chunk[spec['column']]
+            func = spec['func']
+            if func in NUMERIC_FUNCS and spec['column'] not in numeric:
+                # 同じ列を複数の関数で集計する場合も変換は1回だけ
+                numeric[spec['column']] = to_numeric(source)
+            if func == 'mean':
+                values = numeric[spec['column']]
+                data[f'_s{i}'] = values
+                data[f'_c{i}'] = values.notna().astype('int64')
+                agg[f'_s{i}'] = 'sum'
+                agg[f'_c{i}'] = 'sum'
+            elif func in NUMERIC_FUNCS:
+                data[f'_v{i}'] = numeric[spec['column']]
+                agg[f'_v{i}'] = func
+            elif func == 'count':
+                data[f'_v{i}'] = _non_empty(source)
+                agg[f'_v{i}'] = 'sum'
+            else:
+                data[f'_v{i}'] = source
+                agg[f'_v{i}'] = 'first'
+        frame = pd.DataFrame(data, copy=False)
+        return frame.groupby(self.group_by, sort=False, dropna=False).agg(agg)
+
+    def add(self, chunk):
+        """チャンクを部分集計して状態に合算"""
+        _validate(chunk.columns, self.group_by, self.specs)
+        partial = self._partial(chunk)
+        if self._state is None:
+            self._state = partial
+        else:
+            merged = pd.concat([self._state, partial])
+            self._state = merged.groupby(level=list(range(len(self.group_by))),
+                                         sort=False, dropna=False).agg(self._combine)
+
+    def result(self):
+        """最終的な集計結果を DataFrame で返す"""
+        if self._state is None:
+            return pd.DataFrame(columns=self.group_by + [output_column(s) for s in self.specs])
+        state = self._state.sort_index()
+        out = pd.DataFrame(index=state.index)
+        for i, spec in enumerate(self.specs):
+            if spec['func'] == 'mean':
+                counts = state[f'_c{i}']
+                out[output_column(spec)] = state[f'_s{i}'] / counts.where(counts > 0)
+            elif spec['func'] in NUMERIC_FUNCS:
+                out[output_column(spec)] = as_integer_if_whole(state[f'_v{i}'])
+            else:
+                out[output_column(spec)] = state[f'_v{i}']
+        out = out.reset_index()
+        out.columns = self.group_by + [output_column(s) for s in self.specs]
+        return out
+
+
+def aggregate_chunks(chunks, group_by, specs):
+    """チャンク列を集計して1つの DataFrame を返す"""
+    aggregator = PartialAggregator(group_by, specs)
+    for chunk in chunks:
+        aggregator.add(chunk)
+    return aggregator.result()
+
+
+def aggregate_dataframe(df, group_by, specs):
+    """DataFrame をキー列ごとに集計"""
+    _validate(df.columns, group_by, specs)
+    return aggregate_chunks([df], group_by, specs)
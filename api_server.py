@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+CSV Organizer Pro ジョブAPI
+保存済みテンプレートの適用をローカルの HTTP API からジョブとして投入できるようにする（ETL のスケジューラなどから利用）
+asyncio のサーバーで複数の投入を同時に受け付け、処理は上限付きのワーカー（jobs.JobManager）と待ち行列で実行する
+（テンプレートはアプリと同じ保存先 template_store を使う）
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+from arrow_csv import DEFAULT_ENGINE, ENGINES
+from batch import LINE_TERMINATOR_NAMES, apply_to_file
+from csv_writer import csv_options
+from instrumentation import Recorder
+from jobs import STATUS_LABELS, JobManager
+from pipeline import DEFAULT_CHUNKSIZE
+from staging import COPY_BLOCK_SIZE, STAGING_DIR
+from template_store import TemplateStore
+from validation import Validator
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8600
+DEFAULT_WORKERS = 2
+# 待ち行列に入れておけるジョブ数（超えた投入は 503 で断る）
+DEFAULT_MAX_QUEUE = 16
+
+# 終了したジョブの一時ファイル（アップロード・結果）を片付ける間隔（秒）
+CLEANUP_SECONDS = 60
+# wait=1 で完了を待つときの確認間隔（秒）
+WAIT_POLL_SECONDS = 0.1
+# API の呼び出しに必要なトークン（環境変数。指定しなければ起動のたびに作って表示する）と送るヘッダー
+API_TOKEN = os.environ.get('CSV_ORGANIZER_API_TOKEN')
+TOKEN_HEADER = 'x-api-token'
+# パスで指定できる入力・出力のフォルダ（環境変数はパス区切り文字で複数指定。指定しなければアップロードだけ受け付ける）
+INPUT_ROOTS = [p for p in os.environ.get('CSV_ORGANIZER_API_INPUT_ROOTS', '').split(os.pathsep) if p]
+OUTPUT_ROOTS = [p for p in os.environ.get('CSV_ORGANIZER_API_OUTPUT_ROOTS', '').split(os.pathsep) if p]
+# Host ヘッダーで受け付ける名前（ブラウザ経由の DNS リバインディング対策。ポート番号は除いて比べる）
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '[::1]', '::1')
+
+# リクエスト行とヘッダーの最大バイト数、JSON 本文の最大バイト数
+MAX_HEADER_BYTES = 64 * 1024
+MAX_JSON_BYTES = 1024 * 1024
+# アップロードの最大バイト数（環境変数は MB 単位。超えると本文を読まずに 413）
+MAX_UPLOAD_BYTES = int(os.environ.get('CSV_ORGANIZER_API_MAX_UPLOAD_MB', '2048')) * 1024 * 1024
+
+_REASONS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict', 411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class QueueFull(Exception):
+    """待ち行列がいっぱいで投入できない"""
+
+
+def _within(path, roots):
+    """path（実体のパス）が roots のどれかのフォルダの中にあるか"""
+    for root in roots:
+        root = os.path.realpath(root)
+        try:
+            if os.path.commonpath([path, root]) == root:
+                return True
+        except ValueError:  # Windows で別のドライブ
+            continue
+    return False
+
+
+def resolve_path(path, roots, kind):
+    """リクエストで指定されたパスを roots の中の実体のパスにする（外を指すパスは PermissionError）
+
+    相対パスは最初のフォルダからのパスとして扱う。シンボリックリンクはたどった先で判定する。
+    """
+    if not roots:
+        raise PermissionError(f"{kind}のパス指定は許可されていません（ファイルを本文で送ってください）")
+    resolved = os.path.realpath(os.path.join(roots[0], path))
+    if not _within(resolved, roots):
+        raise PermissionError(f"{kind}のパスは許可されたフォルダの中を指定してください: {path}")
+    return resolved
+
+
+class JobService:
+    """テンプレート適用ジョブの投入・状態・結果（HTTP に依存しないので、アプリから同じ manager・store で使える）
+
+    出力先を指定しないジョブの結果は一時ファイルに書き出し、取り出すか削除するまで残す。
+    パスで指定する入力・出力は input_roots・output_roots のフォルダの中に限る（空ならパス指定は断る）。
+    """
+
+    def __init__(self, manager=None, store=None, max_queue=DEFAULT_MAX_QUEUE, work_dir=STAGING_DIR,
+                 input_roots=INPUT_ROOTS, output_roots=OUTPUT_ROOTS):
+        self.manager = manager or JobManager(max_workers=DEFAULT_WORKERS)
+        self.store = store or TemplateStore()
+        self.max_queue = max_queue
+        self.work_dir = work_dir
+        self.input_roots = list(input_roots)
+        self.output_roots = list(output_roots)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _temp_path(self, prefix, suffix):
+        fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=self.work_dir)
+        os.close(fd)
+        return path
+
+    def upload_path(self, file_name=''):
+        """アップロードされた入力を書き出す一時ファイルのパス"""
+        return self._temp_path('csv_organizer_api_input_', os.path.splitext(file_name)[1].lower() or '.csv')
+
+    def _config(self, params):
+        if isinstance(params.get('config'), dict):
+            return params.get('template') or '(インライン)', params['config']
+        name = params.get('template')
+        if not name:
+            raise ValueError("template（テンプレート名）または config を指定してください")
+        info = self.store.get(name)
+        if info is None:
+            raise LookupError(f"テンプレートが見つかりません: {name}")
+        return name, info['config']
+
+    @staticmethod
+    def _options(params):
+        """リクエストの設定を検証して apply_to_file の引数にする（クエリ文字列の値は文字列で来る）"""
+        def integer(key, default, minimum):
+            try:
+                value = int(params.get(key, default))
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} は整数で指定してください") from None
+            if value < minimum:
+                raise ValueError(f"{key} は {minimum} 以上で指定してください")
+            return value
+
+        engine = params.get('engine') or DEFAULT_ENGINE
+        if engine not in ENGINES:
+            raise ValueError(f"未対応のエンジンです: {engine}")
+        output_options = csv_options(params.get('out_encoding') or 'utf-8-sig', params.get('errors') or 'strict',
+                                     quoting=params.get('quoting') or 'minimal')
+        if params.get('line_terminator'):
+            if params['line_terminator'] not in LINE_TERMINATOR_NAMES:
+                raise ValueError(f"未対応の改行コードです: {params['line_terminator']}")
+            output_options['lineterminator'] = LINE_TERMINATOR_NAMES[params['line_terminator']]
+        return {
+            'chunksize': integer('chunksize', DEFAULT_CHUNKSIZE, 1),
+            'header_row': integer('header_row', 0, 0),
+            'encoding': params.get('encoding') or None,
+            'output_options': output_options,
+            'engine': engine,
+        }
+
+    def queue_depth(self):
+        """実行を待っているジョブ数（同じ manager を使うアプリのジョブも含む）"""
+        return sum(1 for job in self.manager.jobs() if job.status == 'queued')
+
+    def check_capacity(self):
+        """待ち行列がいっぱいなら QueueFull（アップロードを受け取る前の確認用。投入時にも改めて確認する）"""
+        if self.queue_depth() >= self.max_queue:
+            raise QueueFull(f"待ち行列がいっぱいです（{self.max_queue} 件）")
+
+    def submit(self, params, upload=None):
+        """ジョブを投入して Job を返す
+
+        params は {'template' または 'config', 'input'（upload が無いとき）, 'output'（任意）, 'header_row',
+        'encoding', 'engine', 'chunksize', 'out_encoding', 'errors', 'quoting', 'line_terminator'}。
+        upload（アップロードを書き出した一時ファイル）を渡すとそれを入力にし、終了後に削除する。
+        input・output が許可されたフォルダの外なら PermissionError。
+        """
+        try:
+            name, config = self._config(params)
+            options = self._options(params)
+            input_path = upload
+            if input_path is None:
+                if not params.get('input'):
+                    raise ValueError("input（入力ファイルのパス）を指定するか、ファイルを本文で送ってください")
+                input_path = resolve_path(params['input'], self.input_roots, '入力')
+                if not os.path.isfile(input_path):
+                    raise ValueError(f"入力ファイルが見つかりません: {params['input']}")
+            output = resolve_path(params['output'], self.output_roots, '出力') if params.get('output') else None
+            with self._lock:
+                self.check_capacity()
+                result_path = output or self._temp_path('csv_organizer_api_result_', '.csv')
+                recorder = Recorder('api')
+                job = self.manager.submit(_run_job, config, input_path, result_path, options, upload,
+                                          label=f"API: {name}", recorder=recorder)
+                self._entries[job.id] = {
+                    'template': name,
+                    'input': params.get('input') if upload is None else params.get('name') or '(アップロード)',
+                    'output': output,
+                    'result_path': None if output else result_path,
+                    'upload': upload,
+                    'recorder': recorder,
+                }
+        except BaseException:
+            if upload is not None:
+                _remove(upload)
+            raise
+        return job
+
+    def get(self, job_id):
+        """(Job, 記録) を返す（このサービスで投入していない・破棄されたジョブは LookupError）"""
+        with self._lock:
+            entry = self._entries.get(job_id)
+        job = self.manager.get(job_id) if entry is not None else None
+        if job is None:
+            raise LookupError(f"ジョブが見つかりません: {job_id}")
+        return job, entry
+
+    def result_path(self, job_id):
+        """出力先を指定しなかったジョブの結果ファイル（終わっていなければ ValueError）"""
+        job, entry = self.get(job_id)
+        if entry['result_path'] is None:
+            raise ValueError(f"結果は {entry['output']} に書き出しています")
+        if job.status != 'done':
+            raise ValueError(f"ジョブは{STATUS_LABELS[job.status]}です")
+        return entry['result_path']
+
+    def discard(self, job_id):
+        """ジョブを取り消して破棄し、一時ファイルを削除する"""
+        job, entry = self.get(job_id)
+        description = self.describe(job, entry)
+        self.manager.discard(job_id)
+        with self._lock:
+            self._entries.pop(job_id, None)
+        self._remove_files(entry, job)
+        return description
+
+    @staticmethod
+    def _remove_files(entry, job):
+        if entry['result_path'] is not None:
+            _remove(entry['result_path'])
+        if entry['upload'] is not None and (job is None or job.finished):
+            _remove(entry['upload'])
+
+    def cleanup(self):
+        """manager から消えた（終了後しばらく経った）ジョブの記録と一時ファイルを片付ける"""
+        with self._lock:
+            expired = [(job_id, entry) for job_id, entry in self._entries.items()
+                       if self.manager.get(job_id) is None]
+            for job_id, _ in expired:
+                del self._entries[job_id]
+        for _, entry in expired:
+            self._remove_files(entry, None)
+        return len(expired)
+
+    def close(self):
+        """すべてのジョブの一時ファイルを削除する（サーバー停止時）"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._remove_files(entry, None)
+
+    def describe(self, job, entry):
+        """ジョブの状態と時間（待ち時間・処理時間・工程ごとの時間）"""
+        now = time.time()
+        description = {
+            'id': job.id,
+            'template': entry['template'],
+            'status': job.status,
+            'status_label': STATUS_LABELS[job.status],
+            'input': entry['input'],
+            'output': entry['output'],
+            'processed_rows': job.done,
+            'rows': job.result['rows'] if job.status == 'done' else None,
+            'error': job.error,
+            'created_at': datetime.fromtimestamp(job.created_at).isoformat(timespec='seconds'),
+            'queued_seconds': round((job.started_at or job.finished_at or now) - job.created_at, 3),
+            'run_seconds': round(job.elapsed, 3),
+        }
+        if job.status == 'done' and 'validation' in job.result:
+            description['validation'] = job.result['validation']
+        if job.status == 'done' and entry['result_path'] is not None:
+            description['result_url'] = f"/jobs/{job.id}/result"
+        if job.finished:
+            description['stages'] = [
+                {'stage': row['stage'], 'calls': row['calls'], 'seconds': round(row['seconds'], 3),
+                 'rows': row['rows']}
+                for row in entry['recorder'].summary()
+            ]
+        return description
+
+    def list(self):
+        with self._lock:
+            entries = list(self._entries.items())
+        result = []
+        for job_id, entry in entries:
+            job = self.manager.get(job_id)
+            if job is not None:
+                result.append(self.describe(job, entry))
+        return result
+
+    def stats(self):
+        """ワーカー数・待ち行列の長さ・状態ごとの件数・平均の待ち時間と処理時間"""
+        jobs = self.list()
+        finished = [job for job in jobs if job['status'] in ('done', 'failed')]
+        counts = {status: 0 for status in STATUS_LABELS}
+        for job in jobs:
+            counts[job['status']] += 1
+
+        def average(key):
+            return round(sum(job[key] for job in finished) / len(finished), 3) if finished else None
+        return {
+            'workers': self.manager.max_workers,
+            'max_queue': self.max_queue,
+            'queue_depth': self.queue_depth(),
+            'running': sum(1 for job in self.manager.jobs() if job.status == 'running'),
+            'jobs': counts,
+            'avg_queued_seconds': average('queued_seconds'),
+            'avg_run_seconds': average('run_seconds'),
+        }
+
+
+def _run_job(job, config, input_path, output_path, options, upload):
+    # テンプレートに入力チェックがあれば、違反件数（ルールごと・値の例）を結果に含める
+    validator = Validator(config['validation_rules']) if config.get('validation_rules') else None
+    try:
+        result = {'rows': apply_to_file(config, input_path, output_path, progress=job.iterate, validator=validator,
+                                        **options)}
+        if validator is not None:
+            result['validation'] = validator.summary()
+        return result
+    finally:
+        if upload is not None:
+            _remove(upload)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, method, target, headers):
+        self.method = method
+        url = urllib.parse.urlsplit(target)
+        self.path = url.path.rstrip('/') or '/'
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        self.headers = headers
+
+    @property
+    def content_length(self):
+        try:
+            return int(self.headers['content-length'])
+        except (KeyError, ValueError):
+            return None
+
+
+async def _read_request(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "リクエストヘッダーが大きすぎます") from None
+    lines = head.decode('utf-8', 'replace').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "リクエスト行が不正です") from None
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return Request(method.upper(), target, headers)
+
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+    lines += [f"{key}: {value}" for key, value in {**headers, 'Connection': 'close'}.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _send_json(writer, status, data, headers=None):
+    body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    writer.write(_head(status, {'Content-Type': 'application/json; charset=utf-8',
+                                'Content-Length': len(body), **(headers or {})}))
+    writer.write(body)
+    await writer.drain()
+
+
+async def _send_file(writer, path, headers):
+    """ファイルをブロックごとに送る（結果全体をメモリに読み込まない）"""
+    writer.write(_head(200, {'Content-Type': 'text/csv', 'Content-Length': os.path.getsize(path), **headers}))
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            writer.write(block)
+            await writer.drain()
+
+
+def _host_name(host):
+    """Host ヘッダーからポート番号を除いた名前（[::1]:8600 -> [::1]）"""
+    if host.startswith('['):
+        return host[:host.find(']') + 1] if ']' in host else host
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+
+class ApiServer:
+    """JobService を HTTP で公開する（1リクエストごとに接続を閉じる）
+
+    GET /health 以外は X-API-Token ヘッダーにトークンが必要。ブラウザからの呼び出し（Origin ヘッダー付き）と、
+    Host ヘッダーが自分のPC（または allowed_hosts）でないリクエストは断る。
+
+    GET  /health                     稼働確認
+    GET  /templates                  保存済みテンプレートの一覧
+    GET  /stats                      ワーカー数・待ち行列の長さ・平均時間
+    GET  /jobs                       ジョブの一覧
+    POST /jobs                       投入（JSON 本文でパス指定、またはCSVを本文で送り設定はクエリ文字列）。wait=1 で完了まで待つ
+    GET  /jobs/<id>                  状態と時間
+    GET  /jobs/<id>/result           結果のCSV（出力先を指定しなかったジョブ）
+    DELETE /jobs/<id>                取り消して破棄
+    """
+
+    def __init__(self, service, token, allowed_hosts=(), max_upload_bytes=MAX_UPLOAD_BYTES):
+        if not token:
+            raise ValueError("ジョブAPIのトークンを指定してください")
+        self.service = service
+        self.token = token
+        self.max_upload_bytes = max_upload_bytes
+        self.allowed_hosts = set(LOCAL_HOSTS) | {host.lower() for host in allowed_hosts}
+
+    def _check_access(self, request):
+        # Web ページからの「単純なリクエスト」は CORS の事前確認なしで届くので、ブラウザ経由の呼び出しは一律に断る
+        if 'origin' in request.headers:
+            raise HTTPError(403, "ブラウザからの呼び出しは受け付けていません")
+        host = request.headers.get('host', '').lower()
+        if _host_name(host) not in self.allowed_hosts:
+            raise HTTPError(403, f"Host が許可されていません: {host}")
+        if request.method == 'GET' and request.path in ('/', '/health'):
+            return
+        if not hmac.compare_digest(request.headers.get(TOKEN_HEADER, '').encode('utf-8'),
+                                   self.token.encode('utf-8')):
+            raise HTTPError(401, "X-API-Token ヘッダーに正しいトークンを指定してください")
+
+    async def handle(self, reader, writer):
+        try:
+            request = await _read_request(reader)
+            self._check_access(request)
+            await self._dispatch(request, reader, writer)
+        except HTTPError as e:
+            await _send_json(writer, e.status, {'error': e.message}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await _send_json(writer, 500, {'error': str(e)})
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _call(self, func, *args):
+        try:
+            return func(*args)
+        except LookupError as e:
+            raise HTTPError(404, str(e.args[0]) if e.args else str(e)) from None
+        except PermissionError as e:
+            raise HTTPError(403, str(e)) from None
+        except QueueFull as e:
+            raise HTTPError(503, str(e), {'Retry-After': 5}) from None
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+
+    async def _dispatch(self, request, reader, writer):
+        parts = request.path.strip('/').split('/')
+        route = (request.method, parts[0] if parts[0] else '', len(parts))
+        if route == ('GET', '', 1) or route == ('GET', 'health', 1):
+            await _send_json(writer, 200, {'status': 'ok'})
+        elif route == ('GET', 'templates', 1):
+            templates = self.service.store.load_all()
+            await _send_json(writer, 200, [
+                {'name': name, 'description': info['description'], 'created_at': info['created_at']}
+                for name, info in templates.items()
+            ])
+        elif route == ('GET', 'stats', 1):
+            await _send_json(writer, 200, self.service.stats())
+        elif route == ('GET', 'jobs', 1):
+            await _send_json(writer, 200, self.service.list())
+        elif route == ('POST', 'jobs', 1):
+            await self._submit(request, reader, writer)
+        elif route == ('GET', 'jobs', 2):
+            job, entry = self._call(self.service.get, parts[1])
+            await _send_json(writer, 200, self.service.describe(job, entry))
+        elif route == ('GET', 'jobs', 3) and parts[2] == 'result':
+            path = self._call(self.service.result_path, parts[1])
+            await _send_file(writer, path, {'X-Job-Id': parts[1]})
+        elif route == ('DELETE', 'jobs', 2):
+            await _send_json(writer, 200, self._call(self.service.discard, parts[1]))
+        elif parts[0] in ('', 'health', 'templates', 'stats', 'jobs'):
+            raise HTTPError(405, f"{request.method} {request.path} には対応していません")
+        else:
+            raise HTTPError(404, f"{request.path} はありません")
+
+    async def _read_body(self, request, reader, limit):
+        length = request.content_length
+        if length is None:
+            raise HTTPError(411, "Content-Length を指定してください")
+        if length > limit:
+            raise HTTPError(413, "本文が大きすぎます")
+        return await reader.readexactly(length)
+
+    async def _upload(self, request, reader):
+        """本文を一時ファイルに書き出す（ブロックごとに書くので大きなファイルもメモリに載せない）
+
+        待ち行列がいっぱいなら、本文を受け取る前に断る。ファイルへの書き込みは別スレッドで行い、
+        その間も他のリクエストを受け付ける。
+        """
+        remaining = request.content_length
+        if remaining is None:
+            raise HTTPError(411, "Content-Length を指定してください")
+        if remaining > self.max_upload_bytes:
+            raise HTTPError(413, f"ファイルが大きすぎます（上限 {self.max_upload_bytes // (1024 * 1024):,} MB）")
+        self._call(self.service.check_capacity)
+        loop = asyncio.get_running_loop()
+        path = self.service.upload_path(request.query.get('name', ''))
+        try:
+            with open(path, 'wb') as f:
+                while remaining > 0:
+                    block = await reader.read(min(COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    await loop.run_in_executor(None, f.write, block)
+                    remaining -= len(block)
+        except BaseException:
+            _remove(path)
+            raise
+        return path
+
+    async def _submit(self, request, reader, writer):
+        if request.headers.get('content-type', '').startswith('application/json'):
+            try:
+                params = json.loads(await self._read_body(request, reader, MAX_JSON_BYTES) or b'{}')
+            except ValueError:
+                raise HTTPError(400, "JSON を読み取れません") from None
+            if not isinstance(params, dict):
+                raise HTTPError(400, "JSON はオブジェクトで指定してください")
+            params = {**request.query, **params}
+            job = self._call(self.service.submit, params)
+        else:
+            params = request.query
+            job = self._call(self.service.submit, params, await self._upload(request, reader))
+        if str(params.get('wait', '')).lower() not in ('1', 'true'):
+            _, entry = self.service.get(job.id)
+            await _send_json(writer, 202, self.service.describe(job, entry), {'Location': f"/jobs/{job.id}"})
+            return
+        while not job.finished:
+            await asyncio.sleep(WAIT_POLL_SECONDS)
+        job, entry = self._call(self.service.get, job.id)
+        description = self.service.describe(job, entry)
+        if job.status == 'done' and entry['result_path'] is not None:
+            headers = {'X-Job-Id': job.id, 'X-Rows': description['rows']}
+            if 'validation' in description:
+                headers['X-Invalid-Rows'] = description['validation']['invalid_rows']
+            await _send_file(writer, entry['result_path'], headers)
+        else:
+            status = {'done': 200, 'cancelled': 409}.get(job.status, 500)
+            await _send_json(writer, status, description)
+
+
+async def serve(service, token, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None, allowed_hosts=(),
+                max_upload_bytes=MAX_UPLOAD_BYTES):
+    """サーバーを起動して止まるまで受け付ける（ready を渡すと受け付けを始めたときに set する）"""
+    api = ApiServer(service, token, allowed_hosts, max_upload_bytes)
+    server = await asyncio.start_server(api.handle, host, port, limit=MAX_HEADER_BYTES)
+
+    async def cleanup():
+        while True:
+            await asyncio.sleep(CLEANUP_SECONDS)
+            service.manager.prune()
+            service.cleanup()
+
+    cleaner = asyncio.create_task(cleanup())
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        cleaner.cancel()
+
+
+def start_in_thread(service, token, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """別スレッドでサーバーを起動する（アプリのプロセス内で JobManager・テンプレートを共有するため）"""
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(serve(service, token, host, port, ready)),
+                              name='csv-organizer-api', daemon=True)
+    thread.start()
+    ready.wait(timeout=10)
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="テンプレート適用ジョブを受け付けるローカルの HTTP API")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"待ち受けるアドレス（既定: {DEFAULT_HOST}）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"ポート番号（既定: {DEFAULT_PORT}）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="同時に実行するジョブ数")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="待ち行列に入れておけるジョブ数")
+    parser.add_argument("--template-dir", help="テンプレートの保存先（既定: アプリと同じ）")
+    parser.add_argument("--input-root", action="append", metavar="DIR",
+                        help="input でパスを指定できるフォルダ（複数指定可。既定: 環境変数 CSV_ORGANIZER_API_INPUT_ROOTS、"
+                             "無ければパス指定を受け付けない）")
+    parser.add_argument("--output-root", action="append", metavar="DIR",
+                        help="output でパスを指定できるフォルダ（複数指定可。既定: 環境変数 CSV_ORGANIZER_API_OUTPUT_ROOTS）")
+    parser.add_argument("--max-upload-mb", type=int, default=MAX_UPLOAD_BYTES // (1024 * 1024), metavar="MB",
+                        help="本文で送るファイルの上限（既定: 環境変数 CSV_ORGANIZER_API_MAX_UPLOAD_MB、無ければ 2048）")
+    parser.add_argument("--allowed-host", action="append", default=[], metavar="NAME",
+                        help="Host ヘッダーで受け付ける名前を追加する（--host 0.0.0.0 で他のPCから呼ぶときのサーバー名など）")
+    args = parser.parse_args(argv)
+
+    token = API_TOKEN or secrets.token_urlsafe(24)
+    store = TemplateStore(args.template_dir) if args.template_dir else TemplateStore()
+    manager = JobManager(max_workers=args.workers)
+    service = JobService(manager, store, args.max_queue, input_roots=args.input_root or INPUT_ROOTS,
+                         output_roots=args.output_root or OUTPUT_ROOTS)
+    print(f"🚀 http://{args.host}:{args.port} でジョブを受け付けています（ワーカー {args.workers}, "
+          f"テンプレート: {os.path.abspath(store.directory)}）")
+    if not API_TOKEN:
+        print(f"🔑 トークン（X-API-Token ヘッダーで送る）: {token}")
+    try:
+        asyncio.run(serve(service, token, args.host, args.port, allowed_hosts=args.allowed_host,
+                          max_upload_bytes=args.max_upload_mb * 1024 * 1024))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.shutdown(wait=True)
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,30 @@
 import streamlit as st
 import pandas as pd
-import io
+import os
 import json
-import zipfile
+import re
+import tempfile
+import uuid
 from datetime import datetime
 
+from aggregate import AGG_FUNCS, aggregate_dataframe
+from arrow_csv import DEFAULT_ENGINE, ENGINES
+from column_index import ColumnOrder
+from csv_writer import (
+    DEFAULT_SPOOL_MEMORY, ENCODINGS, ERROR_POLICIES, LINE_TERMINATORS, QUOTING,
+    csv_options, spooled_csv, write_split_zip
+)
+from decompress import UPLOAD_TYPES
+from dedupe import dedupe_dataframe
+from expressions import FUNCTIONS, evaluate_expression
+from instrumentation import Recorder, current_rss_mb, peak_rss_mb, set_recorder, stage
+from jobs import STATUS_LABELS, JobManager
+from loader import load_file, read_header, read_sample
+from pipeline import apply_template_config, final_frame, merge_columns, operation_steps
+from schema import DRIFT_SAMPLE_ROWS, check_drift, compatible_schema, describe_issue, infer_schema
+from shared_cache import SharedCache, content_key
+from staging import StagedFile, file_digest
+
 # ページ設定
 st.set_page_config(
     page_title="CSV Organizer Pro", 
@@ -13,156 +33,52 @@ st.set_page_config(
     page_icon="📊"
 )
 
-# カスタムCSS
-st.markdown("""
-<style>
-/* メインタイトル */
-.main-title {
-    font-size: 2.5rem;
-    font-weight: 700;
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    -webkit-background-clip: text;
-    -webkit-text-fill-color: transparent;
-    background-clip: text;
-    text-align: center;
-    margin-bottom: 2rem;
-}
-
-/* セクションヘッダー */
-.section-header {
-    font-size: 1.3rem;
-    font-weight: 600;
-    color: #2c3e50;
-    margin: 1.5rem 0 1rem 0;
-    padding-bottom: 0.5rem;
-    border-bottom: 2px solid #e8f4f8;
-}
-
-/* カード風コンテナ */
-.card-container {
-    background: white;
-    border-radius: 12px;
-    padding: 1.5rem;
-    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-    border: 1px solid #e8f4f8;
-    margin-bottom: 1rem;
-}
-
-/* ステータスバッジ */
-.status-badge {
-    display: inline-block;
-    padding: 0.25rem 0.75rem;
-    border-radius: 20px;
-    font-size: 0.875rem;
-    font-weight: 500;
-    margin: 0.25rem;
-}
-
-.status-success {
-    background: #d4edda;
-    color: #155724;
-}
-
-.status-warning {
-    background: #fff3cd;
-    color: #856404;
-}
-
-.status-info {
-    background: #d1ecf1;
-    color: #0c5460;
-}
-
-/* ボタンスタイル */
-.stButton > button {
-    border-radius: 8px;
-    font-weight: 500;
-    transition: all 0.3s ease;
-}
-
-/* メトリクスカード */
-.metric-card {
-    background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
-    border-radius: 10px;
-    padding: 1rem;
-    text-align: center;
-    border: 1px solid #dee2e6;
-}
-
-/* アップロードエリア */
-.upload-area {
-    border: 2px dashed #cbd5e0;
-    border-radius: 12px;
-    padding: 2rem;
-    text-align: center;
-    background: #f8fafc;
-    transition: all 0.3s ease;
-}
-
-/* ファイル情報 */
-.file-info {
-    background: linear-gradient(135deg, #e8f5e8 0%, #f0f8f0 100%);
-    border-radius: 8px;
-    padding: 1rem;
-    border-left: 4px solid #28a745;
-    margin: 1rem 0;
-}
-
-/* 操作タブ */
-.operation-tab {
-    background: #f8f9fa;
-    border-radius: 8px;
-    padding: 1rem;
-    margin: 0.5rem 0;
-    border: 1px solid #e9ecef;
-}
-
-/* チェックボックスグリッド */
-.checkbox-grid {
-    display: grid;
-    grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-    gap: 0.5rem;
-    margin: 1rem 0;
-}
-
-/* プレビューテーブル */
-.preview-table {
-    border-radius: 8px;
-    overflow: hidden;
-    box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-}
-
-/* サイドバーセクション */
-.sidebar-section {
-    background: #f8f9fa;
-    border-radius: 8px;
-    padding: 1rem;
-    margin: 1rem 0;
-    border: 1px solid #e9ecef;
-}
-
-/* レスポンシブ対応 */
-@media (max-width: 768px) {
-    .main-title {
-        font-size: 2rem;
-    }
-    .section-header {
-        font-size: 1.1rem;
+# カスタムCSS（static/style.css を1回だけ読み込んで縮めたものを毎回の描画で使う）
+STYLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
+
+@st.cache_resource
+def load_style():
+    """カスタムCSSの <style> 要素（コメントと余分な空白を除く）"""
+    with open(STYLE_PATH, encoding='utf-8') as f:
+        css = f.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    css = re.sub(r'\s+', ' ', css).strip()
+    return f"<style>{css}</style>"
+
+st.markdown(load_style(), unsafe_allow_html=True)
+
+# 手動操作の記録（テンプレート保存用）
+def new_operations():
+    """空の操作記録を作成"""
+    return {
+        'merge_operations': [],
+        'split_operations': [],
+        'empty_columns': [],
+        'expression_columns': [],
+        'dedupe_operations': [],
+        'aggregate_operations': []
     }
-}
 
-/* デバッグ情報を非表示 */
-.stDeployButton {
-    display: none;
-}
+def record_operation(kind, operation):
+    """手動操作をテンプレート用の記録と処理履歴（共有キャッシュのキーに使用）に追加"""
+    if kind == 'empty_columns':
+        st.session_state.operations[kind].extend(operation)
+    else:
+        st.session_state.operations[kind].append(operation)
+    st.session_state.lineage.append([kind, operation])
 
-/* エラー表示の改善 */
-.stAlert {
-    border-radius: 8px;
-    margin: 1rem 0;
-}
-</style>
-""", unsafe_allow_html=True)
+def recorded_steps():
+    """処理履歴をテンプレートに保存する操作の順序にする（適用したテンプレートはその操作に展開）"""
+    steps = []
+    for kind, operation in st.session_state.lineage:
+        steps.extend(operation_steps(operation) if kind == 'template' else [[kind, operation]])
+    return steps
+
+def set_df(df):
+    """作業中の DataFrame を置き換える（列を追加した同じオブジェクトでも版を上げ、入力チェックの結果を作り直す）"""
+    st.session_state.df = df
+    st.session_state.df_version += 1
 
 # セッション状態の初期化関数
 def init_session_state():
@@ -170,12 +86,14 @@ def init_session_state():
     try:
         if 'df' not in st.session_state:
             st.session_state.df = None
+        if 'df_version' not in st.session_state:
+            st.session_state.df_version = 0
         if 'original_columns' not in st.session_state:
             st.session_state.original_columns = []
         if 'selected_columns' not in st.session_state:
             st.session_state.selected_columns = set()
         if 'column_order' not in st.session_state:
-            st.session_state.column_order = []
+            st.session_state.column_order = ColumnOrder()
         if 'uploaded_file_name' not in st.session_state:
             st.session_state.uploaded_file_name = None
         if 'templates' not in st.session_state:
@@ -186,66 +104,590 @@ def init_session_state():
             st.session_state.current_operation = "merge"
         if 'saved_max_rows' not in st.session_state:
             st.session_state.saved_max_rows = None
+        if 'loaded_key' not in st.session_state:
+            st.session_state.loaded_key = None
+        if 'operations' not in st.session_state:
+            st.session_state.operations = new_operations()
+        if 'perf_runs' not in st.session_state:
+            st.session_state.perf_runs = []
+        if 'jobs' not in st.session_state:
+            st.session_state.jobs = {}
+        if 'session_id' not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex
+        if 'input_key' not in st.session_state:
+            st.session_state.input_key = None
+        if 'lineage' not in st.session_state:
+            st.session_state.lineage = []
+        if 'cache_refs' not in st.session_state:
+            st.session_state.cache_refs = {}
+        if 'input_columns' not in st.session_state:
+            st.session_state.input_columns = []
+        if 'validation_rules' not in st.session_state:
+            st.session_state.validation_rules = []
     except Exception as e:
         # エラーが発生した場合は静かに処理
         pass
 
 # テンプレート保存機能
+@st.cache_resource
+def get_template_store():
+    """全セッション・ジョブAPI・batch で共有するテンプレートの保存先"""
+    from template_store import TemplateStore  # 最初の描画で使うときに読み込む
+    return TemplateStore()
+
 def save_template(name, config):
     """テンプレートを保存"""
     try:
-        st.session_state.templates[name] = {
-            'config': config,
-            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'description': config.get('description', '')
-        }
+        info = get_template_store().save(name, config)
+        st.session_state.templates[name] = {key: info[key] for key in ('config', 'created_at', 'description')}
     except Exception as e:
         st.error(f"テンプレート保存エラー: {str(e)}")
 
+# ジョブAPI（環境変数でポートを指定したときだけ、アプリと同じジョブ管理・テンプレートで起動）
+API_PORT = os.environ.get('CSV_ORGANIZER_API_PORT')
+
+@st.cache_resource
+def start_job_api(port):
+    """プロセスに1つだけジョブAPIを起動する"""
+    import api_server  # ジョブAPIを使うときだけ読み込む
+    import secrets
+    service = api_server.JobService(get_job_manager(), get_template_store())
+    token = api_server.API_TOKEN
+    if not token:
+        # トークンはブラウザには出さず、アプリを起動したコンソールにだけ表示する
+        token = secrets.token_urlsafe(24)
+        print(f"🔑 ジョブAPIのトークン（X-API-Token ヘッダーで送る）: {token}")
+    api_server.start_in_thread(service, token, port=port)
+    return service
+
 # テンプレート適用機能
-def apply_template(template_config, df):
-    """テンプレートを適用"""
+def apply_template(job, template_config, df):
+    """テンプレートを適用（バックグラウンドで実行するため元の DataFrame は変更しない）"""
+    with stage('apply_template', rows=len(df)):
+        return apply_template_config(template_config, df.copy(deep=False))
+
+# バックグラウンドで実行する処理（st.* は呼ばない）
+def cached(cache_ref, factory):
+    """cache_ref (キャッシュ, キー, セッション) があれば共有キャッシュを使って factory() の結果を返す"""
+    if cache_ref is None:
+        return factory()
+    cache, cache_key, owner = cache_ref
+    return cache.get_or_create(cache_key, factory, owner)
+
+def load_job(job, uploaded_file, header_row, engine, schema, cache, owner, sheets=None, sheet_column=None):
+    """アップロードされたファイルを読み込み (キャッシュキー, DataFrame, 読み込みの計測値) を返す
+
+    同じ内容のファイルを他のセッションが読み込み済みなら、その結果を共有する（計測値は空）。
+    読み込むときは一時ファイルに書き出してメモリマップ経由で読み、読み終えたら削除する。
+    schema（選択中のテンプレートのスキーマ）があれば、先頭の数行で読める型か確かめてから型指定に使う。
+    sheets（Excel のシート名のリスト）を渡すとそれらのシートを並列に読んでつなげる（進捗はシート数）。
+    """
+    if schema:
+        schema = compatible_schema(schema, check_drift(schema, read_sample(uploaded_file, uploaded_file.name, header_row)))
+    input_key = content_key('input', file_digest(uploaded_file), header_row,
+                            os.path.splitext(uploaded_file.name)[1].lower(), engine, schema, sheets, sheet_column)
+    load_stats = {}
+    if sheets:
+        job.unit = 'シート'
+        progress = job.report
+    else:
+        progress = lambda done, total: job.report(done // 1024, total // 1024)
+
+    def load():
+        with StagedFile(uploaded_file, uploaded_file.name) as staged:
+            return load_file(staged.path, uploaded_file.name, header_row, progress=progress,
+                             stats=load_stats, engine=engine, schema=schema, sheets=sheets,
+                             sheet_column=sheet_column)
+
+    df = cached((cache, input_key, owner), load)
+    return input_key, df, load_stats
+
+def csv_job(job, final_df, output_options, cache_ref=None):
+    """ダウンロード用のCSVを作成"""
+    def build():
+        with stage('download_csv', rows=len(final_df)):
+            progress = lambda rows: job.report(rows, len(final_df))
+            with spooled_csv(final_df, progress=progress, **output_options) as csv_file:
+                return csv_file.read()
+    return cached(cache_ref, build)
+
+def excel_job(job, final_df, cache_ref=None):
+    """ダウンロード用のExcelファイルを作成し (データ, シート数) を返す（行数上限を超える分は新しいシート）"""
+    from excel_writer import write_excel  # Excel出力のときだけ読み込む
+
+    def build():
+        with stage('download_excel', rows=len(final_df)):
+            progress = lambda rows: job.report(rows, len(final_df))
+            with tempfile.SpooledTemporaryFile(max_size=DEFAULT_SPOOL_MEMORY) as excel_file:
+                _rows, sheets = write_excel(final_df, excel_file, progress=progress)
+                excel_file.seek(0)
+                return excel_file.read(), len(sheets)
+    return cached(cache_ref, build)
+
+def split_zip_job(job, final_df, max_rows_per_file, base_name, output_options, cache_ref=None):
+    """行数ごとに分割したCSVのZIPを作成し (データ, ファイル数) を返す"""
+    return cached(cache_ref, lambda: _build_split_zip(job, final_df, max_rows_per_file, base_name, output_options))
+
+def _build_split_zip(job, final_df, max_rows_per_file, base_name, output_options):
+    with stage('split_zip', rows=len(final_df)):
+        progress = lambda rows: job.report(rows, len(final_df))
+        with tempfile.SpooledTemporaryFile(max_size=DEFAULT_SPOOL_MEMORY) as zip_buffer:
+            total_files = write_split_zip(final_df, zip_buffer, max_rows_per_file, base_name, progress=progress, **output_options)
+            zip_buffer.seek(0)
+            return zip_buffer.read(), total_files
+
+def partition_job(job, final_df, column, by_month, prefix, output_options, sort_by, sort_numeric,
+                  cache_ref=None):
+    """キー列の値ごとのCSVのZIPを作成し (データ, ファイル数) を返す"""
+    return cached(cache_ref, lambda: _build_partition_zip(
+        job, final_df, column, by_month, prefix, output_options, sort_by, sort_numeric
+    ))
+
+def _build_partition_zip(job, final_df, column, by_month, prefix, output_options, sort_by, sort_numeric):
+    import zipfile  # ZIP出力のときだけ読み込む
+    from partition import DEFAULT_MAX_BUFFERED_ROWS, write_partitions
+
+    with stage('partition', rows=len(final_df)), tempfile.TemporaryDirectory() as tmp_dir:
+        chunk_rows = DEFAULT_MAX_BUFFERED_ROWS
+        chunks = (final_df.iloc[i:i + chunk_rows] for i in range(0, len(final_df), chunk_rows))
+        partitions = write_partitions(
+            job.iterate(chunks, len(final_df)),
+            tmp_dir,
+            column,
+            by_month=by_month,
+            prefix=prefix,
+            csv_options=output_options,
+            sort_by=sort_by,
+            sort_numeric=sort_numeric
+        )
+        
+        with tempfile.SpooledTemporaryFile(max_size=DEFAULT_SPOOL_MEMORY) as zip_buffer:
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for path, _rows in partitions.values():
+                    zip_file.write(path, os.path.basename(path))
+            zip_buffer.seek(0)
+            return zip_buffer.read(), len(partitions)
+
+# 共有キャッシュ
+@st.cache_resource
+def get_shared_cache():
+    """全セッションで共有する読み込み結果・出力のキャッシュ"""
+    return SharedCache()
+
+def hold_cached(purpose, cache_key):
+    """このセッションが使っているキャッシュとして登録（同じ目的の以前の分は解放）"""
+    cache = get_shared_cache()
+    previous = st.session_state.cache_refs.get(purpose)
+    if previous is not None and previous != cache_key:
+        cache.release(previous, st.session_state.session_id)
+    if cache_key is not None:
+        cache.acquire(cache_key, st.session_state.session_id)
+    st.session_state.cache_refs[purpose] = cache_key
+
+def input_frame(df):
+    """読み込んだままの DataFrame（共有キャッシュに無ければ df の読み込み時からある列）"""
+    if st.session_state.input_key is not None:
+        cached_df = get_shared_cache().get(st.session_state.input_key, st.session_state.session_id)
+        if cached_df is not None:
+            return cached_df
+    return df[[c for c in st.session_state.input_columns if c in df.columns]]
+
+def output_cache_ref(kind, *parts):
+    """入力ファイルの内容と処理履歴から決まる出力の (キャッシュ, キー, セッション)（入力が不明なら None）"""
+    if st.session_state.input_key is None:
+        return None
+    cache_key = content_key(kind, st.session_state.input_key, st.session_state.lineage, *parts)
+    return get_shared_cache(), cache_key, st.session_state.session_id
+
+# テンプレートの照合（ファイル全体を読み込む前にヘッダー行だけで確認）
+TEMPLATE_PLACEHOLDER = "── 選択してください ──"
+TEMPLATE_MATCH_ROWS = 10
+
+def template_index():
+    """保存済みテンプレートの列の転置インデックス（追加・変更・削除のあった分だけ更新）"""
+    if 'template_index' not in st.session_state:
+        from template_match import TemplateIndex  # テンプレート適用モードのときだけ読み込む
+        st.session_state.template_index = TemplateIndex()
+    return st.session_state.template_index.sync(st.session_state.templates)
+
+def header_columns(uploaded_file, header_row):
+    """アップロードされたファイルのヘッダー行（同じファイル・ヘッダー行なら前回の結果を再利用）"""
+    key = (uploaded_file.name, uploaded_file.size, header_row)
+    cached_header = st.session_state.get('header_columns')
+    if cached_header is None or cached_header[0] != key:
+        cached_header = (key, read_header(uploaded_file, uploaded_file.name, header_row))
+        st.session_state.header_columns = cached_header
+    return cached_header[1]
+
+def render_template_selector(uploaded_file, header_row):
+    """ヘッダー行とテンプレートの一致度を表示して選択欄を出し、(選択したテンプレート名, 読み込んでよいか) を返す"""
     try:
-        # 結合処理
-        for merge_op in template_config.get('merge_operations', []):
-            if all(col in df.columns for col in merge_op['columns']):
-                new_col = merge_op['new_column']
-                separator = merge_op.get('separator', '')
-                if separator:
-                    df[new_col] = df[merge_op['columns']].apply(
-                        lambda row: separator.join([str(val) for val in row if str(val).strip()]), axis=1
-                    )
-                else:
-                    df[new_col] = df[merge_op['columns']].apply(
-                        lambda row: ''.join([str(val) for val in row if str(val).strip()]), axis=1
-                    )
+        header = header_columns(uploaded_file, header_row)
+    except Exception:
+        # ヘッダーが読めないファイルは照合せず、読み込み時のエラー表示に任せる
+        header = None
+    
+    template_names = list(st.session_state.templates.keys())
+    if header is not None:
+        index = template_index()
+        matches = index.match(header, limit=TEMPLATE_MATCH_ROWS)
+        best = matches[0] if matches and matches[0]['matched'] else None
         
-        # 分割処理
-        for split_op in template_config.get('split_operations', []):
-            if split_op['column'] in df.columns:
-                split_data = df[split_op['column']].str.split(split_op['delimiter'], expand=True)
-                for i, new_col in enumerate(split_op['new_columns']):
-                    if i < split_data.shape[1]:
-                        df[new_col] = split_data[i].fillna('')
+        # 一致度の高い順に並べ、ファイルが変わったら最も一致するテンプレートを既定の選択にする
+        template_names = [m['name'] for m in matches]
+        selected = st.session_state.get('template_selector')
+        if (st.session_state.get('template_matched_header') != header
+                or selected not in [TEMPLATE_PLACEHOLDER] + template_names):
+            st.session_state.template_selector = best['name'] if best is not None else TEMPLATE_PLACEHOLDER
+            st.session_state.template_matched_header = header
         
-        # 空列追加
-        for empty_col in template_config.get('empty_columns', []):
-            if empty_col not in df.columns:
-                df[empty_col] = ''
+        rows = [{
+            "": "⭐" if best is not None and m['name'] == best['name'] else "",
+            "テンプレート": m['name'],
+            "一致": m['matched'],
+            "不足": len(m['missing']),
+            "余分": len(m['extra']),
+            "一致度": f"{m['score']:.0%}",
+        } for m in matches[:TEMPLATE_MATCH_ROWS]]
+        with st.expander(f"🔎 ヘッダー行との照合（{len(header)} 列）", expanded=best is None):
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    
+    selected_template = st.selectbox(
+        "適用するテンプレートを選択",
+        options=[TEMPLATE_PLACEHOLDER] + template_names,
+        key="template_selector"
+    )
+    if header is None or selected_template == TEMPLATE_PLACEHOLDER:
+        return selected_template, True
+    
+    match = index.compare(selected_template, header)
+    if match['matched'] == 0:
+        st.error("❌ このファイルのヘッダーにテンプレートの列が1つもありません。"
+                 "ファイル・ヘッダー行番号・テンプレートを確認してください")
+        return selected_template, st.checkbox("それでも読み込む", key="force_load")
+    if match['missing_required']:
+        st.warning("⚠️ テンプレートで使う列がファイルにありません（空の列になるか、操作が適用されません）\n\n"
+                   + "\n".join(f"- {col}" for col in match['missing_required']))
+    return selected_template, True
+
+# 複数シートのExcel（シートの中身は読まずにシート名だけを一覧にする）
+def workbook_sheets(uploaded_file):
+    """アップロードされたブックのシート一覧（ファイルが変わるまでセッションに保持。読めなければ空）"""
+    key = (uploaded_file.name, uploaded_file.size)
+    cached_sheets = st.session_state.get('workbook_sheets')
+    if cached_sheets is None or cached_sheets[0] != key:
+        from workbook import list_sheets  # Excel のブックを選んだときだけ読み込む
+        try:
+            sheets = list_sheets(uploaded_file, uploaded_file.name)
+        except Exception:
+            sheets = []  # 一覧を読めないブックは従来どおり先頭のシートを読む
+        cached_sheets = (key, sheets)
+        st.session_state.workbook_sheets = cached_sheets
+    return cached_sheets[1]
+
+def render_sheet_selector(uploaded_file, template_info):
+    """読み込むシートをパターンで選び、(シート名のリスト, シート名の列) を返す
+
+    シートが1つのブック・Excel 以外・パターンが空のときは (None, None)（先頭のシートだけを読む）。
+    テンプレートを選ぶと、テンプレートに保存されたパターンを入力欄に入れる。
+    """
+    import workbook  # ファイルを選んだときだけ読み込む
+    if not workbook.is_workbook(uploaded_file.name):
+        return None, None
+    sheets = workbook_sheets(uploaded_file)
+    if len(sheets) <= 1:
+        return None, None
+    
+    template_pattern = template_info['config'].get('sheet_pattern') if template_info else None
+    if template_pattern and st.session_state.get('sheet_pattern_template') != template_pattern:
+        st.session_state.sheet_pattern = template_pattern
+    st.session_state.sheet_pattern_template = template_pattern
+    
+    st.markdown('<div class="section-header">📑 シートの選択</div>', unsafe_allow_html=True)
+    pattern = st.text_input(
+        "読み込むシート",
+        key="sheet_pattern",
+        placeholder="例: *支店, !集計（空欄なら先頭のシートだけ）",
+        help="カンマ区切りのワイルドカード（* ?）。! で始まるシートは除外します。"
+             "非表示のシートは名前をそのまま書いたときだけ読み込みます"
+    )
+    selected = workbook.select_sheets(sheets, pattern)
+    st.caption(f"{len(sheets)} シート中 {len(selected)} シートを読み込みます"
+               + (f": {', '.join(selected[:10])}{' ...' if len(selected) > 10 else ''}" if selected else ""))
+    with st.expander("シート一覧", expanded=False):
+        selected_names = set(selected)
+        st.dataframe(pd.DataFrame([{
+            "シート": sheet['name'],
+            "行数（目安）": sheet['rows'],
+            "非表示": "✓" if sheet['hidden'] else "",
+            "読み込む": "✓" if sheet['name'] in selected_names else "",
+        } for sheet in sheets]), hide_index=True, use_container_width=True)
+    if not pattern.strip():
+        return None, None
+    if not selected:
+        st.warning("⚠️ パターンに一致するシートがありません")
+        return [], None
+    
+    sheet_column = None
+    if len(selected) > 1:
+        add_column = st.checkbox(
+            f"「{workbook.SHEET_COLUMN}」列を追加",
+            value=True,
+            key="add_sheet_column",
+            help="つなげた行が元のどのシートかを表す列。出力の「ファイル分割」でこの列を選ぶとシートごとのファイルになります"
+        )
+        sheet_column = workbook.SHEET_COLUMN if add_column else None
+    return selected, sheet_column
+
+# 入力チェック（ダウンロード前に出力をルールで確認し、違反した行を別ファイルにする）
+INVALID_PREVIEW_ROWS = 100
+
+def render_rule_editor(final_columns):
+    """ルールの追加・削除"""
+    from validation import RULE_TYPES, check_rule, describe_rule  # 出力を選んだときだけ読み込む
+    rules = st.session_state.validation_rules
+    col1, col2, col3 = st.columns([2, 2, 3])
+    with col1:
+        column = st.selectbox("列", final_columns, key="rule_column")
+    with col2:
+        kind = st.selectbox("ルール", list(RULE_TYPES), format_func=RULE_TYPES.get, key="rule_type")
+    rule = {'column': column, 'type': kind}
+    with col3:
+        if kind == 'required':
+            st.caption("空欄の行を違反にします（ほかのルールは空欄を違反にしません）")
+        elif kind == 'regex':
+            rule['pattern'] = st.text_input("正規表現（値全体が一致すること）", key="rule_pattern",
+                                            placeholder=r"例: [A-Z]{3}-\d{4}")
+        elif kind in ('length', 'range'):
+            low_col, high_col = st.columns(2)
+            # 文字数は0以上の整数、数値の範囲は小数も可
+            number_options = {'min_value': 0, 'step': 1} if kind == 'length' else {}
+            with low_col:
+                rule['min'] = st.number_input("最小", value=None, key=f"rule_min_{kind}", **number_options)
+            with high_col:
+                rule['max'] = st.number_input("最大", value=None, key=f"rule_max_{kind}", **number_options)
+        elif kind == 'allowed':
+            values = st.text_input("許可する値（カンマ区切り）", key="rule_values")
+            rule['values'] = [value.strip() for value in values.split(',') if value.strip()]
+    if st.button("➕ ルールを追加", key="add_rule"):
+        try:
+            check_rule(rule)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        else:
+            rules.append(rule)
+            st.rerun()
+    
+    for i, rule in enumerate(rules):
+        rule_col, delete_col = st.columns([6, 1])
+        rule_col.markdown(f"- {describe_rule(rule)}")
+        if delete_col.button("🗑️", key=f"delete_rule_{i}", help="ルールを削除"):
+            rules.pop(i)
+            st.rerun()
+
+def render_validation(df, final_df, final_columns, output_options, original_name):
+    """入力チェックのルールの編集と、出力に対する結果（ルールごとの違反件数・違反した行のダウンロード）"""
+    from validation import validate_frame  # 出力を選んだときだけ読み込む
+    rules = st.session_state.validation_rules
+    with st.expander(f"✅ 入力チェック（{len(rules)} ルール）", expanded=bool(rules)):
+        render_rule_editor(final_columns)
+        if not rules:
+            st.caption("ルールはテンプレートに保存され、テンプレートの適用・batch.py・ジョブAPI でも確認します")
+            return
         
-        # 列順序と選択を適用
-        available_columns = [col for col in template_config.get('column_order', []) if col in df.columns]
-        selected_columns = set(col for col in template_config.get('selected_columns', []) if col in df.columns)
+        # 出力とルールが同じなら前回の結果を使う（列ごとのベクトル演算で1回だけ評価）
+        signature = (st.session_state.df_version, tuple(final_columns),
+                     json.dumps(rules, ensure_ascii=False, sort_keys=True))
+        cached_result = st.session_state.get('validation_result')
+        if cached_result is None or cached_result[0] != signature:
+            summary, errors = validate_frame(final_df, rules)
+            cached_result = (signature, summary, errors)
+            st.session_state.validation_result = cached_result
+        _, summary, errors = cached_result
         
-        return df, available_columns, selected_columns
-    except Exception as e:
-        st.error(f"テンプレート適用エラー: {str(e)}")
-        return df, [], set()
+        for column in summary['missing_columns']:
+            st.warning(f"⚠️ 出力に列がありません: {column}")
+        if not summary['invalid_rows']:
+            st.success(f"✅ {summary['rows']:,} 行すべてルールを満たしています")
+            return
+        st.warning(f"⚠️ {summary['rows']:,} 行中 {summary['invalid_rows']:,} 行がルールに違反しています")
+        st.dataframe(pd.DataFrame([{
+            "ルール": rule['rule'],
+            "違反": rule['count'],
+            "値の例": ", ".join(rule['samples']),
+        } for rule in summary['rules']]), hide_index=True, use_container_width=True)
+        st.dataframe(errors.head(INVALID_PREVIEW_ROWS), hide_index=True, use_container_width=True)
+        with spooled_csv(errors, **output_options) as csv_file:
+            st.download_button(
+                label=f"📥 違反した行をダウンロード（{len(errors):,} 行）",
+                data=csv_file.read(),
+                file_name=f"{original_name}_errors.csv",
+                mime="text/csv",
+                key="download_invalid"
+            )
+
+# 列の選択・並べ替え（列数が多くても1ページ分のウィジェットだけを表示）
+COLUMN_PAGE_SIZE = 40
+ORDER_PAGE_SIZE = 20
+
+def toggle_column(column_name, key):
+    """チェックボックスの変更を選択列に反映"""
+    if st.session_state[key]:
+        st.session_state.selected_columns.add(column_name)
+    else:
+        st.session_state.selected_columns.discard(column_name)
+
+def page_slice(items, key, page_size, reset_on=None):
+    """items のうち表示するページ分と先頭の位置を返す（複数ページならページ番号の入力欄を表示）
+
+    reset_on が前回と変わったら1ページ目に戻す（絞り込み条件の変更時など）。
+    """
+    pages = max(1, (len(items) + page_size - 1) // page_size)
+    previous = st.session_state.get(f"{key}_reset_on")
+    if key not in st.session_state or st.session_state[key] > pages or previous != reset_on:
+        st.session_state[key] = 1
+    st.session_state[f"{key}_reset_on"] = reset_on
+    if pages > 1:
+        page = st.number_input(f"ページ（全 {pages} ページ・{len(items):,} 列）",
+                               min_value=1, max_value=pages, step=1, key=key)
+    else:
+        page = 1
+    start = (page - 1) * page_size
+    return items[start:start + page_size], start
+
+# バックグラウンドジョブ
+JOB_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_job_manager():
+    """プロセス全体で共有するジョブ管理（再実行をまたいで結果が残る）"""
+    return JobManager()
+
+def current_job(purpose, signature=None):
+    """目的ごとに保持しているジョブ（signature が異なれば None）"""
+    entry = st.session_state.jobs.get(purpose)
+    if entry is None or (signature is not None and entry['signature'] != signature):
+        return None
+    return get_job_manager().get(entry['id'])
+
+def release_job(purpose):
+    """目的ごとのジョブを取り消して破棄"""
+    entry = st.session_state.jobs.pop(purpose, None)
+    if entry is not None:
+        get_job_manager().discard(entry['id'])
+
+def submit_job(purpose, signature, func, *args, label='', unit='行', **kwargs):
+    """ジョブを投入（同じ目的の古いジョブは取り消して破棄）"""
+    release_job(purpose)
+    recorder = None
+    if st.session_state.get('show_performance'):
+        recorder = Recorder(label)
+        st.session_state.perf_runs = (st.session_state.perf_runs + [recorder])[-PERF_HISTORY:]
+    job = get_job_manager().submit(func, *args, label=label, unit=unit, recorder=recorder, **kwargs)
+    st.session_state.jobs[purpose] = {'id': job.id, 'signature': signature}
+    return job
+
+def ensure_job(purpose, signature, func, *args, **kwargs):
+    """同じ signature のジョブがあれば再利用し、無ければ投入"""
+    job = current_job(purpose, signature)
+    if job is None:
+        job = submit_job(purpose, signature, func, *args, **kwargs)
+    return job
+
+def _job_progress(job):
+    """実行中のジョブの進捗と取り消しボタン（終了したら画面全体を再実行）"""
+    if job.finished:
+        st.rerun()
+    if job.cancelled:
+        st.info(f"⏹ {job.label}を取り消しています...")
+        return
+    if job.total:
+        text = f"⏳ {job.label}: {job.done:,} / {job.total:,} {job.unit}（{job.elapsed:.0f} 秒）"
+    else:
+        text = f"⏳ {job.label}: {STATUS_LABELS[job.status]}（{job.elapsed:.0f} 秒）"
+    st.progress(job.progress or 0.0, text=text)
+    if st.button("⏹ 取り消し", key=f"cancel_{job.id}"):
+        job.cancel()
+        st.rerun()
+    if not hasattr(st, 'fragment'):
+        st.button("🔄 状態を更新", key=f"refresh_{job.id}")
+
+# 対応していればジョブの進捗だけを定期的に再描画
+job_progress = st.fragment(run_every=JOB_POLL_SECONDS)(_job_progress) if hasattr(st, 'fragment') else _job_progress
+
+def show_job(job, purpose):
+    """ジョブの状態を表示し、完了していれば True を返す"""
+    if job.status == 'done':
+        return True
+    if job.finished:
+        if job.status == 'failed':
+            st.error(f"❌ {job.label}でエラーが発生しました: {job.error}")
+        else:
+            st.warning(f"⚠️ {job.label}を取り消しました")
+        if st.button("🔁 再実行", key=f"retry_{job.id}"):
+            release_job(purpose)
+            st.rerun()
+        return False
+    job_progress(job)
+    return False
+
+# パフォーマンス表示
+PERF_HISTORY = 10
+
+def render_performance_panel():
+    """直近の実行の工程別の時間とメモリをサイドバーに表示"""
+    st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
+    st.markdown('<h3 style="margin-top: 0;">⏱ パフォーマンス</h3>', unsafe_allow_html=True)
+    
+    cache = get_shared_cache().summary()
+    st.caption(
+        f"共有キャッシュ: {cache['entries']} 件 / メモリ {cache['memory_mb']:,.0f} MB・ディスク {cache['disk_mb']:,.0f} MB"
+        f"（ヒット {cache['hits']:,} 回・ディスクから {cache['disk_hits']:,} 回）"
+    )
+    
+    runs = [run for run in st.session_state.perf_runs if run.events]
+    if not runs:
+        st.caption("まだ計測された処理はありません")
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+    
+    run_index = st.selectbox(
+        "実行",
+        options=list(range(len(runs) - 1, -1, -1)),
+        format_func=lambda i: f"{runs[i].started_at:%H:%M:%S} ({len(runs[i].events)} 工程)",
+        key="perf_run"
+    )
+    run = runs[run_index]
+    summary = pd.DataFrame(run.summary()).round(3)
+    summary = summary.rename(columns={
+        'stage': '工程', 'calls': '回数', 'seconds': '時間(秒)', 'self_seconds': '内部時間(秒)',
+        'rss_delta_mb': 'メモリ増減(MB)', 'max_rss_mb': 'メモリ(MB)', 'rows': '行数'
+    })
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    
+    rss = current_rss_mb()
+    peak = peak_rss_mb()
+    if rss is not None:
+        st.caption(f"現在のメモリ: {rss:,.0f} MB" + (f" / ピーク: {peak:,.0f} MB" if peak is not None else ""))
+    
+    st.download_button(
+        "📤 ログ出力 (JSON Lines)",
+        data=''.join(r.to_jsonl() for r in runs),
+        file_name=f"performance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+        mime="application/json",
+        key="perf_export",
+        use_container_width=True
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # メインアプリケーション
 def main():
     # セッション状態初期化
     init_session_state()
+    # 保存済みテンプレート（他のセッション・ジョブAPIで保存した分も反映）
+    st.session_state.templates = get_template_store().load_all()
+    if API_PORT:
+        start_job_api(int(API_PORT))
     
     # メインタイトル
     st.markdown('<h1 class="main-title">📊 CSV Organizer Pro</h1>', unsafe_allow_html=True)
@@ -261,10 +703,21 @@ def main():
             index=0 if st.session_state.mode == "manual" else 1,
             help="手動設定: 一から設定を行う\nテンプレート適用: 保存済み設定を使用"
         )
+        show_performance = st.checkbox(
+            "⏱ パフォーマンスを計測",
+            value=False,
+            help="処理工程ごとの時間とメモリ使用量をサイドバーに表示します",
+            key="show_performance"
+        )
         st.markdown('</div>', unsafe_allow_html=True)
         
         st.session_state.mode = "manual" if mode == "🔧 手動設定" else "template"
     
+    # 計測（操作後の st.rerun() で中断された実行の記録も残すため直近の実行を保持）
+    recorder = set_recorder(Recorder('rerun') if show_performance else None)
+    if recorder is not None:
+        st.session_state.perf_runs = (st.session_state.perf_runs + [recorder])[-PERF_HISTORY:]
+    
     # ファイルアップロードセクション
     st.markdown('<div class="section-header">📁 ファイルアップロード</div>', unsafe_allow_html=True)
     
@@ -272,8 +725,8 @@ def main():
     with col1:
         uploaded_file = st.file_uploader(
             "CSVまたはExcelファイルを選択してください", 
-            type=["csv", "xlsx", "xls"],
-            help="対応形式: CSV, Excel (.xlsx, .xls)"
+            type=["csv", "xlsx", "xls"] + UPLOAD_TYPES,
+            help="対応形式: CSV, Excel (.xlsx, .xls), 圧縮ファイル (.gz, .zst, .bz2, .xz, .zip)"
         )
     with col2:
         if uploaded_file:
@@ -288,11 +741,13 @@ def main():
         # 新しいファイルがアップロードされた場合、状態をリセット
         if st.session_state.uploaded_file_name != uploaded_file.name:
             st.session_state.uploaded_file_name = uploaded_file.name
-            st.session_state.df = None
+            set_df(None)
             if st.session_state.mode == "manual":
                 st.session_state.selected_columns = set()
-                st.session_state.column_order = []
+                st.session_state.column_order = ColumnOrder()
                 st.session_state.original_columns = []
+                st.session_state.operations = new_operations()
+                st.session_state.validation_rules = []
         
         # 読み込み設定
         with st.expander("⚙️ 詳細設定", expanded=False):
@@ -303,85 +758,123 @@ def main():
                 value=0,
                 help="データのヘッダー行が何行目にあるかを指定"
             )
+            csv_engine = st.selectbox(
+                "CSV読み込みエンジン",
+                list(ENGINES),
+                index=list(ENGINES).index(DEFAULT_ENGINE),
+                format_func=ENGINES.get,
+                key="csv_engine",
+                help="pyarrow は大きなCSVを複数スレッドで高速に読み込みます（読めない場合は pandas で読み直します）"
+            )
+        
+        # テンプレートモードの場合は、読み込む前にヘッダー行だけでテンプレートを照合して選択
+        template_info = None
+        if st.session_state.mode == "template" and st.session_state.templates:
+            st.markdown('<div class="section-header">⚡ テンプレート適用</div>', unsafe_allow_html=True)
+            selected_template, can_load = render_template_selector(uploaded_file, header_row)
+            if not can_load:
+                return
+            template_info = st.session_state.templates.get(selected_template)
+        
+        # 複数シートのExcelは読み込むシートを選ぶ
+        sheets, sheet_column = render_sheet_selector(uploaded_file, template_info)
+        if sheets == []:
+            return
         
-        # ファイル読み込み
+        # ファイル読み込み（同じファイル・設定なら前回の結果を再利用）
+        load_key = (uploaded_file.name, uploaded_file.size, header_row, csv_engine, tuple(sheets or ()), sheet_column)
         try:
-            with st.spinner('📊 データを読み込んでいます...'):
-                file_content = uploaded_file.getvalue()
-                
-                if uploaded_file.name.lower().endswith('.csv'):
-                    # CSV読み込み（エンコーディング自動判定）
-                    try:
-                        df = pd.read_csv(io.BytesIO(file_content), header=header_row, encoding='utf-8')
-                    except UnicodeDecodeError:
-                        try:
-                            df = pd.read_csv(io.BytesIO(file_content), header=header_row, encoding='cp932')
-                        except UnicodeDecodeError:
-                            df = pd.read_csv(io.BytesIO(file_content), header=header_row, encoding='shift-jis')
-                else:
-                    # Excel読み込み
-                    df = pd.read_excel(io.BytesIO(file_content), header=header_row)
-                
-                # 列名の重複を処理
-                if df.columns.duplicated().any():
-                    cols = pd.Series(df.columns)
-                    for dup in cols[cols.duplicated()].unique():
-                        cols[cols[cols == dup].index.values.tolist()] = [dup + f'_{i}' if i != 0 else dup for i in range(sum(cols == dup))]
-                    df.columns = cols.tolist()
+            if st.session_state.loaded_key == load_key and st.session_state.df is not None:
+                df = st.session_state.df
+            else:
+                # テンプレートを選択済みなら、保存されたスキーマで型を指定して読み込む
+                template_schema = template_info['config'].get('schema') if template_info else None
                 
-                # データ型の最適化
-                df = df.fillna('')
+                # バックグラウンドで読み込み（完了までは進捗のみ表示）
+                job = ensure_job('load', load_key, load_job, uploaded_file, header_row, csv_engine, template_schema,
+                                 get_shared_cache(), st.session_state.session_id, label='データ読み込み', unit='KB',
+                                 sheets=sheets, sheet_column=sheet_column)
+                if not show_job(job, 'load'):
+                    return
+                st.session_state.input_key, df, load_stats = job.result
+                st.session_state.lineage = []
+                release_job('load')
                 
-                # 成功メッセージ
-                st.success(f"✅ ファイル読み込み完了！ {len(df):,} 行 × {len(df.columns)} 列")
+                # 成功メッセージ（読み込み中のピークメモリはサーバーの容量見積もり用）
+                if load_stats.get('peak_delta_mb') is not None:
+                    memory_text = f"（読み込み中のピークメモリ +{load_stats['peak_delta_mb']:,.0f} MB）"
+                elif not load_stats:
+                    memory_text = "（共有キャッシュから）"
+                else:
+                    memory_text = ""
+                st.success(f"✅ ファイル読み込み完了！ {len(df):,} 行 × {len(df.columns)} 列{memory_text}")
+                if load_stats.get('sheets'):
+                    with st.expander(f"⏱ シートごとの読み込み時間（{len(load_stats['sheets'])} シート）", expanded=False):
+                        st.dataframe(pd.DataFrame([{
+                            "シート": timing['sheet'],
+                            "行数": timing['rows'],
+                            "読み込み(秒)": round(timing['read_seconds'], 2),
+                            "プロセス": timing['pid'],
+                        } for timing in load_stats['sheets']]), hide_index=True, use_container_width=True)
+                set_df(df)
+                st.session_state.loaded_key = load_key
+                st.session_state.input_columns = list(df.columns)
+            
+            # 読み込み結果を共有キャッシュ上で参照中にしておく（他のセッションと共有）
+            hold_cached('input', st.session_state.input_key)
             
             # テンプレートモードの場合
-            if st.session_state.mode == "template" and st.session_state.templates:
-                st.markdown('<div class="section-header">⚡ テンプレート適用</div>', unsafe_allow_html=True)
+            if template_info is not None:
+                # テンプレート情報表示
+                st.markdown(f'''
+                <div class="card-container">
+                    <h4>📋 {selected_template}</h4>
+                    <p><strong>説明:</strong> {template_info['description'] or 'なし'}</p>
+                    <p><small><strong>作成日時:</strong> {template_info['created_at']}</small></p>
+                    <p><small><strong>選択列数:</strong> {len(template_info['config']['selected_columns'])}</small></p>
+                    {f'<p><small><strong>行数設定:</strong> {template_info["config"].get("max_rows_per_file", "なし")}行/ファイル</small></p>' if template_info["config"].get("max_rows_per_file") else ''}
+                </div>
+                ''', unsafe_allow_html=True)
                 
-                template_names = list(st.session_state.templates.keys())
-                selected_template = st.selectbox(
-                    "適用するテンプレートを選択",
-                    options=["── 選択してください ──"] + template_names,
-                    key="template_selector"
-                )
+                # 保存時のスキーマと読み込んだファイルの差異（先頭の数行で確認）
+                template_schema = template_info['config'].get('schema')
+                if template_schema:
+                    schema_issues = check_drift(template_schema, input_frame(df).head(DRIFT_SAMPLE_ROWS))
+                    if schema_issues:
+                        st.warning("⚠️ テンプレート保存時のファイルと列・型が異なります\n\n"
+                                   + "\n".join(f"- {describe_issue(issue)}" for issue in schema_issues))
                 
-                if selected_template != "── 選択してください ──":
-                    template_info = st.session_state.templates[selected_template]
+                template_signature = (selected_template, st.session_state.df_version)
+                col1, col2 = st.columns([1, 3])
+                with col1:
+                    if st.button("⚡ テンプレート適用", type="primary", use_container_width=True):
+                        submit_job('template', template_signature, apply_template, template_info['config'], df,
+                                   label='テンプレート適用')
+                
+                template_job = current_job('template', template_signature)
+                if template_job is not None and show_job(template_job, 'template'):
+                    df, column_order, selected_columns = template_job.result
+                    release_job('template')
+                    st.session_state.lineage.append(['template', template_info['config']])
+                    set_df(df)
+                    st.session_state.column_order = ColumnOrder(column_order)
+                    st.session_state.selected_columns = selected_columns
                     
-                    # テンプレート情報表示
-                    st.markdown(f'''
-                    <div class="card-container">
-                        <h4>📋 {selected_template}</h4>
-                        <p><strong>説明:</strong> {template_info['description'] or 'なし'}</p>
-                        <p><small><strong>作成日時:</strong> {template_info['created_at']}</small></p>
-                        <p><small><strong>選択列数:</strong> {len(template_info['config']['selected_columns'])}</small></p>
-                        {f'<p><small><strong>行数設定:</strong> {template_info["config"].get("max_rows_per_file", "なし")}行/ファイル</small></p>' if template_info["config"].get("max_rows_per_file") else ''}
-                    </div>
-                    ''', unsafe_allow_html=True)
+                    # 入力チェックのルールと行数設定も適用
+                    st.session_state.validation_rules = list(template_info['config'].get('validation_rules') or [])
+                    if template_info['config'].get('max_rows_per_file'):
+                        st.session_state.saved_max_rows = template_info['config']['max_rows_per_file']
                     
-                    col1, col2 = st.columns([1, 3])
-                    with col1:
-                        if st.button("⚡ テンプレート適用", type="primary", use_container_width=True):
-                            with st.spinner('🔄 テンプレートを適用しています...'):
-                                df, column_order, selected_columns = apply_template(template_info['config'], df)
-                                st.session_state.df = df
-                                st.session_state.column_order = column_order
-                                st.session_state.selected_columns = selected_columns
-                                
-                                # 行数設定も適用
-                                if template_info['config'].get('max_rows_per_file'):
-                                    st.session_state.saved_max_rows = template_info['config']['max_rows_per_file']
-                                
-                                st.success("✅ テンプレートを適用しました")
-                                st.rerun()
+                    st.success("✅ テンプレートを適用しました")
+                    st.rerun()
             
             # 手動モードまたは初回読み込み時の設定
             if st.session_state.mode == "manual" or not st.session_state.original_columns:
-                st.session_state.df = df
+                if st.session_state.df is not df:
+                    set_df(df)
                 if not st.session_state.original_columns:
                     st.session_state.original_columns = list(df.columns)
-                    st.session_state.column_order = list(df.columns)
+                    st.session_state.column_order = ColumnOrder(df.columns)
         
         except Exception as e:
             st.error(f"❌ ファイル読み込みエラー: {str(e)}")
@@ -431,7 +924,7 @@ def main():
             st.markdown('<div class="section-header">🔧 データ操作</div>', unsafe_allow_html=True)
             
             # 操作タブ
-            tab_col1, tab_col2, tab_col3 = st.columns(3)
+            tab_col1, tab_col2, tab_col3, tab_col4, tab_col5, tab_col6 = st.columns(6)
             
             with tab_col1:
                 if st.button("🔗 列結合", use_container_width=True):
@@ -442,6 +935,15 @@ def main():
             with tab_col3:
                 if st.button("➕ 空列追加", use_container_width=True):
                     st.session_state.current_operation = "empty"
+            with tab_col4:
+                if st.button("🧹 重複削除", use_container_width=True):
+                    st.session_state.current_operation = "dedupe"
+            with tab_col5:
+                if st.button("📈 集計", use_container_width=True):
+                    st.session_state.current_operation = "aggregate"
+            with tab_col6:
+                if st.button("🧮 計算列", use_container_width=True):
+                    st.session_state.current_operation = "expression"
             
             # 現在の操作を表示
             current_op = st.session_state.current_operation
@@ -450,13 +952,13 @@ def main():
                 st.markdown('<div class="operation-tab">', unsafe_allow_html=True)
                 st.markdown("#### 🔗 列結合")
                 
-                merge_columns = st.multiselect(
+                merge_column_names = st.multiselect(
                     "結合する列を選択", 
                     options=list(df.columns),
                     help="複数の列を1つにまとめます"
                 )
                 
-                if merge_columns:
+                if merge_column_names:
                     col1, col2 = st.columns(2)
                     with col1:
                         new_column_name = st.text_input("結合後の列名", value="結合列", key="merge_name")
@@ -466,18 +968,16 @@ def main():
                     if st.button("🔗 結合実行", type="primary", key="merge_execute"):
                         if new_column_name and new_column_name not in df.columns:
                             # 列結合実行
-                            if separator:
-                                df[new_column_name] = df[merge_columns].apply(
-                                    lambda row: separator.join([str(val) for val in row if str(val).strip()]), axis=1
-                                )
-                            else:
-                                df[new_column_name] = df[merge_columns].apply(
-                                    lambda row: ''.join([str(val) for val in row if str(val).strip()]), axis=1
-                                )
+                            df[new_column_name] = merge_columns(df, merge_column_names, separator)
                             
-                            st.session_state.df = df
+                            set_df(df)
                             st.session_state.column_order.append(new_column_name)
                             st.session_state.selected_columns.add(new_column_name)
+                            record_operation('merge_operations', {
+                                'columns': merge_column_names,
+                                'new_column': new_column_name,
+                                'separator': separator
+                            })
                             
                             st.success(f"✅ 列 '{new_column_name}' を作成しました")
                             st.rerun()
@@ -511,7 +1011,8 @@ def main():
                         if delimiter and new_column_names:
                             names = [name.strip() for name in new_column_names.split(',') if name.strip()]
                             if names:
-                                split_data = df[split_column].str.split(delimiter, expand=True)
+                                with stage('split', rows=len(df)):
+                                    split_data = df[split_column].str.split(delimiter, expand=True)
                                 
                                 added_columns = []
                                 for i, name in enumerate(names):
@@ -522,7 +1023,12 @@ def main():
                                         added_columns.append(name)
                                 
                                 if added_columns:
-                                    st.session_state.df = df
+                                    set_df(df)
+                                    record_operation('split_operations', {
+                                        'column': split_column,
+                                        'delimiter': delimiter,
+                                        'new_columns': names
+                                    })
                                     st.success(f"✅ 列 '{split_column}' を {len(added_columns)} 個の列に分割しました")
                                     st.rerun()
                                 else:
@@ -556,12 +1062,139 @@ def main():
                                     added_names.append(name)
                             
                             if added_count > 0:
-                                st.session_state.df = df
+                                set_df(df)
+                                record_operation('empty_columns', added_names)
                                 st.success(f"✅ {added_count} 個の空列を追加しました")
                                 st.rerun()
                             else:
                                 st.warning("⚠️ 追加できる新しい列がありませんでした")
                 st.markdown('</div>', unsafe_allow_html=True)
+    
+            elif current_op == "dedupe":
+                st.markdown('<div class="operation-tab">', unsafe_allow_html=True)
+                st.markdown("#### 🧹 重複削除")
+                
+                dedupe_columns = st.multiselect(
+                    "重複判定に使う列を選択",
+                    options=list(df.columns),
+                    help="未選択の場合は全列が一致する行を重複とみなします",
+                    key="dedupe_cols"
+                )
+                
+                if st.button("🧹 重複削除実行", type="primary", key="dedupe_execute"):
+                    try:
+                        with stage('dedupe', rows=len(df)):
+                            df, stats = dedupe_dataframe(df, dedupe_columns or None)
+                        set_df(df)
+                        record_operation('dedupe_operations', {'columns': dedupe_columns})
+                        st.session_state.dedupe_message = (
+                            f"✅ {stats['rows_removed']:,} 行の重複を削除しました"
+                            f"（{stats['rows_in']:,} 行 → {stats['rows_out']:,} 行、"
+                            f"{stats['rows_per_sec']:,.0f} 行/秒）"
+                        )
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ 重複削除でエラーが発生しました: {str(e)}")
+                
+                if st.session_state.get('dedupe_message'):
+                    st.success(st.session_state.pop('dedupe_message'))
+                st.markdown('</div>', unsafe_allow_html=True)
+    
+            elif current_op == "aggregate":
+                st.markdown('<div class="operation-tab">', unsafe_allow_html=True)
+                st.markdown("#### 📈 集計")
+                
+                group_columns = st.multiselect(
+                    "グループ化する列を選択",
+                    options=list(df.columns),
+                    help="例: 店舗コードごとに集計",
+                    key="aggregate_group"
+                )
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    value_columns = st.multiselect(
+                        "集計する列を選択",
+                        options=[col for col in df.columns if col not in group_columns],
+                        key="aggregate_values"
+                    )
+                with col2:
+                    agg_funcs = st.multiselect(
+                        "集計方法",
+                        options=list(AGG_FUNCS.keys()),
+                        default=['sum'],
+                        format_func=lambda func: AGG_FUNCS[func],
+                        help="合計・最小・最大・平均は数値として集計します（数値でない値は無視）",
+                        key="aggregate_funcs"
+                    )
+                
+                if st.button("📈 集計実行", type="primary", key="aggregate_execute"):
+                    aggregations = [{'column': col, 'func': func} for col in value_columns for func in agg_funcs]
+                    try:
+                        with stage('aggregate', rows=len(df)):
+                            df = aggregate_dataframe(df, group_columns, aggregations)
+                        set_df(df)
+                        st.session_state.column_order = ColumnOrder(df.columns)
+                        st.session_state.selected_columns = set(df.columns)
+                        record_operation('aggregate_operations', {
+                            'group_by': group_columns,
+                            'aggregations': aggregations
+                        })
+                        st.session_state.aggregate_message = f"✅ {len(df):,} グループに集計しました"
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ 集計でエラーが発生しました: {str(e)}")
+                
+                if st.session_state.get('aggregate_message'):
+                    st.success(st.session_state.pop('aggregate_message'))
+                st.markdown('</div>', unsafe_allow_html=True)
+    
+            elif current_op == "expression":
+                st.markdown('<div class="operation-tab">', unsafe_allow_html=True)
+                st.markdown("#### 🧮 計算列")
+                
+                col1, col2 = st.columns([1, 2])
+                with col1:
+                    expression_name = st.text_input("新しい列名", value="計算列", key="expression_name")
+                with col2:
+                    expression_text = st.text_input(
+                        "式",
+                        placeholder="例: 単価 * 数量 / upper(商品コード) / substr(郵便番号, 0, 3)",
+                        help="列名はそのまま書けます。空白や記号を含む列名は `列 名` のように囲みます",
+                        key="expression_text"
+                    )
+                
+                with st.expander("📖 使える関数", expanded=False):
+                    st.markdown("四則演算 `+ - * / // % **`（数値として計算）、比較 `== != < <= > >=`、`and` / `or` / `not`")
+                    for func_name, (_min_args, _max_args, _impl, description) in FUNCTIONS.items():
+                        st.markdown(f"- `{func_name}()` {description}")
+                
+                if expression_text:
+                    try:
+                        preview = evaluate_expression(expression_text, df.head(5))
+                        st.caption("プレビュー（先頭5行）: " + " / ".join(str(v) for v in preview.tolist()))
+                    except Exception as e:
+                        st.warning(f"⚠️ {str(e)}")
+                
+                if st.button("🧮 計算列を追加", type="primary", key="expression_execute"):
+                    if expression_name and expression_name not in df.columns:
+                        try:
+                            with stage('expression', rows=len(df)):
+                                df[expression_name] = evaluate_expression(expression_text, df)
+                            set_df(df)
+                            st.session_state.column_order.append(expression_name)
+                            st.session_state.selected_columns.add(expression_name)
+                            record_operation('expression_columns', {
+                                'new_column': expression_name,
+                                'expression': expression_text
+                            })
+                            st.success(f"✅ 列 '{expression_name}' を作成しました")
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"❌ 計算列の作成でエラーが発生しました: {str(e)}")
+                    else:
+                        st.error("❌ 有効な列名を入力してください（重複不可）")
+                st.markdown('</div>', unsafe_allow_html=True)
         
         # 列選択セクション
         st.markdown('<div class="section-header">🎯 出力列の選択</div>', unsafe_allow_html=True)
@@ -579,11 +1212,36 @@ def main():
         with col3:
             st.markdown(f'<span class="status-badge status-info">選択中: {len(st.session_state.selected_columns)} / {len(st.session_state.column_order)} 列</span>', unsafe_allow_html=True)
         
-        # 列選択チェックボックス（改良版）
+        # 列名で絞り込み（ワイルドカードで一括選択も可能）
+        order = st.session_state.column_order
+        search = st.text_input(
+            "🔍 列名で絞り込み",
+            key="column_search",
+            placeholder="例: 売上 / 売上_* （* と ? はワイルドカード）",
+            help="列名に含まれる文字で絞り込みます（大文字・小文字は区別しません）"
+        )
+        if search:
+            matched_columns = st.session_state.column_order.search_index().search(search)
+            col1, col2, col3 = st.columns([1, 1, 2])
+            with col1:
+                if st.button("☑️ 一致した列を選択", key="select_matched", use_container_width=True):
+                    st.session_state.selected_columns.update(matched_columns)
+                    st.rerun()
+            with col2:
+                if st.button("☐ 一致した列を解除", key="deselect_matched", use_container_width=True):
+                    st.session_state.selected_columns.difference_update(matched_columns)
+                    st.rerun()
+            with col3:
+                st.caption(f"{len(matched_columns)} 列が一致")
+        else:
+            matched_columns = order.to_list()
+        
+        # 列選択チェックボックス（表示中のページ分だけ）
         st.markdown('<div class="card-container">', unsafe_allow_html=True)
+        page_columns, _ = page_slice(matched_columns, "column_page", COLUMN_PAGE_SIZE, reset_on=search)
         columns_per_row = 2
-        column_chunks = [st.session_state.column_order[i:i + columns_per_row] 
-                        for i in range(0, len(st.session_state.column_order), columns_per_row)]
+        column_chunks = [page_columns[i:i + columns_per_row] 
+                        for i in range(0, len(page_columns), columns_per_row)]
         
         for chunk in column_chunks:
             cols = st.columns(len(chunk))
@@ -602,47 +1260,53 @@ def main():
                     except:
                         sample_text = "(エラー)"
                     
-                    is_selected = st.checkbox(
+                    # 一括選択などで変わった選択状態をチェックボックスに反映してから表示
+                    checkbox_key = f"cb_{column_name}"
+                    st.session_state[checkbox_key] = column_name in st.session_state.selected_columns
+                    st.checkbox(
                         f"**{column_name}**",
-                        value=column_name in st.session_state.selected_columns,
-                        key=f"cb_{column_name}",
-                        help=f"サンプル値: {sample_text}"
+                        key=checkbox_key,
+                        help=f"サンプル値: {sample_text}",
+                        on_change=toggle_column,
+                        args=(column_name, checkbox_key)
                     )
-                    
-                    if is_selected:
-                        st.session_state.selected_columns.add(column_name)
-                    else:
-                        st.session_state.selected_columns.discard(column_name)
         st.markdown('</div>', unsafe_allow_html=True)
         
-        # 列順序調整
+        # 列順序調整（表示中のページ分だけボタンを表示、移動は連結リストの付け替え）
         if len(st.session_state.selected_columns) > 1:
             with st.expander("🔄 列順序の調整", expanded=False):
-                selected_in_order = [col for col in st.session_state.column_order 
-                                   if col in st.session_state.selected_columns]
+                selected = st.session_state.selected_columns
+                selected_in_order = [col for col in order if col in selected]
+                
+                col1, col2, col3 = st.columns([4, 1, 1])
+                with col1:
+                    move_column = st.selectbox("移動する列", selected_in_order, key="move_column")
+                with col2:
+                    st.write("")
+                    if st.button("⏫ 先頭へ", key="move_front", use_container_width=True):
+                        order.move_before(move_column, selected_in_order[0])
+                        st.rerun()
+                with col3:
+                    st.write("")
+                    if st.button("⏬ 末尾へ", key="move_back", use_container_width=True):
+                        order.move_after(move_column, selected_in_order[-1])
+                        st.rerun()
                 
                 st.markdown("**現在の列順序:**")
-                for i, col in enumerate(selected_in_order, 1):
+                page_order, offset = page_slice(selected_in_order, "order_page", ORDER_PAGE_SIZE)
+                for i, col in enumerate(page_order, offset + 1):
                     col1, col2, col3 = st.columns([6, 1, 1])
                     with col1:
                         st.write(f"{i}. **{col}**")
                     with col2:
                         if i > 1:
                             if st.button("⬆️", key=f"up_{col}", help="上に移動"):
-                                new_order = selected_in_order.copy()
-                                new_order[i-1], new_order[i-2] = new_order[i-2], new_order[i-1]
-                                unselected = [col for col in st.session_state.column_order 
-                                            if col not in st.session_state.selected_columns]
-                                st.session_state.column_order = new_order + unselected
+                                order.move_before(col, order.previous(col, selected))
                                 st.rerun()
                     with col3:
                         if i < len(selected_in_order):
                             if st.button("⬇️", key=f"down_{col}", help="下に移動"):
-                                new_order = selected_in_order.copy()
-                                new_order[i-1], new_order[i] = new_order[i], new_order[i-1]
-                                unselected = [col for col in st.session_state.column_order 
-                                            if col not in st.session_state.selected_columns]
-                                st.session_state.column_order = new_order + unselected
+                                order.move_after(col, order.following(col, selected))
                                 st.rerun()
         
         # テンプレート保存（手動モードのみ）
@@ -670,12 +1334,17 @@ def main():
                         if template_name:
                             config = {
                                 'selected_columns': list(st.session_state.selected_columns),
-                                'column_order': st.session_state.column_order,
+                                'column_order': list(st.session_state.column_order),
                                 'description': template_description,
-                                'merge_operations': [],
-                                'split_operations': [],
-                                'empty_columns': [],
-                                'max_rows_per_file': save_max_rows if save_max_rows > 0 else None
+                                **st.session_state.operations,
+                                # 操作した順（適用時はこの順に再現する。上の種類ごとの記録は照合と古い版向け）
+                                'operation_steps': recorded_steps(),
+                                'max_rows_per_file': save_max_rows if save_max_rows > 0 else None,
+                                'validation_rules': list(st.session_state.validation_rules),
+                                # 複数シートのExcelで読み込んだシート（空なら先頭のシート）
+                                'sheet_pattern': st.session_state.get('sheet_pattern') or None,
+                                # 次回の読み込みで型指定・差異の確認に使う
+                                'schema': infer_schema(input_frame(df))
                             }
                             save_template(template_name, config)
                             st.success(f"✅ テンプレート '{template_name}' を保存しました")
@@ -688,18 +1357,52 @@ def main():
             st.markdown('<div class="section-header">📊 最終プレビュー・ダウンロード</div>', unsafe_allow_html=True)
             
             # 最終データフレーム作成
-            selected_in_order = [col for col in st.session_state.column_order 
-                               if col in st.session_state.selected_columns]
+            final_df, final_columns = final_frame(df, st.session_state.column_order, st.session_state.selected_columns)
             
-            final_columns = []
-            for col in selected_in_order:
-                if col in df.columns:
-                    final_columns.append(col)
-                else:
-                    df[col] = ''
-                    final_columns.append(col)
+            # 出力形式
+            with st.expander("📝 出力形式（文字コード・改行）", expanded=False):
+                fmt_col1, fmt_col2, fmt_col3, fmt_col4 = st.columns(4)
+                with fmt_col1:
+                    out_encoding = st.selectbox(
+                        "文字コード",
+                        options=list(ENCODINGS),
+                        format_func=lambda enc: ENCODINGS[enc],
+                        key="out_encoding"
+                    )
+                with fmt_col2:
+                    out_errors = st.selectbox(
+                        "変換できない文字",
+                        options=list(ERROR_POLICIES),
+                        format_func=lambda policy: ERROR_POLICIES[policy],
+                        help="Shift-JIS で表現できない文字（絵文字・一部の異体字など）の扱い",
+                        key="out_errors"
+                    )
+                with fmt_col3:
+                    line_options = list(LINE_TERMINATORS)
+                    out_lineterminator = st.selectbox(
+                        "改行コード",
+                        options=line_options,
+                        index=line_options.index(os.linesep) if os.linesep in line_options else 0,
+                        format_func=lambda lt: LINE_TERMINATORS[lt],
+                        key="out_lineterminator"
+                    )
+                with fmt_col4:
+                    out_quoting = st.selectbox(
+                        "クォート",
+                        options=list(QUOTING),
+                        format_func=lambda q: QUOTING[q][0],
+                        key="out_quoting"
+                    )
+            output_options = csv_options(out_encoding, out_errors, out_lineterminator, out_quoting)
+            
+            # 出力内容が同じならバックグラウンドジョブの結果を再利用
+            original_name = uploaded_file.name.split('.')[0]
             
-            final_df = df[final_columns].copy()
+            # ダウンロード前の入力チェック
+            render_validation(df, final_df, final_columns, output_options, original_name)
+            # 作業中の DataFrame の版（set_df で上がる）で区別し、置き換え・列の追加のあとに前回の結果を使わない
+            output_signature = (st.session_state.df_version, tuple(final_columns), tuple(output_options.items()))
+            output_parts = (final_columns, output_options)
             
             # 統計情報表示
             col1, col2, col3, col4 = st.columns(4)
@@ -748,76 +1451,125 @@ def main():
                             total_files = (len(final_df) + max_rows_per_file - 1) // max_rows_per_file
                             st.markdown(f"**分割ファイル数: {total_files}個**")
                     
-                    # ファイル分割ダウンロード
+                    # ファイル分割ダウンロード（ZIPはバックグラウンドで作成、各CSVはZIPへ直接書き込む）
+                    split_signature = output_signature + (max_rows_per_file,)
                     if st.button("📦 分割ファイルダウンロード", type="primary", use_container_width=True):
                         if max_rows_per_file > 0:
-                            try:
-                                # ファイル分割処理
-                                total_rows = len(final_df)
-                                total_files = (total_rows + max_rows_per_file - 1) // max_rows_per_file
-                                
-                                # ZIPファイル作成
-                                zip_buffer = io.BytesIO()
-                                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                                    original_name = uploaded_file.name.split('.')[0]
-                                    
-                                    for i in range(total_files):
-                                        start_idx = i * max_rows_per_file
-                                        end_idx = min((i + 1) * max_rows_per_file, total_rows)
-                                        
-                                        # 分割データフレーム
-                                        split_df = final_df.iloc[start_idx:end_idx]
-                                        
-                                        # CSVデータを作成
-                                        csv_data = split_df.to_csv(index=False).encode('utf-8-sig')
-                                        
-                                        # ファイル名を生成
-                                        if total_files == 1:
-                                            filename = f"{original_name}_processed.csv"
-                                        else:
-                                            filename = f"{original_name}_processed_part{i+1:03d}_of_{total_files:03d}.csv"
-                                        
-                                        # ZIPに追加
-                                        zip_file.writestr(filename, csv_data)
-                                
-                                # ZIPファイルをダウンロード
-                                zip_buffer.seek(0)
-                                st.download_button(
-                                    label=f"📦 分割ファイルZIPダウンロード ({total_files}個のファイル)",
-                                    data=zip_buffer.getvalue(),
-                                    file_name=f"{original_name}_processed_split.zip",
-                                    mime="application/zip",
-                                    type="secondary",
-                                    key="download_split_zip",
-                                    use_container_width=True
-                                )
-                                
-                                st.success(f"✅ {total_files}個のファイルに分割しました")
-                                
-                            except Exception as e:
-                                st.error(f"❌ ファイル分割でエラーが発生しました: {str(e)}")
-            
-            # 通常のダウンロードボタン
-            try:
-                csv_data = final_df.to_csv(index=False).encode('utf-8-sig')
-                original_name = uploaded_file.name.split('.')[0]
+                            submit_job('split_zip', split_signature, split_zip_job, final_df, max_rows_per_file,
+                                       f"{original_name}_processed", output_options,
+                                       output_cache_ref('split_zip', *output_parts, max_rows_per_file, original_name),
+                                       label='ファイル分割')
+                    
+                    split_job = current_job('split_zip', split_signature)
+                    if split_job is not None and show_job(split_job, 'split_zip'):
+                        zip_data, total_files = split_job.result
+                        
+                        # ZIPファイルをダウンロード
+                        st.download_button(
+                            label=f"📦 分割ファイルZIPダウンロード ({total_files}個のファイル)",
+                            data=zip_data,
+                            file_name=f"{original_name}_processed_split.zip",
+                            mime="application/zip",
+                            type="secondary",
+                            key="download_split_zip",
+                            use_container_width=True
+                        )
+                        
+                        st.success(f"✅ {total_files}個のファイルに分割しました")
                 
+                # 値ごとの分割
+                with st.expander("🗂️ 値ごとに分割", expanded=False):
+                    st.markdown("**キー列の値ごとに1ファイルずつ出力**")
+                    
+                    partition_column = st.selectbox(
+                        "分割キーの列",
+                        options=final_columns,
+                        key="partition_column"
+                    )
+                    partition_by_month = st.checkbox(
+                        "日付を月単位でまとめる",
+                        value=False,
+                        help="キー列を日付として解釈し、YYYY-MM ごとにファイルを分けます",
+                        key="partition_by_month"
+                    )
+                    partition_sort = st.multiselect(
+                        "ファイル内の並び替え列（任意）",
+                        options=final_columns,
+                        key="partition_sort"
+                    )
+                    partition_sort_numeric = st.checkbox(
+                        "数値として並び替え",
+                        value=False,
+                        key="partition_sort_numeric"
+                    )
+                    
+                    partition_signature = output_signature + (
+                        partition_column, partition_by_month, tuple(partition_sort), partition_sort_numeric
+                    )
+                    if st.button("🗂️ 値ごとに分割してダウンロード", type="primary", use_container_width=True):
+                        submit_job('partition', partition_signature, partition_job, final_df, partition_column,
+                                   partition_by_month, f"{original_name}_processed", output_options,
+                                   partition_sort or None, partition_sort_numeric,
+                                   output_cache_ref('partition', *output_parts, partition_signature[-4:], original_name),
+                                   label='値ごとの分割')
+                    
+                    partition_job_state = current_job('partition', partition_signature)
+                    if partition_job_state is not None and show_job(partition_job_state, 'partition'):
+                        zip_data, total_files = partition_job_state.result
+                        from partition import safe_filename  # 分割の結果を表示するときだけ読み込む
+                        st.download_button(
+                            label=f"🗂️ 値ごと分割ZIPダウンロード ({total_files}個のファイル)",
+                            data=zip_data,
+                            file_name=f"{original_name}_processed_by_{safe_filename(partition_column)}.zip",
+                            mime="application/zip",
+                            type="secondary",
+                            key="download_partition_zip",
+                            use_container_width=True
+                        )
+                        
+                        st.success(f"✅ {total_files}個のファイルに分割しました")
+            
+            # 通常のダウンロードボタン（CSVはバックグラウンドで作成し、出力内容が変わるまで再利用）
+            csv_cache_ref = output_cache_ref('csv', *output_parts)
+            csv_job_state = ensure_job('csv', output_signature, csv_job, final_df, output_options,
+                                       csv_cache_ref, label='CSV作成')
+            if show_job(csv_job_state, 'csv'):
+                hold_cached('csv', csv_cache_ref[1] if csv_cache_ref else None)
                 st.download_button(
                     label="📥 CSV\nダウンロード",
-                    data=csv_data,
+                    data=csv_job_state.result,
                     file_name=f"processed_{original_name}.csv",
                     mime="text/csv",
                     type="primary",
                     key="download_btn",
                     use_container_width=True
                 )
-            except Exception as e:
-                st.error(f"❌ ダウンロード用データの準備でエラーが発生しました: {str(e)}")
+            
+            # Excelダウンロード（作成に時間がかかるので、ボタンを押したときだけバックグラウンドで作成）
+            excel_signature = output_signature[:2]
+            if st.button("📗 Excelファイルを作成", key="build_excel", use_container_width=True):
+                submit_job('excel', excel_signature, excel_job, final_df, output_cache_ref('excel', final_columns),
+                           label='Excel作成')
+            excel_job_state = current_job('excel', excel_signature)
+            if excel_job_state is not None and show_job(excel_job_state, 'excel'):
+                excel_data, total_sheets = excel_job_state.result
+                st.download_button(
+                    label="📗 Excelダウンロード" + (f" ({total_sheets}シート)" if total_sheets > 1 else ""),
+                    data=excel_data,
+                    file_name=f"processed_{original_name}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="download_excel",
+                    use_container_width=True
+                )
+                if total_sheets > 1:
+                    from excel_writer import EXCEL_MAX_ROWS  # Excel出力のときだけ読み込む
+                    st.info(f"ℹ️ Excelの行数上限（1シート {EXCEL_MAX_ROWS - 1:,} 行）を超えるため {total_sheets} シートに分けました")
             
             # プレビュー表示
             st.markdown('<div class="preview-table">', unsafe_allow_html=True)
             st.subheader(f"📋 最終データプレビュー")
-            st.dataframe(final_df.head(15), use_container_width=True, height=400)
+            with stage('preview'):
+                st.dataframe(final_df.head(15), use_container_width=True, height=400)
             st.markdown('</div>', unsafe_allow_html=True)
             
             # 列情報表示
@@ -843,12 +1595,27 @@ def main():
                     st.markdown(f"**作成日:** {info['created_at']}")
                     st.markdown(f"**選択列数:** {len(info['config']['selected_columns'])}")
                     
+                    st.download_button(
+                        "📤 JSON出力",
+                        data=json.dumps(info, ensure_ascii=False, indent=2),
+                        file_name=f"{name}.json",
+                        mime="application/json",
+                        key=f"export_{name}",
+                        help="batch.py でファイルに一括適用できます",
+                        use_container_width=True
+                    )
+                    
                     if st.button("🗑️ 削除", key=f"delete_{name}", type="secondary", use_container_width=True):
+                        get_template_store().delete(name)
                         del st.session_state.templates[name]
                         st.success(f"テンプレート '{name}' を削除しました")
                         st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
         
+        # パフォーマンス
+        if show_performance:
+            render_performance_panel()
+        
         # 使用方法
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
         st.markdown('<h3 style="margin-top: 0;">📖 機能ガイド</h3>', unsafe_allow_html=True)
@@ -862,6 +1629,12 @@ def main():
           1列を複数に分割
         - **➕ 空列追加**  
           新しい空の列を追加
+        - **🧹 重複削除**  
+          重複した行を削除
+        - **📈 集計**  
+          キーごとの合計・件数など
+        - **🧮 計算列**  
+          式で新しい列を作成
         - **🎯 列選択**  
           出力する列を選択
         - **🔄 順序調整**  
@@ -0,0 +1,187 @@
+"""
+CSV Organizer Pro pyarrow によるCSV読み込み
+pyarrow のマルチスレッドCSVリーダーで読み込み、Arrow 型の列を持つ DataFrame を返す
+（pyarrow が無い・対応できない入力では ArrowUnsupported を送出し、呼び出し側が pandas で読み直す）
+"""
+
+import codecs
+
+import pandas as pd
+
+# 読み込みエンジンの選択肢（画面・CLI 共通）
+ENGINES = {
+    'pandas': 'pandas（標準）',
+    'pyarrow': 'pyarrow（マルチスレッド）',
+}
+DEFAULT_ENGINE = 'pandas'
+
+# pandas と同じく True/False のみを真偽値とみなす（pyarrow の既定は 1/0 も含む）
+_TRUE_VALUES = ['True', 'TRUE', 'true']
+_FALSE_VALUES = ['False', 'FALSE', 'false']
+
+
+class ArrowUnsupported(Exception):
+    """pyarrow で読み込めない入力（pandas で読み直す）"""
+
+
+def available():
+    """pyarrow が使えるか"""
+    try:
+        import pyarrow.csv  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _import():
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError as e:
+        raise ArrowUnsupported("pyarrow がインストールされていません") from e
+    return pa, pa_csv
+
+
+def _open(pa, source):
+    # パスはメモリマップ、バイト列はコピーせずにバッファとして読む
+    if isinstance(source, str):
+        return pa.memory_map(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pa.BufferReader(source)
+    # 関数は呼ぶたびに先頭から読む新しいストリームを返す（圧縮ファイルの展開など）
+    if callable(source):
+        stream = source()
+        return stream if isinstance(stream, pa.NativeFile) else pa.PythonFile(stream, mode='r')
+    # ファイルオブジェクトは先頭に戻して読む（列名の下読みと本読みで2回開くため）
+    source.seek(0)
+    return pa.PythonFile(source, mode='r')
+
+
+def _arrow_encoding(encoding):
+    # UTF-8 以外は pyarrow が Python の codecs で変換しながら読む
+    return 'utf8' if codecs.lookup(encoding).name == 'utf-8' else encoding
+
+
+def column_names(names):
+    """pandas と同じ列名にする（重複は 名前.1, 名前.2 ...、空欄は Unnamed: 列番号）"""
+    counts = {}
+    result = []
+    for i, name in enumerate(names):
+        if name == '':
+            name = f'Unnamed: {i}'
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f'{name}.{count}'
+            count = counts.get(name, 0)
+        result.append(name)
+        counts[name] = count + 1
+    return result
+
+
+def _undecodable(pa, schema):
+    # 文字コードが合わない列は binary として読まれる
+    return any(pa.types.is_binary(f.type) or pa.types.is_large_binary(f.type) for f in schema)
+
+
+def _prescan(pa, pa_csv, source, encoding, header_row):
+    """先頭ブロックだけ読み、列名と日付・時刻と推論された列を返す"""
+    reader = pa_csv.open_csv(
+        _open(pa, source),
+        read_options=pa_csv.ReadOptions(encoding=_arrow_encoding(encoding), skip_rows=header_row),
+        convert_options=pa_csv.ConvertOptions(true_values=_TRUE_VALUES, false_values=_FALSE_VALUES),
+    )
+    schema = reader.schema
+    if _undecodable(pa, schema):
+        raise UnicodeDecodeError(encoding, b'', 0, 1, "binary column")
+    names = column_names(schema.names)
+    temporal = [name for name, field in zip(names, schema) if pa.types.is_temporal(field.type)]
+    return names, temporal
+
+
+def _to_pandas(pa, table):
+    # 日付・時刻は pandas と同じく文字列のまま扱う（先頭ブロック以降で推論された列）
+    for i, field in enumerate(table.schema):
+        if pa.types.is_temporal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_csv(source, encodings, header_row=0, column_types=None):
+    """CSV（パス・バイト列・新しいストリームを返す関数）を pyarrow で読み込む
+
+    文字コードは encodings を順に試す。日付・時刻らしい列も文字列のまま読み、
+    それ以外の列は Arrow の型推論に従う（ArrowDtype の列になる）。
+    column_types（列名 -> pyarrow の型）を渡した列は推論せずにその型で読む。
+    """
+    pa, pa_csv = _import()
+    for encoding in encodings:
+        try:
+            names, temporal = _prescan(pa, pa_csv, source, encoding, header_row)
+            table = pa_csv.read_csv(
+                _open(pa, source),
+                read_options=pa_csv.ReadOptions(
+                    encoding=_arrow_encoding(encoding), skip_rows=header_row + 1,
+                    column_names=names, use_threads=True,
+                ),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={**{name: pa.string() for name in temporal}, **(column_types or {})},
+                    strings_can_be_null=True, true_values=_TRUE_VALUES, false_values=_FALSE_VALUES,
+                ),
+            )
+        except UnicodeDecodeError:
+            continue
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ArrowUnsupported(str(e)) from e
+        if _undecodable(pa, table.schema):
+            continue
+        return _to_pandas(pa, table)
+    raise ArrowUnsupported("対応する文字コードが見つかりません")
+
+
+def iter_csv_chunks(path, chunksize, header_row=0, encoding='utf-8'):
+    """CSVを pyarrow のストリーミングリーダーで文字列のまま chunksize 行ずつ読み込む
+
+    読み始めに失敗した場合は ArrowUnsupported（途中で失敗した場合は pyarrow の例外）を送出する。
+    """
+    pa, pa_csv = _import()
+    try:
+        names, _ = _prescan(pa, pa_csv, path, encoding, header_row)
+        reader = pa_csv.open_csv(
+            _open(pa, path),
+            read_options=pa_csv.ReadOptions(
+                encoding=_arrow_encoding(encoding), skip_rows=header_row + 1,
+                column_names=names, use_threads=True,
+            ),
+            convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names}),
+        )
+    except (UnicodeDecodeError, pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ArrowUnsupported(str(e)) from e
+    return _rechunk(pa, reader, names, chunksize)
+
+
+def _rechunk(pa, reader, names, chunksize):
+    # pyarrow のブロック単位のバッチを chunksize 行ずつにまとめ直す（行番号は通しで振る）
+    pending = []
+    buffered = 0
+    offset = 0
+    for batch in reader:
+        pending.append(batch)
+        buffered += batch.num_rows
+        while buffered >= chunksize:
+            table = pa.Table.from_batches(pending)
+            yield _chunk(table.slice(0, chunksize), names, offset)
+            offset += chunksize
+            rest = table.slice(chunksize)
+            pending = rest.to_batches()
+            buffered = rest.num_rows
+    if buffered or offset == 0:
+        # ヘッダーだけのファイルも pandas と同じく空のチャンクを1つ返す
+        yield _chunk(pa.Table.from_batches(pending, schema=reader.schema), names, offset)
+
+
+def _chunk(table, names, offset):
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    df.columns = names
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+CSV Organizer Pro バッチ処理
+保存済みテンプレート(JSON)をCSVファイルにチャンク単位で適用する
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import checkpoint
+import decompress
+import incremental
+import validation
+import workbook
+from arrow_csv import DEFAULT_ENGINE, ENGINES
+from csv_writer import ENCODINGS, ERROR_POLICIES, LINE_TERMINATOR_NAMES, QUOTING, csv_options, write_csv
+from instrumentation import recording, timed_iter
+from loader import read_sample
+from pipeline import DEFAULT_CHUNKSIZE, iter_csv_chunks, stream_template
+from schema import check_drift, describe_issue
+
+def load_template(path):
+    """アプリから出力したテンプレートJSONを読み込んで設定部分を返す"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('config', data)
+
+
+def schema_issues(input_path, config, header_row=0):
+    """テンプレートに保存されたスキーマと入力ファイルの先頭の差異を返す（スキーマが無ければ空）"""
+    if not config.get('schema'):
+        return []
+    with open(input_path, 'rb') as f:
+        return check_drift(config['schema'], read_sample(f, input_path, header_row))
+
+
+def apply_to_file(config, input_path, output_path, chunksize=DEFAULT_CHUNKSIZE, header_row=0, encoding=None,
+                  output_options=None, engine=DEFAULT_ENGINE, progress=None, validator=None):
+    """テンプレートの設定をCSVファイルに適用して出力先（パスまたはファイルオブジェクト）に書き出し、出力行数を返す
+
+    progress（チャンクの反復子を受け取って同じチャンクを返す関数。例: Job.iterate）で読み込みの進捗を受け取れる。
+    validator（validation.Validator）を渡すと、書き出すチャンクを同じ流れの中で入力チェックする。
+    """
+    chunks = timed_iter('read_csv', iter_csv_chunks(input_path, chunksize, header_row, encoding, engine))
+    if progress is not None:
+        chunks = progress(chunks)
+    chunks = stream_template(config, chunks)
+    if validator is not None:
+        chunks = validator.validated(chunks)
+    return write_csv(chunks, output_path, **(output_options or csv_options()))
+
+
+def run(input_path, template_path, output_path, chunksize=DEFAULT_CHUNKSIZE,
+        header_row=0, encoding=None, output_options=None, engine=DEFAULT_ENGINE):
+    """テンプレートを適用して出力ファイルに書き出し、出力行数を返す"""
+    return apply_to_file(load_template(template_path), input_path, output_path, chunksize, header_row, encoding,
+                         output_options, engine)
+
+
+def default_output(input_path):
+    """入力ファイルに対応する既定の出力ファイル名（processed_<入力名>.csv）"""
+    name = os.path.splitext(decompress.inner_name(os.path.basename(input_path)))[0]
+    return f"processed_{name}.csv"
+
+
+def run_files(config, input_paths, output_paths, args, output_options):
+    """入力ファイルを順に処理し、出力行数の合計を返す
+
+    args.checkpoint があれば途中経過を記録し、完了済みのファイルは飛ばして途中のファイルは続きから処理する。
+    """
+    manifest = None
+    if args.checkpoint:
+        manifest = checkpoint.Manifest(args.checkpoint, checkpoint.settings_for(
+            config, args.header_row, output_options, args.chunksize, args.engine))
+    rules = config.get('validation_rules') or []
+    if rules and manifest is not None:
+        print("ℹ️ --checkpoint では入力チェックを行いません（続きから処理すると全体の件数を数えられないため）")
+    total = 0
+    invalid = 0
+    for input_path, output_path in zip(input_paths, output_paths):
+        # 処理を始める前に、テンプレート保存時のファイルとの列・型の差異を表示
+        for issue in schema_issues(input_path, config, args.header_row):
+            print(f"⚠️ {input_path}: {describe_issue(issue)}" if len(input_paths) > 1 else f"⚠️ {describe_issue(issue)}")
+        if manifest is None:
+            validator = None
+            if rules:
+                invalid_path = args.invalid_rows or validation.error_rows_path(output_path)
+                validator = validation.Validator(rules, invalid_path, output_options)
+            try:
+                rows = apply_to_file(config, input_path, output_path, args.chunksize, args.header_row, args.encoding,
+                                     output_options, args.engine, validator=validator)
+            finally:
+                if validator is not None:
+                    validator.close()
+            if validator is not None:
+                print_validation(validator.summary(), invalid_path)
+                invalid += validator.invalid_rows
+        else:
+            result = checkpoint.apply_to_file(config, input_path, output_path, manifest, args.chunksize,
+                                              args.header_row, args.encoding, output_options, args.engine,
+                                              args.commit_chunks)
+            rows = result['rows']
+            if result['status'] == 'skipped':
+                print(f"⏭ {output_path} は処理済みです（{rows:,} 行）")
+            elif result['resumed_rows']:
+                print(f"ℹ️ {input_path} は処理済みの {result['resumed_rows']:,} 行の続きから処理しました")
+        if len(input_paths) > 1 and not (manifest is not None and result['status'] == 'skipped'):
+            print(f"✅ {output_path} を生成しました（{rows:,} 行）")
+        total += rows
+    if invalid and args.fail_on_invalid:
+        raise ValueError(f"入力チェックに違反した行が {invalid:,} 行あります")
+    return total
+
+
+def print_validation(summary, invalid_path):
+    """入力チェックの結果（ルールごとの違反行数と値の例）を表示"""
+    for column in summary['missing_columns']:
+        print(f"⚠️ 入力チェックの列がありません: {column}")
+    if not summary['invalid_rows']:
+        print(f"✅ 入力チェック: {summary['rows']:,} 行すべて問題ありません")
+        return
+    print(f"⚠️ 入力チェック: {summary['rows']:,} 行中 {summary['invalid_rows']:,} 行が違反（{invalid_path}）")
+    for rule in summary['rules']:
+        if rule['count']:
+            samples = ', '.join(repr(value) for value in rule['samples'])
+            print(f"  - {rule['rule']}: {rule['count']:,} 件（例: {samples}）")
+
+
+def print_sheet_timings(timings):
+    """シートごとの行数・読み込み・変換の時間を表にして表示"""
+    width = max(len(timing['sheet']) for timing in timings)
+    print(f"{'シート'.ljust(width)}  {'行数':>10}  {'読込(秒)':>8}  {'変換(秒)':>8}")
+    for timing in timings:
+        print(f"{timing['sheet'].ljust(width)}  {timing['rows']:>10,}  {timing['read_seconds']:>8.2f}  "
+              f"{timing['transform_seconds']:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="テンプレートをCSVファイルに適用します")
+    parser.add_argument("input", nargs='+',
+                        help="入力CSVファイル（.gz/.bz2/.xz/.zst は展開しながら読み、.zip は中のCSVをつなげて読む）"
+                             "または Excel ブック（.xlsx/.xlsm/.xls）。複数指定するとファイルごとに出力する")
+    parser.add_argument("-t", "--template", required=True, help="テンプレートJSONファイル")
+    parser.add_argument("-o", "--output",
+                        help="出力CSVファイル（既定: processed_<入力名>.csv）。入力が複数なら出力先のフォルダ")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1チャンクあたりの行数")
+    parser.add_argument("--header-row", type=int, default=0, help="ヘッダー行番号 (0から開始)")
+    parser.add_argument("--encoding", help="入力の文字コード（既定: 自動判定）")
+    parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_ENGINE,
+                        help="CSVの読み込みエンジン（既定: pandas。pyarrow で読めない場合は pandas で読み直す）")
+    parser.add_argument("--out-encoding", choices=list(ENCODINGS), default='utf-8-sig',
+                        help="出力の文字コード（既定: utf-8-sig）")
+    parser.add_argument("--errors", choices=list(ERROR_POLICIES), default='strict',
+                        help="出力の文字コードで表現できない文字の扱い（既定: strict）")
+    parser.add_argument("--line-terminator", choices=list(LINE_TERMINATOR_NAMES),
+                        help="改行コード（既定: OS標準）")
+    parser.add_argument("--quoting", choices=list(QUOTING), default='minimal', help="クォート（既定: minimal）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="前回処理した位置を記録し、追記された行だけを処理して出力ファイルに追記する")
+    parser.add_argument("--delta", metavar="PATH",
+                        help="--incremental で、新しい行だけをこのファイルに書き出す（出力ファイルには追記しない）")
+    parser.add_argument("--state", metavar="PATH",
+                        help="--incremental の処理位置の記録ファイル（既定: <出力ファイル>.state.json）")
+    parser.add_argument("--sheets", metavar="PATTERN",
+                        help="Excel で読み込むシート（カンマ区切りのワイルドカード、! で除外。"
+                             "既定: テンプレートの sheet_pattern、無ければ先頭のシート）")
+    parser.add_argument("--per-sheet", action="store_true",
+                        help="Excel のシートごとに <出力名>_<シート名>.csv を書き出す（既定: 1つのファイルにつなげる）")
+    parser.add_argument("--sheet-column", default=workbook.SHEET_COLUMN, metavar="NAME",
+                        help=f"シートをつなげるときに加える元のシート名の列（既定: {workbook.SHEET_COLUMN}。空文字で加えない）")
+    parser.add_argument("--workers", type=int,
+                        help="Excel のシートを並列に処理するプロセス数（既定: CPU 数）")
+    parser.add_argument("--checkpoint", metavar="DIR",
+                        help="途中経過を記録するフォルダ。止まったあとに同じ指定で再実行すると、終わったファイルを飛ばし、"
+                             "途中のファイルは最後に記録したチャンクの続きから処理する")
+    parser.add_argument("--commit-chunks", type=int, default=checkpoint.DEFAULT_COMMIT_CHUNKS, metavar="N",
+                        help=f"--checkpoint で途中経過を記録する間隔（チャンク数、既定: {checkpoint.DEFAULT_COMMIT_CHUNKS}）")
+    parser.add_argument("--invalid-rows", metavar="PATH",
+                        help="テンプレートの入力チェックに違反した行の書き出し先（既定: <出力名>_errors.csv）")
+    parser.add_argument("--fail-on-invalid", action="store_true",
+                        help="入力チェックに違反した行があれば終了コード 1 で終了する")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="工程ごとの時間とメモリを JSON Lines で追記するファイル（- で標準エラー出力）")
+    args = parser.parse_args(argv)
+    if (args.delta or args.state) and not args.incremental:
+        parser.error("--delta と --state は --incremental と一緒に指定してください")
+    if args.checkpoint and args.incremental:
+        parser.error("--checkpoint と --incremental は一緒に指定できません")
+    if args.commit_chunks < 1:
+        parser.error("--commit-chunks は1以上を指定してください")
+    is_workbook = any(workbook.is_workbook(path) for path in args.input)
+    if len(args.input) > 1 and (is_workbook or args.incremental):
+        parser.error("Excel ブック・--incremental は入力ファイルを1つだけ指定してください")
+    if is_workbook and (args.incremental or args.checkpoint):
+        parser.error("Excel ブックは --incremental・--checkpoint に対応していません")
+
+    if len(args.input) == 1:
+        outputs = [args.output or default_output(args.input[0])]
+    else:
+        output_dir = args.output or '.'
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = [os.path.join(output_dir, default_output(path)) for path in args.input]
+    if args.invalid_rows and len(outputs) > 1:
+        parser.error("--invalid-rows は入力ファイルを1つだけ指定したときに使えます")
+    if len(set(map(os.path.abspath, outputs))) < len(outputs):
+        parser.error("出力ファイル名が重複する入力があります")
+    input_path, output = args.input[0], outputs[0]
+
+    start = time.perf_counter()
+    with recording('batch') as recorder:
+        try:
+            options = csv_options(args.out_encoding, args.errors, quoting=args.quoting)
+            if args.line_terminator:
+                options['lineterminator'] = LINE_TERMINATOR_NAMES[args.line_terminator]
+            config = load_template(args.template)
+            if is_workbook or args.incremental:
+                # 処理を始める前に、テンプレート保存時のファイルとの列・型の差異を表示
+                for issue in schema_issues(input_path, config, args.header_row):
+                    print(f"⚠️ {describe_issue(issue)}")
+            if is_workbook:
+                invalid_path = args.invalid_rows or validation.error_rows_path(output)
+                validator = None
+                if config.get('validation_rules'):
+                    validator = validation.Validator(config['validation_rules'], invalid_path, options)
+                try:
+                    result = workbook.run(input_path, config, output, args.sheets, args.per_sheet,
+                                          args.sheet_column or None, args.header_row, options, args.workers,
+                                          validator)
+                finally:
+                    if validator is not None:
+                        validator.close()
+                if validator is not None:
+                    print_validation(validator.summary(), invalid_path)
+                    if validator.invalid_rows and args.fail_on_invalid:
+                        raise ValueError(f"入力チェックに違反した行が {validator.invalid_rows:,} 行あります")
+            elif args.incremental:
+                if config.get('validation_rules'):
+                    print("ℹ️ --incremental では入力チェックを行いません")
+                result = incremental.run(input_path, config, output, args.state, args.delta,
+                                         args.chunksize, args.header_row, args.encoding, options, args.engine)
+            else:
+                rows = run_files(config, args.input, outputs, args, options)
+        except Exception as e:
+            print(f"❌ 処理に失敗しました: {e}")
+            return 1
+        finally:
+            if args.profile:
+                recorder.write_jsonl(args.profile)
+    elapsed = time.perf_counter() - start
+    if is_workbook:
+        print_sheet_timings(result['sheets'])
+        for path, rows in result['outputs']:
+            print(f"✅ {path} を生成しました（{rows:,} 行）")
+        print(f"✅ {len(result['sheets'])} シートを処理しました（{elapsed:.1f} 秒）")
+        return 0
+    if not args.incremental:
+        if len(outputs) > 1:
+            print(f"✅ {len(outputs)} ファイルを処理しました（{rows:,} 行, {elapsed:.1f} 秒）")
+        else:
+            print(f"✅ {output} を生成しました（{rows:,} 行, {elapsed:.1f} 秒）")
+        return 0
+    if result['mode'] == 'full':
+        print(f"ℹ️ 全体を処理しました: {result['reason']}")
+    action = "に書き出しました" if args.delta else "に追記しました" if result['mode'] == 'incremental' else "を生成しました"
+    print(f"✅ {result['target']} {action}（新しい入力 {result['input_rows']:,} 行 → 出力 {result['rows']:,} 行, "
+          f"処理済み累計 {result['total_rows']:,} 行, {elapsed:.1f} 秒）")
+    if result['pending_bytes']:
+        print(f"⏳ 改行で終わっていない最後の行（{result['pending_bytes']:,} バイト）は次回処理します")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
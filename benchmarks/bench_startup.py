@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+CSV Organizer Pro 起動ベンチマーク
+アプリのモジュール読み込み時間・サーバーが応答するまでの時間（コールドスタート）・
+ファイル未選択時の1回の再実行にかかる時間を計測する
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+sys.path.insert(0, ROOT_DIR)
+
+# 起動時には読み込まれていないはずのモジュール（Excel・ZIP出力や、ファイルを選んでから使う機能のときだけ使う）
+DEFERRED_MODULES = [
+    'openpyxl', 'xlrd', 'zipfile', 'pyarrow.csv',
+    'api_server', 'excel_writer', 'partition', 'template_match', 'template_store', 'validation', 'workbook',
+]
+
+# app.py が起動時に読み込むモジュール（streamlit 以外）
+APP_MODULES = [
+    'aggregate', 'arrow_csv', 'column_index', 'csv_writer', 'decompress', 'dedupe', 'expressions', 'instrumentation',
+    'jobs', 'loader', 'pipeline', 'schema', 'shared_cache', 'staging',
+]
+
+
+def measure_imports():
+    """新しいプロセスで streamlit とアプリのモジュールを読み込む時間と、読み込まれた重いモジュール"""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import streamlit\n"
+        f"for name in {APP_MODULES!r}: __import__(name)\n"
+        "seconds = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {DEFERRED_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def measure_server(timeout):
+    """streamlit run を起動してからヘルスチェックが応答するまでの秒数"""
+    from launcher import wait_for_server
+
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.port", str(port),
+        "--server.headless", "true",
+        "--browser.gatherUsageStats", "false",
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_server(f"http://localhost:{port}", process, timeout):
+            return None
+        return time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def measure_reruns(reruns):
+    """AppTest でアプリを実行し、初回と再実行1回あたりの秒数を返す"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - start
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    return first, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動ベンチマーク")
+    parser.add_argument("--runs", type=int, default=3, help="コールドスタートの計測回数")
+    parser.add_argument("--reruns", type=int, default=20, help="再実行の計測回数")
+    parser.add_argument("--timeout", type=int, default=60, help="サーバー起動のタイムアウト秒数")
+    parser.add_argument("--output", help="結果JSONの保存先")
+    args = parser.parse_args()
+
+    imports = [measure_imports() for _ in range(args.runs)]
+    import_seconds = [r['seconds'] for r in imports]
+    print(f"{'モジュール読み込み':<24} {statistics.median(import_seconds):8.3f} 秒（中央値, {args.runs} 回）")
+    loaded = sorted({m for r in imports for m in r['loaded']})
+    print(f"{'起動時に読み込まれた遅延対象':<24} {', '.join(loaded) or 'なし'}")
+
+    server_seconds = [measure_server(args.timeout) for _ in range(args.runs)]
+    if None in server_seconds:
+        print("❌ サーバーが起動しませんでした")
+        return 1
+    print(f"{'サーバー応答まで':<24} {statistics.median(server_seconds):8.3f} 秒（中央値, {args.runs} 回）")
+
+    first, reruns = measure_reruns(args.reruns)
+    print(f"{'初回のスクリプト実行':<24} {first:8.3f} 秒")
+    print(f"{'再実行1回':<24} {statistics.median(reruns) * 1000:8.1f} ミリ秒（中央値, {args.reruns} 回）")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'import_seconds': import_seconds,
+                'deferred_loaded': loaded,
+                'server_seconds': server_seconds,
+                'first_run_seconds': first,
+                'rerun_seconds': reruns,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果を保存しました: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
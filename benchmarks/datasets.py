@@ -0,0 +1,97 @@
+"""
+CSV Organizer Pro ベンチマーク用データ生成
+UTF-8 / Shift-JIS、狭い表 / 1,000列の広い表、重複ヘッダーを含む合成CSV・XLSXを作成
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csv_writer import write_csv  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 形状ごとの列数
+SHAPES = {'narrow': 12, 'wide': 1000}
+# ファイル名に使う文字コードの略称
+ENCODING_TAGS = {'utf-8': 'utf8', 'shift-jis': 'sjis'}
+
+_STORES = np.array([f"S{i:04d}" for i in range(200)], dtype=object)
+_PRODUCTS = np.array(['りんご', 'みかん', 'ぶどう', '牛乳', '食パン', 'コーヒー 豆', '緑茶', '醤油'], dtype=object)
+_CUSTOMERS = np.array(['山田 太郎', '佐藤 花子', '鈴木 一郎', '高橋 美咲', '田中 健', '渡辺 さくら'], dtype=object)
+_CITIES = np.array(['東京都千代田区', '大阪府大阪市', '愛知県名古屋市', '福岡県福岡市', '北海道札幌市'], dtype=object)
+_NOTES = np.array(['', '', '', '至急', '要確認', '返品あり'], dtype=object)
+
+
+def dataset_name(shape, rows, encoding, fmt):
+    """データセットのファイル名"""
+    tag = ENCODING_TAGS.get(encoding, encoding) if fmt == 'csv' else 'xlsx'
+    return f"{shape}_{tag}_{rows}.{fmt}"
+
+
+def make_chunk(start, rows, columns, rng):
+    """合成データの1チャンク（重複ヘッダーを含む）"""
+    ids = np.arange(start, start + rows)
+    base = [
+        ('ID', ids),
+        ('店舗コード', rng.choice(_STORES, rows)),
+        ('商品名', rng.choice(_PRODUCTS, rows)),
+        ('商品名', rng.choice(_PRODUCTS, rows)),
+        ('数量', rng.integers(1, 20, rows)),
+        ('単価', rng.integers(80, 5000, rows)),
+        ('日付', (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'))
+         .strftime('%Y/%m/%d').to_numpy()),
+        ('顧客名', rng.choice(_CUSTOMERS, rows)),
+        ('住所', rng.choice(_CITIES, rows)),
+        ('郵便番号', rng.integers(1000000, 9999999, rows)),
+        ('備考', rng.choice(_NOTES, rows)),
+        ('備考', rng.choice(_NOTES, rows)),
+    ]
+    for i in range(len(base), columns):
+        # 広い表の追加列: 数値と文字列を交互に（100列ごとに直前の列と同じ名前）
+        name = f"項目{i - 1:04d}" if i % 100 == 0 else f"項目{i:04d}"
+        values = rng.integers(0, 100000, rows) if i % 2 else rng.choice(_PRODUCTS, rows)
+        base.append((name, values))
+    frame = pd.DataFrame({i: values for i, (_name, values) in enumerate(base[:columns])})
+    frame.columns = [name for name, _values in base[:columns]]
+    return frame
+
+
+def generate_csv(path, rows, columns, encoding, chunk_rows=100_000, seed=0):
+    """合成CSVをチャンクごとに書き出す"""
+    rng = np.random.default_rng(seed)
+    chunks = (make_chunk(start, min(chunk_rows, rows - start), columns, rng)
+              for start in range(0, rows, chunk_rows))
+    write_csv(chunks, path, encoding='cp932' if encoding == 'shift-jis' else 'utf-8', lineterminator='\n')
+
+
+def generate_xlsx(path, rows, columns, seed=0):
+    """合成XLSXを書き出す（Excelの行数上限内）"""
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    frame = make_chunk(0, rows, columns, rng)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False, name=None):
+        sheet.append([value.item() if hasattr(value, 'item') else value for value in row])
+    workbook.save(path)
+
+
+def ensure_dataset(shape, rows, encoding='utf-8', fmt='csv', data_dir=DATA_DIR):
+    """データセットが無ければ生成し、パスを返す（生成済みなら再利用）"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, dataset_name(shape, rows, encoding, fmt))
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        if fmt == 'csv':
+            generate_csv(tmp_path, rows, SHAPES[shape], encoding)
+        else:
+            generate_xlsx(tmp_path, rows, SHAPES[shape])
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+CSV Organizer Pro ベンチマークスイート
+読み込み・テンプレート適用・結合/分割・出力列の作成・CSV/分割ZIP出力の処理時間とピークRSSを計測し、
+結果をJSONに保存する（--compare で前回の結果と比較）
+
+使い方:
+    python benchmarks/run_benchmarks.py --preset quick
+    python benchmarks/run_benchmarks.py --preset standard --compare benchmarks/results/前回.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from instrumentation import current_rss_mb, peak_rss_mb  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+CASES = [
+    'load',
+    'load_mapped',
+    'load_arrow',
+    'apply_template',
+    'merge',
+    'split',
+    'aggregate',
+    'projection',
+    'export_csv',
+    'export_split_zip',
+]
+
+# 時間がかかるので --cases で指定したときだけ実行するケース（Excel出力: ストリーミング / pandas の to_excel）
+OPTIONAL_CASES = [
+    'export_excel',
+    'export_excel_pandas',
+]
+
+# (形状, 行数, 文字コード, 形式) の組み合わせ
+PRESETS = {
+    'quick': [
+        ('narrow', 10_000, 'utf-8', 'csv'),
+        ('narrow', 10_000, 'shift-jis', 'csv'),
+        ('narrow', 100_000, 'utf-8', 'csv'),
+        ('wide', 10_000, 'utf-8', 'csv'),
+        ('narrow', 10_000, 'utf-8', 'xlsx'),
+    ],
+    'standard': [
+        ('narrow', rows, encoding, 'csv')
+        for rows in (10_000, 100_000, 1_000_000) for encoding in ('utf-8', 'shift-jis')
+    ] + [
+        ('wide', 10_000, 'utf-8', 'csv'),
+        ('wide', 100_000, 'shift-jis', 'csv'),
+        ('narrow', 10_000, 'utf-8', 'xlsx'),
+        ('narrow', 100_000, 'utf-8', 'xlsx'),
+    ],
+    'full': [
+        ('narrow', rows, encoding, 'csv')
+        for rows in (10_000, 100_000, 1_000_000, 10_000_000) for encoding in ('utf-8', 'shift-jis')
+    ] + [
+        ('wide', rows, encoding, 'csv')
+        for rows in (10_000, 100_000, 1_000_000) for encoding in ('utf-8', 'shift-jis')
+    ] + [
+        ('narrow', 10_000, 'utf-8', 'xlsx'),
+        ('narrow', 100_000, 'utf-8', 'xlsx'),
+        ('narrow', 1_000_000, 'utf-8', 'xlsx'),
+    ],
+}
+
+# 比較時にこの倍率を超えて遅くなったケースを警告
+REGRESSION_RATIO = 1.2
+
+# 合成データに対するテンプレート（重複ヘッダーは読み込み時に 商品名.1 などになる）
+BENCH_TEMPLATE = {
+    'merge_operations': [{'columns': ['店舗コード', '商品名', '商品名.1'], 'new_column': '店舗商品', 'separator': '-'}],
+    'split_operations': [{'column': '顧客名', 'delimiter': ' ', 'new_columns': ['姓', '名']}],
+    'empty_columns': ['確認欄'],
+    'expression_columns': [{'new_column': '金額', 'expression': '数量 * 単価'}],
+    'column_order': ['ID', '店舗商品', '姓', '名', '数量', '単価', '金額', '日付', '確認欄'],
+    'selected_columns': ['ID', '店舗商品', '姓', '名', '数量', '単価', '金額', '日付', '確認欄'],
+}
+SPLIT_ZIP_ROWS = 100_000
+
+
+# ---- 各ケース（子プロセス内で実行） ----
+
+def _load(path):
+    from loader import load_table
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    return load_table(content, os.path.basename(path))
+
+
+def run_case(case, path):
+    """1ケースを実行し、計測対象部分の秒数を返す"""
+    import tempfile
+
+    from aggregate import aggregate_dataframe
+    from csv_writer import spooled_csv, write_split_zip
+    from excel_writer import write_excel
+    from pipeline import apply_row_operations, apply_template_config, final_frame, merge_columns
+
+    if case == 'load':
+        start = time.perf_counter()
+        _load(path)
+        return time.perf_counter() - start
+    if case in ('load_mapped', 'load_arrow'):
+        from loader import load_file
+
+        start = time.perf_counter()
+        load_file(path, engine='pyarrow' if case == 'load_arrow' else 'pandas')
+        return time.perf_counter() - start
+
+    df = _load(path)
+    exports = ('export_csv', 'export_split_zip', 'export_excel', 'export_excel_pandas')
+    if case == 'projection' or case in exports:
+        df, order, selected = apply_template_config(BENCH_TEMPLATE, df)
+    if case in exports:
+        df = final_frame(df, order, selected)[0]
+
+    start = time.perf_counter()
+    if case == 'apply_template':
+        apply_template_config(BENCH_TEMPLATE, df)
+    elif case == 'merge':
+        merge_columns(df, BENCH_TEMPLATE['merge_operations'][0]['columns'], '-')
+    elif case == 'split':
+        apply_row_operations({'split_operations': BENCH_TEMPLATE['split_operations']}, df)
+    elif case == 'aggregate':
+        aggregate_dataframe(df, ['店舗コード'], [{'column': '数量', 'func': 'sum'},
+                                              {'column': '単価', 'func': 'mean'}])
+    elif case == 'projection':
+        final_frame(df, order, selected)
+    elif case == 'export_csv':
+        with spooled_csv(df) as f:
+            f.read()
+    elif case == 'export_split_zip':
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as f:
+            write_split_zip(df, f, SPLIT_ZIP_ROWS, 'bench')
+    elif case == 'export_excel':
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as f:
+            write_excel(df, f)
+    elif case == 'export_excel_pandas':
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as f:
+            df.to_excel(f, index=False)
+    else:
+        raise ValueError(f"未知のケースです: {case}")
+    return time.perf_counter() - start
+
+
+def worker(case, path):
+    """子プロセス: 1ケースを実行して結果をJSONで標準出力に書く"""
+    rss_before = current_rss_mb()
+    seconds = run_case(case, path)
+    print(json.dumps({
+        'seconds': seconds,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+# ---- 実行・保存・比較 ----
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import numpy
+    import pandas
+
+    return {
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_isolated(case, path, timeout):
+    """ケースごとに新しいプロセスで実行（ピークRSSを他のケースと分離するため）"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', case, path]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        message = (result.stderr.strip().splitlines() or ['不明なエラー'])[-1]
+        return {'status': f"error: {message}"}
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured['status'] = 'ok'
+    return measured
+
+
+def compare(results, baseline_path):
+    """前回の結果と比較して表示し、遅くなったケース数を返す"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['dataset'], r['case']): r for r in json.load(f)['results']}
+    print(f"\n📈 比較: {os.path.basename(baseline_path)}")
+    regressions = 0
+    for result in results:
+        before = baseline.get((result['dataset'], result['case']))
+        if not before or result.get('seconds') is None or before.get('seconds') in (None, 0):
+            continue
+        ratio = result['seconds'] / before['seconds']
+        mark = '⚠️' if ratio > REGRESSION_RATIO else '  '
+        regressions += ratio > REGRESSION_RATIO
+        print(f"{mark} {result['dataset']:<28} {result['case']:<18} "
+              f"{before['seconds']:8.3f} → {result['seconds']:8.3f} 秒 ({ratio:.2f}x)")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="CSV Organizer Pro ベンチマーク")
+    parser.add_argument("--preset", choices=list(PRESETS), default='quick', help="データセットの組み合わせ")
+    parser.add_argument("--cases", default=','.join(CASES),
+                        help=f"実行するケース（カンマ区切り。既定以外に {', '.join(OPTIONAL_CASES)} も指定可）")
+    parser.add_argument("--output", help="結果JSONの保存先（既定: benchmarks/results/ に日時付きで保存）")
+    parser.add_argument("--compare", help="比較する前回の結果JSON")
+    parser.add_argument("--data-dir", help="生成データの保存先（既定: benchmarks/data/）")
+    parser.add_argument("--timeout", type=int, default=3600, help="1ケースのタイムアウト秒数")
+    parser.add_argument("--worker", nargs=2, metavar=('CASE', 'PATH'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        worker(*args.worker)
+        return 0
+
+    from datasets import DATA_DIR, SHAPES, ensure_dataset
+
+    cases = [case.strip() for case in args.cases.split(',') if case.strip()]
+    unknown = [case for case in cases if case not in CASES + OPTIONAL_CASES]
+    if unknown:
+        print(f"❌ 未知のケースです: {', '.join(unknown)}")
+        return 2
+
+    results = []
+    for shape, rows, encoding, fmt in PRESETS[args.preset]:
+        print(f"📦 データ準備: {shape} {rows:,} 行 ({encoding}, {fmt})")
+        path = ensure_dataset(shape, rows, encoding, fmt, args.data_dir or DATA_DIR)
+        for case in cases:
+            measured = run_isolated(case, path, args.timeout)
+            result = {
+                'dataset': os.path.basename(path),
+                'case': case,
+                'format': fmt,
+                'encoding': encoding if fmt == 'csv' else None,
+                'rows': rows,
+                'columns': SHAPES[shape],
+                'file_mb': os.path.getsize(path) / 1024 / 1024,
+                **measured,
+            }
+            results.append(result)
+            if result['status'] == 'ok':
+                peak = result['peak_rss_mb']
+                peak_text = f"  ピークRSS {peak:8.1f} MB" if peak is not None else ''
+                print(f"   {case:<18} {result['seconds']:9.3f} 秒{peak_text}")
+            else:
+                print(f"   {case:<18} ❌ {result['status']}")
+
+    report = {
+        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'git_commit': git_commit(),
+        'preset': args.preset,
+        'environment': environment(),
+        'results': results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench_{stamp}_{report['git_commit'] or 'local'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 結果を保存しました: {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            print(f"\n⚠️ {REGRESSION_RATIO}倍を超えて遅くなったケース: {regressions} 件")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,6 +24,32 @@ def build_app():
         "--name=CSV_Organizer_Pro",  # アプリケーション名
         "--icon=icon.ico",  # アイコン（存在する場合）
         "--add-data=app.py;.",  # アプリケーションファイルを含める
+        "--add-data=dedupe.py;.",
+        "--add-data=partition.py;.",
+        "--add-data=aggregate.py;.",
+        "--add-data=csv_writer.py;.",
+        "--add-data=expressions.py;.",
+        "--add-data=numeric.py;.",
+        "--add-data=pipeline.py;.",
+        "--add-data=loader.py;.",
+        "--add-data=staging.py;.",
+        "--add-data=arrow_csv.py;.",
+        "--add-data=schema.py;.",
+        "--add-data=template_match.py;.",
+        "--add-data=incremental.py;.",
+        "--add-data=column_index.py;.",
+        "--add-data=excel_writer.py;.",
+        "--add-data=decompress.py;.",
+        "--add-data=template_store.py;.",
+        "--add-data=api_server.py;.",
+        "--add-data=batch.py;.",
+        "--add-data=checkpoint.py;.",
+        "--add-data=validation.py;.",
+        "--add-data=workbook.py;.",
+        "--add-data=static/style.css;static",
+        "--add-data=instrumentation.py;.",
+        "--add-data=jobs.py;.",
+        "--add-data=shared_cache.py;.",
         "launcher.py"  # エントリーポイント
     ]
     
@@ -0,0 +1,332 @@
+"""
+CSV Organizer Pro チェックポイント
+長時間のバッチ処理の途中経過（終わったファイル・処理済みの入力のバイト位置・書き出した part ファイルとチェックサム）を
+マニフェストに記録し、止まったあとの再実行では終わったファイルを飛ばし、途中のファイルは最後に記録した位置の続きから読む
+（part ファイル・出力ファイルは一時ファイルに書いてから置き換えるので、書きかけのファイルを完成品と取り違えない）
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+from datetime import datetime
+
+import decompress
+from arrow_csv import DEFAULT_ENGINE
+from csv_writer import csv_options, write_csv
+from incremental import SegmentReader, header_end, record_boundaries, settings_digest, supports_incremental
+from instrumentation import stage, timed_iter
+from pipeline import DEFAULT_CHUNKSIZE, detect_encoding, iter_csv_chunks, stream_template
+
+MANIFEST_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+# part ファイル1つにまとめる入力チャンク数（この単位で途中経過を記録する）
+DEFAULT_COMMIT_CHUNKS = 10
+
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+# part の区切りのバイト数を見積もるために読む、データ部分の先頭のバイト数
+_SAMPLE_BYTES = 1024 * 1024
+
+
+def file_checksum(path):
+    """ファイル全体のチェックサム"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_COPY_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_stamp(path):
+    """入力ファイルが前回と同じかを判定するための情報（サイズと更新時刻）"""
+    info = os.stat(path)
+    return {'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+def record_end(path, start, target, size):
+    """start（行の先頭）から読み、target 以降で最初の行の区切り（クォートの外の改行）の直後のバイト位置
+
+    クォートで囲んだ値の中の改行では区切らない（"" のエスケープも含めて " の数の偶奇で判定する）。
+    区切りが無ければファイルの末尾（size）を返す。
+    """
+    quotes = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < size:
+            block = f.read(min(_COPY_BLOCK_SIZE, size - pos))
+            if not block:
+                break
+            if pos + len(block) > target:
+                hits = record_boundaries(block, quotes)
+                hits = hits[hits >= target - pos]
+                if len(hits):
+                    return pos + int(hits[0]) + 1
+            quotes += block.count(b'"')
+            pos += len(block)
+    return size
+
+
+def _part_bytes(path, start, rows):
+    """入力 rows 行分のおおよそのバイト数（データ部分の先頭から1行あたりのバイト数を見積もる）"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        sample = f.read(_SAMPLE_BYTES)
+    return max(1, len(sample) * rows // max(1, sample.count(b'\n')))
+
+
+def settings_for(config, header_row, output_options, chunksize=DEFAULT_CHUNKSIZE, engine=DEFAULT_ENGINE):
+    """マニフェストを使い回せる設定のチェックサム（チャンクの大きさ・読み込みエンジンが変わると読み飛ばす位置がずれる）"""
+    return f"{settings_digest(config, header_row, output_options)}-{chunksize}-{engine}"
+
+
+class _HashingWriter(io.RawIOBase):
+    """書き込んだバイト列のチェックサムを取りながらファイルに書く（書き出し後に読み直さない）"""
+
+    def __init__(self, f):
+        super().__init__()
+        self._file = f
+        self.digest = hashlib.blake2b(digest_size=20)
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+
+def _write_atomic(path, write):
+    """write(ファイル) で一時ファイルに書き、ディスクに書き終えてから path に置き換える。(バイト数, チェックサム) を返す"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        writer = _HashingWriter(f)
+        write(writer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return writer.size, writer.digest.hexdigest()
+
+
+class Manifest:
+    """チェックポイントのディレクトリとマニフェスト（入力ファイルごとの途中経過）
+
+    テンプレート・ヘッダー行・出力形式・チャンクの大きさ・読み込みエンジンが前回と違えば、記録を捨てて最初から処理する。
+    """
+
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        os.makedirs(directory, exist_ok=True)
+        data = self._load()
+        if data is None or data.get('settings') != settings:
+            if data is not None:
+                for entry in data.get('files', {}).values():
+                    shutil.rmtree(self.part_dir(entry), ignore_errors=True)
+            data = {'version': MANIFEST_VERSION, 'settings': settings, 'files': {}}
+        self.data = data
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get('version') == MANIFEST_VERSION else None
+
+    @property
+    def files(self):
+        return self.data['files']
+
+    def part_dir(self, entry):
+        return os.path.join(self.directory, entry['key'])
+
+    def save(self):
+        """マニフェストを書き出す（書き込み途中で止まっても前回の記録が残るよう置き換えで保存）"""
+        self.data['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        text = json.dumps(self.data, ensure_ascii=False, indent=2).encode('utf-8')
+        _write_atomic(self.path, lambda f: f.write(text))
+
+
+def _new_entry(input_path, output_path):
+    source = os.path.abspath(input_path)
+    return {
+        # part ファイルのディレクトリ名（入力のパスから決める）
+        'key': hashlib.blake2b(source.encode('utf-8'), digest_size=8).hexdigest(),
+        'output': os.path.abspath(output_path),
+        'source': source_stamp(input_path),
+        'status': 'running',
+        'parts': [],
+    }
+
+
+def _valid_parts(manifest, entry):
+    """記録どおりに残っている先頭からの part ファイル（欠けた・壊れた part 以降はやり直す）"""
+    parts = []
+    for part in entry['parts']:
+        path = os.path.join(manifest.part_dir(entry), part['name'])
+        if not os.path.exists(path) or os.path.getsize(path) != part['bytes'] or file_checksum(path) != part['checksum']:
+            break
+        parts.append(part)
+    return parts
+
+
+def _output_intact(entry):
+    """完了した出力ファイルが記録したときのまま残っているか"""
+    output = entry.get('result')
+    if output is None or not os.path.exists(entry['output']):
+        return False
+    info = os.stat(entry['output'])
+    return info.st_size == output['bytes'] and info.st_mtime_ns == output['mtime_ns']
+
+
+def _write_part(manifest, entry, chunks, output_options, position):
+    """チャンク列を次の part ファイルに書き出して記録に加える（position() は書き終えたあとの入力の位置の記録）"""
+    index = len(entry['parts'])
+    name = f"part-{index:05d}.csv"
+    options = dict(output_options)
+    if index > 0:
+        # 2つ目以降の part はヘッダーと BOM を付けない（つなげると1つのCSVになる）
+        options['header'] = False
+        if options.get('encoding') == 'utf-8-sig':
+            options['encoding'] = 'utf-8'
+    rows = 0
+
+    def write(f):
+        nonlocal rows
+        rows = write_csv(chunks, f, **options)
+
+    with stage('checkpoint_part') as fields:
+        size, checksum = _write_atomic(os.path.join(manifest.part_dir(entry), name), write)
+        fields.update(rows=rows, part=index)
+    entry['parts'].append({'name': name, 'rows': rows, 'bytes': size, 'checksum': checksum, **position()})
+    manifest.save()
+
+
+def _counted(chunks, counter):
+    for chunk in chunks:
+        counter['chunks'] += 1
+        counter['rows'] += len(chunk)
+        yield chunk
+
+
+def _write_segments(manifest, entry, config, input_path, chunksize, header_row, engine, commit_chunks,
+                    output_options, progress):
+    """入力ファイルをバイト範囲に区切って part ファイルに書き出す（最後の part の終わりの位置から続きを読む）"""
+    size = os.path.getsize(input_path)
+    head_end = header_end(input_path, header_row)
+    with open(input_path, 'rb') as f:
+        header = f.read(head_end)
+    part_bytes = _part_bytes(input_path, head_end, commit_chunks * chunksize)
+    start = entry['parts'][-1]['end'] if entry['parts'] else head_end
+    while start < size or not entry['parts']:
+        end = record_end(input_path, start, start + part_bytes, size)
+        counter = {'chunks': 0, 'rows': 0}
+        with SegmentReader(input_path, header, start, end) as source:
+            chunks = timed_iter('read_csv', iter_csv_chunks(source, chunksize, header_row, entry['encoding'], engine))
+            if progress is not None:
+                chunks = progress(chunks)
+            _write_part(manifest, entry, stream_template(config, _counted(chunks, counter)), output_options,
+                        lambda: {'start': start, 'end': end, 'input_rows': counter['rows']})
+        start = end
+
+
+def _write_chunk_groups(manifest, entry, config, input_path, chunksize, header_row, encoding, engine, commit_chunks,
+                        output_options, progress):
+    """途中の位置から読めない入力（圧縮ファイル・ZIP）を commit_chunks 個ずつ part ファイルに書き出す
+
+    記録済みのチャンクは読み込み直して変換・書き出しをせずに読み飛ばす。
+    """
+    resumed = sum(part['chunks'] for part in entry['parts'])
+    counter = {'chunks': resumed, 'rows': 0}
+    chunks = iter_csv_chunks(input_path, chunksize, header_row, encoding, engine)
+    chunks = timed_iter('read_csv', itertools.islice(chunks, resumed, None))
+    if progress is not None:
+        chunks = progress(chunks)
+    chunks = _counted(chunks, counter)
+    while True:
+        before = dict(counter)
+        group = list(itertools.islice(chunks, commit_chunks))
+        if not group and entry['parts']:
+            break
+        _write_part(manifest, entry, stream_template(config, group), output_options,
+                    lambda: {'chunks': counter['chunks'] - before['chunks'],
+                             'input_rows': counter['rows'] - before['rows']})
+        if not group:
+            break
+
+
+def _assemble(manifest, entry):
+    """part ファイルを順につないで出力ファイルを作る（一時ファイルに書いてから置き換える）"""
+    def write(f):
+        for part in entry['parts']:
+            with open(os.path.join(manifest.part_dir(entry), part['name']), 'rb') as src:
+                shutil.copyfileobj(src, f, _COPY_BLOCK_SIZE)
+
+    with stage('checkpoint_assemble', rows=sum(part['rows'] for part in entry['parts'])):
+        size, checksum = _write_atomic(entry['output'], write)
+    return {'bytes': size, 'checksum': checksum, 'mtime_ns': os.stat(entry['output']).st_mtime_ns}
+
+
+def apply_to_file(config, input_path, output_path, manifest, chunksize=DEFAULT_CHUNKSIZE, header_row=0,
+                  encoding=None, output_options=None, engine=DEFAULT_ENGINE, commit_chunks=DEFAULT_COMMIT_CHUNKS,
+                  progress=None):
+    """途中経過を manifest に記録しながらテンプレートをCSVファイルに適用して output_path に書き出す
+
+    入力チャンク commit_chunks 個分ほどのバイト範囲（行の区切りにそろえる）ごとに part ファイルを書き、
+    再実行では最後の part の終わりのバイト位置から読み始める（処理済みの部分は読み込まない）。
+    圧縮ファイル・ZIP はチャンク数で記録し、記録済みのチャンクを読み飛ばして続きから処理する。
+    入力ファイルが変わっていればそのファイルは最初から、出力まで終わっていれば何もしない。
+    重複削除・集計を含むテンプレートは以前の行に依存するので、ファイル単位でだけ再開する。
+    結果は {'status': 'done'（今回完了）/'skipped'（完了済み）, 'rows'（出力行数）, 'resumed_rows'（読み飛ばした入力行数）}。
+    """
+    output_options = output_options or csv_options()
+    key = os.path.abspath(input_path)
+    entry = manifest.files.get(key)
+    if (entry is None or entry['source'] != source_stamp(input_path)
+            or entry['output'] != os.path.abspath(output_path)):
+        if entry is not None:
+            shutil.rmtree(manifest.part_dir(entry), ignore_errors=True)
+        entry = manifest.files[key] = _new_entry(input_path, output_path)
+    elif entry['status'] == 'done' and _output_intact(entry):
+        return {'status': 'skipped', 'rows': entry['result']['rows'], 'resumed_rows': 0}
+
+    resumable = supports_incremental(config)
+    seekable = decompress.detect(input_path) is None
+    entry['parts'] = _valid_parts(manifest, entry) if resumable else []
+    entry['status'] = 'running'
+    if seekable and entry.get('encoding') is None:
+        # 続きから読むときも同じ文字コードで読む（途中の範囲だけでは判定できない）
+        entry['encoding'] = encoding or detect_encoding(input_path)
+    os.makedirs(manifest.part_dir(entry), exist_ok=True)
+    manifest.save()
+
+    resumed = sum(part['input_rows'] for part in entry['parts'])
+    if resumable and seekable:
+        _write_segments(manifest, entry, config, input_path, chunksize, header_row, engine, commit_chunks,
+                        output_options, progress)
+    elif resumable:
+        _write_chunk_groups(manifest, entry, config, input_path, chunksize, header_row, encoding, engine,
+                            commit_chunks, output_options, progress)
+    else:
+        counter = {'chunks': 0, 'rows': 0}
+        chunks = timed_iter('read_csv', iter_csv_chunks(input_path, chunksize, header_row,
+                                                        entry.get('encoding', encoding), engine))
+        if progress is not None:
+            chunks = progress(chunks)
+        _write_part(manifest, entry, stream_template(config, _counted(chunks, counter)), output_options,
+                    lambda: {'input_rows': counter['rows']})
+
+    result = _assemble(manifest, entry)
+    result['rows'] = sum(part['rows'] for part in entry['parts'])
+    input_rows = sum(part['input_rows'] for part in entry['parts'])
+    entry.update(status='done', result=result, input_rows=input_rows, parts=[])
+    manifest.save()
+    shutil.rmtree(manifest.part_dir(entry), ignore_errors=True)
+    return {'status': 'done', 'rows': result['rows'], 'resumed_rows': resumed}
@@ -0,0 +1,192 @@
+"""
+CSV Organizer Pro 列の検索と並び順
+列数の多いファイル（数千列）でも列の検索・一括選択・並べ替えが列数に比例して遅くならないようにする
+（列名の部分文字列インデックスと、連結リストによる列順序）
+"""
+
+import fnmatch
+import re
+
+# 部分文字列インデックスに登録する文字列の最大長（これより長い検索語は候補を絞ってから照合）
+NGRAM_SIZE = 3
+
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+def _normalize(text):
+    return text.casefold()
+
+
+class ColumnIndex:
+    """列名の部分文字列検索インデックス
+
+    列名に含まれる長さ 1〜NGRAM_SIZE の文字列ごとに列番号の集合を持ち、
+    検索語の長さが NGRAM_SIZE 以下なら1回の参照、それより長ければ候補の積集合を照合する。
+    大文字・小文字は区別しない。
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._names = [_normalize(str(col)) for col in self.columns]
+        self._postings = {}
+        for i, name in enumerate(self._names):
+            for size in range(1, NGRAM_SIZE + 1):
+                for start in range(len(name) - size + 1):
+                    self._postings.setdefault(name[start:start + size], set()).add(i)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.columns)
+
+    def _positions(self, text):
+        text = _normalize(text)
+        if not text:
+            return range(len(self.columns))
+        if len(text) <= NGRAM_SIZE:
+            return sorted(self._postings.get(text, ()))
+        grams = [text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)]
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings)
+        return sorted(i for i in candidates if text in self._names[i])
+
+    def search(self, text):
+        """列名に text を含む列（元の列順）。* ? [ を含む場合はワイルドカードとして列名全体と照合する"""
+        if text not in self._cache:
+            if _GLOB_CHARS.search(text):
+                pattern = re.compile(fnmatch.translate(_normalize(text)))
+                hits = [col for col, name in zip(self.columns, self._names) if pattern.match(name)]
+            else:
+                hits = [self.columns[i] for i in self._positions(text)]
+            self._cache[text] = hits
+        return self._cache[text]
+
+
+class ColumnOrder:
+    """列の並び順（双方向連結リスト）
+
+    追加・削除・入れ替え・先頭/末尾への移動は列数によらず一定時間で行う。
+    並び順はリストと同じように反復・len()・in で扱え、list() でリストに戻せる。
+    search_index() の検索インデックスは列の追加・削除があったときだけ作り直す（並べ替えでは作り直さない）。
+    """
+
+    def __init__(self, columns=()):
+        self._prev = {}
+        self._next = {}
+        self._head = None
+        self._tail = None
+        self._snapshot = None
+        self._index = None
+        for col in columns:
+            self.append(col)
+
+    def __len__(self):
+        return len(self._next)
+
+    def __repr__(self):
+        return f"ColumnOrder({self.to_list()!r})"
+
+    def __contains__(self, col):
+        return col in self._next
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def to_list(self):
+        """並び順のリスト（変更が無ければ前回のリストを再利用）"""
+        if self._snapshot is None:
+            order = []
+            col = self._head
+            while col is not None:
+                order.append(col)
+                col = self._next[col]
+            self._snapshot = order
+        return self._snapshot
+
+    def search_index(self):
+        """列名の検索インデックス（ColumnIndex）"""
+        if self._index is None:
+            self._index = ColumnIndex(self.to_list())
+        return self._index
+
+    def _changed(self, members=False):
+        self._snapshot = None
+        if members:
+            self._index = None
+
+    def _unlink(self, col):
+        prev, nxt = self._prev[col], self._next[col]
+        if prev is None:
+            self._head = nxt
+        else:
+            self._next[prev] = nxt
+        if nxt is None:
+            self._tail = prev
+        else:
+            self._prev[nxt] = prev
+
+    def _link_after(self, col, prev):
+        nxt = self._head if prev is None else self._next[prev]
+        self._prev[col] = prev
+        self._next[col] = nxt
+        if prev is None:
+            self._head = col
+        else:
+            self._next[prev] = col
+        if nxt is None:
+            self._tail = col
+        else:
+            self._prev[nxt] = col
+
+    def append(self, col):
+        """末尾に追加（既にあれば何もしない）"""
+        if col in self._next:
+            return
+        self._link_after(col, self._tail)
+        self._changed(members=True)
+
+    def remove(self, col):
+        self._unlink(col)
+        del self._prev[col], self._next[col]
+        self._changed(members=True)
+
+    def move_before(self, col, target):
+        """col を target の直前に移動"""
+        if col == target:
+            return
+        self._unlink(col)
+        self._link_after(col, self._prev[target])
+        self._changed()
+
+    def move_after(self, col, target):
+        """col を target の直後に移動"""
+        if col == target:
+            return
+        self._unlink(col)
+        self._link_after(col, target)
+        self._changed()
+
+    def move_to_front(self, col):
+        if self._head != col:
+            self._unlink(col)
+            self._link_after(col, None)
+            self._changed()
+
+    def move_to_back(self, col):
+        if self._tail != col:
+            self._unlink(col)
+            self._link_after(col, self._tail)
+            self._changed()
+
+    def previous(self, col, members=None):
+        """col より前で members に含まれる直近の列（members が None なら直前の列）"""
+        col = self._prev[col]
+        while col is not None and members is not None and col not in members:
+            col = self._prev[col]
+        return col
+
+    def following(self, col, members=None):
+        """col より後で members に含まれる直近の列（members が None なら直後の列）"""
+        col = self._next[col]
+        while col is not None and members is not None and col not in members:
+            col = self._next[col]
+        return col
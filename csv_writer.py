@@ -0,0 +1,139 @@
+"""
+CSV Organizer Pro CSV書き出し
+文字コード・改行・クォートを指定し、チャンクごとに逐次エンコードして書き出す
+"""
+
+import csv
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+from instrumentation import stage
+
+# 文字コードと表示名
+ENCODINGS = {
+    'utf-8-sig': 'UTF-8 (BOM付き・Excel向け)',
+    'utf-8': 'UTF-8 (BOMなし)',
+    'cp932': 'Shift-JIS (CP932)',
+}
+
+# コマンドラインで指定する改行コードの名前
+LINE_TERMINATOR_NAMES = {'crlf': '\r\n', 'lf': '\n'}
+
+# 文字コードで表現できない文字の扱い
+ERROR_POLICIES = {
+    'strict': 'エラーにする',
+    'replace': '「?」に置換',
+    'xmlcharrefreplace': '&#番号; に置換',
+    'ignore': '削除する',
+}
+
+LINE_TERMINATORS = {
+    '\r\n': 'CRLF (Windows)',
+    '\n': 'LF (Mac/Linux)',
+}
+
+QUOTING = {
+    'minimal': ('必要なときだけ', csv.QUOTE_MINIMAL),
+    'all': ('すべての値', csv.QUOTE_ALL),
+    'nonnumeric': ('数値以外', csv.QUOTE_NONNUMERIC),
+}
+
+# 1回の to_csv で書き出す行数
+DEFAULT_WRITE_CHUNK = 50_000
+# これを超えるとメモリからディスクへ移るスプール上限
+DEFAULT_SPOOL_MEMORY = 16 * 1024 * 1024
+
+
+def csv_options(encoding='utf-8-sig', errors='strict', lineterminator=os.linesep, quoting='minimal'):
+    """書き出し設定をまとめた辞書を作成"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"未対応の文字コードです: {encoding}")
+    if errors not in ERROR_POLICIES:
+        raise ValueError(f"未対応のエラー処理です: {errors}")
+    if quoting not in QUOTING:
+        raise ValueError(f"未対応のクォート指定です: {quoting}")
+    return {'encoding': encoding, 'errors': errors, 'lineterminator': lineterminator, 'quoting': quoting}
+
+
+def _iter_slices(data, chunksize):
+    if isinstance(data, pd.DataFrame):
+        if len(data) == 0:
+            yield data
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start + chunksize]
+    else:
+        yield from data
+
+
+def write_csv(data, target, encoding='utf-8-sig', errors='strict', lineterminator=os.linesep,
+              quoting='minimal', header=True, mode='w', chunksize=DEFAULT_WRITE_CHUNK, progress=None):
+    """DataFrame またはチャンク列をCSVとして書き出し、書き出した行数を返す
+
+    target はファイルパスかバイナリのファイルオブジェクト。
+    文字列全体やバイト列全体をメモリに作らず、チャンクごとにエンコードして書き込む。
+    progress を渡すとチャンクごとに書き出し済みの行数で呼び出す。
+    """
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, mode + 'b') as f:
+            return write_csv(data, f, encoding, errors, lineterminator, quoting, header, mode, chunksize, progress)
+
+    # 既存ファイルへの追記ではヘッダーと BOM を重ねて書かない
+    appending = mode == 'a' and target.seekable() and target.tell() > 0
+    if appending and encoding == 'utf-8-sig':
+        encoding = 'utf-8'
+    write_header = header and not appending
+
+    text = io.TextIOWrapper(target, encoding=encoding, errors=errors, newline='')
+    rows = 0
+    try:
+        for chunk in _iter_slices(data, chunksize):
+            with stage('to_csv', rows=len(chunk)):
+                chunk.to_csv(text, index=False, header=write_header,
+                             lineterminator=lineterminator, quoting=QUOTING[quoting][1])
+            write_header = False
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+        text.flush()
+    except UnicodeEncodeError as e:
+        raise ValueError(
+            f"{ENCODINGS.get(encoding, encoding)} で表現できない文字があります: "
+            f"{e.object[e.start:e.end]!r}（エラー時の処理を「置換」にすると出力できます）"
+        ) from None
+    finally:
+        text.detach()
+    return rows
+
+
+def spooled_csv(data, max_memory=DEFAULT_SPOOL_MEMORY, **options):
+    """CSVを一時ファイル（小さいうちはメモリ）に書き出して先頭に戻したファイルを返す"""
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    write_csv(data, spool, **options)
+    spool.seek(0)
+    return spool
+
+
+def split_file_name(base_name, index, total_files):
+    """分割ファイルのファイル名（1ファイルのみなら連番なし）"""
+    if total_files == 1:
+        return f"{base_name}.csv"
+    return f"{base_name}_part{index + 1:03d}_of_{total_files:03d}.csv"
+
+
+def write_split_zip(df, target, max_rows_per_file, base_name, progress=None, **options):
+    """指定行数ごとに分割したCSVを1つのZIPへ直接書き込み、ファイル数を返す"""
+    import zipfile  # 分割出力のときだけ読み込む
+
+    total_rows = len(df)
+    total_files = max(1, (total_rows + max_rows_per_file - 1) // max_rows_per_file)
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(total_files):
+            offset = i * max_rows_per_file
+            split_df = df.iloc[offset:min(offset + max_rows_per_file, total_rows)]
+            file_progress = None if progress is None else (lambda rows, offset=offset: progress(offset + rows))
+            with zip_file.open(split_file_name(base_name, i, total_files), 'w', force_zip64=True) as member:
+                write_csv(split_df, member, progress=file_progress, **options)
+    return total_files
@@ -0,0 +1,210 @@
+"""
+CSV Organizer Pro 圧縮ファイルの展開
+先頭のバイト列（マジックナンバー）で圧縮形式を判定し、展開しながら読むストリームを返す
+（gzip・bzip2・xz・zstd は1ファイル、ZIP は中のCSVファイルを複数ファイルの入力として扱う。
+展開した内容をまとめてメモリやディスクに置かない）
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 圧縮形式とファイル先頭のバイト列
+MAGIC_NUMBERS = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+    ('zip', b'PK\x03\x04'),
+    ('zip', b'PK\x05\x06'),  # 空のZIP
+]
+
+# 圧縮形式ごとの拡張子（展開後のファイル名を求めるときに取り除く）
+SUFFIXES = {
+    'gzip': ('.gz', '.gzip'),
+    'bz2': ('.bz2',),
+    'xz': ('.xz',),
+    'zstd': ('.zst', '.zstd'),
+}
+
+# 中身が ZIP 形式の Excel ファイル（ZIP として展開しない）
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm')
+
+# アップロードで受け付ける圧縮ファイルの拡張子
+UPLOAD_TYPES = ['gz', 'zst', 'bz2', 'xz', 'zip']
+
+# ZIP の中で読み込むファイルの拡張子
+ZIP_MEMBER_SUFFIX = '.csv'
+
+# 並列に読むとき、1ファイルあたり先読みしておくチャンク数
+DEFAULT_PREFETCH = 2
+
+_MAGIC_SIZE = max(len(magic) for _, magic in MAGIC_NUMBERS)
+
+
+def detect(source, file_name=None):
+    """パスまたはシーク可能なバイナリのファイルオブジェクトの圧縮形式（圧縮されていなければ None）
+
+    ファイルオブジェクトは読む前の位置に戻す。ファイル名（既定: パス）が Excel なら ZIP 形式でも None。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        file_name = file_name or os.fspath(source)
+        with open(source, 'rb') as f:
+            head = f.read(_MAGIC_SIZE)
+    else:
+        position = source.tell()
+        head = source.read(_MAGIC_SIZE)
+        source.seek(position)
+    for kind, magic in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            if kind == 'zip' and file_name and file_name.lower().endswith(EXCEL_SUFFIXES):
+                return None
+            return kind
+    return None
+
+
+def inner_name(file_name):
+    """圧縮の拡張子を除いたファイル名（data.csv.gz -> data.csv。ZIP などはそのまま）"""
+    lower = file_name.lower()
+    for suffixes in SUFFIXES.values():
+        for suffix in suffixes:
+            if lower.endswith(suffix):
+                return file_name[:-len(suffix)]
+    return file_name
+
+
+def _open_zstd(source):
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    if zstandard is not None:
+        if isinstance(source, (str, os.PathLike)):
+            return zstandard.ZstdDecompressor().stream_reader(open(source, 'rb'), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(source, closefd=False)
+    # zstandard が無ければ pyarrow の展開を使う
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ValueError("zstd の展開には zstandard（pip install zstandard）または pyarrow が必要です") from e
+    if isinstance(source, (str, os.PathLike)):
+        return pa.input_stream(os.fspath(source), compression='zstd')
+    # pyarrow のストリームは閉じると元のファイルも閉じるので、閉じない読み口を挟む
+    return pa.CompressedInputStream(pa.PythonFile(_KeepOpen(source), mode='r'), 'zstd')
+
+
+class _KeepOpen(io.RawIOBase):
+    """閉じても元のファイルオブジェクトは閉じない読み込み用ラッパー"""
+
+    def __init__(self, source):
+        super().__init__()
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_stream(source, kind):
+    """パスまたはバイナリのファイルオブジェクトを展開しながら読むストリーム
+
+    パスを渡した場合はストリームを閉じるとファイルも閉じる（ファイルオブジェクトは閉じない）。
+    """
+    if kind == 'gzip':
+        return gzip.open(source, 'rb')
+    if kind == 'bz2':
+        return bz2.open(source, 'rb')
+    if kind == 'xz':
+        return lzma.open(source, 'rb')
+    if kind == 'zstd':
+        return _open_zstd(source)
+    raise ValueError(f"未対応の圧縮形式です: {kind}")
+
+
+def zip_members(source):
+    """ZIP の中のCSVファイル（ZipInfo）をアーカイブ内の順に返す（フォルダ・__MACOSX・隠しファイルは除く）"""
+    import zipfile  # ZIP入力のときだけ読み込む
+    with zipfile.ZipFile(source) as archive:
+        return [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+            and info.filename.lower().endswith(ZIP_MEMBER_SUFFIX)
+        ]
+
+
+def open_member(source, name):
+    """ZIP の中のファイルを展開しながら読むストリーム（閉じるとZIPファイルも閉じる）
+
+    呼ぶたびに ZIP を開き直すので、同じ ZIP の複数のファイルを別々のスレッドで読める。
+    """
+    import zipfile
+    # ZipFile を閉じても、開いたメンバーを閉じるまでファイルは開いたままになる
+    with zipfile.ZipFile(source) as archive:
+        return archive.open(name)
+
+
+_DONE = object()
+
+
+def iter_parallel(producers, workers=None, prefetch=DEFAULT_PREFETCH):
+    """producers（呼ぶとチャンクの反復子を返す関数）を並列に読み、producers の順にチャンクを返す
+
+    同時に読むのは workers 個まで（既定: CPU 数）、読み終わっていない入力の先読みは1つあたり prefetch チャンクまで。
+    途中で例外が起きたらその入力の順番で送出し、反復をやめると残りの読み込みも止める。
+    """
+    producers = list(producers)
+    if not producers:
+        return
+    queues = [queue.Queue(prefetch) for _ in producers]
+    stop = threading.Event()
+
+    def put(items, item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(producer, items):
+        try:
+            chunks = producer()
+            try:
+                for chunk in chunks:
+                    if not put(items, (chunk, None)):
+                        return
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+        except BaseException as e:
+            put(items, (_DONE, e))
+        else:
+            put(items, (_DONE, None))
+
+    pool = ThreadPoolExecutor(max_workers=min(len(producers), workers or os.cpu_count() or 1))
+    try:
+        for producer, items in zip(producers, queues):
+            pool.submit(run, producer, items)
+        for items in queues:
+            while True:
+                chunk, error = items.get()
+                if error is not None:
+                    raise error
+                if chunk is _DONE:
+                    break
+                yield chunk
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,132 @@
+"""
+CSV Organizer Pro 重複行削除
+行ハッシュによる重複判定（チャンク処理・メモリ上限・ディスク退避対応）
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# メモリ上に保持するハッシュ数の上限（uint64 1件 = 8バイト）
+DEFAULT_MAX_KEYS_IN_MEMORY = 5_000_000
+
+
+def row_hashes(df, subset=None):
+    """行ごとの64bitハッシュを計算"""
+    target = df if not subset else df[list(subset)]
+    return pd.util.hash_pandas_object(target, index=False).to_numpy(dtype=np.uint64)
+
+
+def _contains(sorted_keys, hashes):
+    """ソート済みハッシュ配列に含まれるかを一括判定"""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    idx = np.searchsorted(sorted_keys, hashes)
+    idx[idx >= len(sorted_keys)] = len(sorted_keys) - 1
+    return sorted_keys[idx] == hashes
+
+
+class SeenHashSet:
+    """既出ハッシュの集合（上限を超えた分はソート済みファイルとしてディスクへ退避）"""
+
+    def __init__(self, max_keys_in_memory=DEFAULT_MAX_KEYS_IN_MEMORY, spill_dir=None):
+        self.max_keys_in_memory = max_keys_in_memory
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._memory = np.empty(0, dtype=np.uint64)
+        self._runs = []
+
+    @property
+    def spilled_runs(self):
+        return len(self._runs)
+
+    def __len__(self):
+        return len(self._memory) + sum(len(run) for run in self._runs)
+
+    def filter_new(self, hashes):
+        """未出のハッシュだけを True とするマスクを返し、集合に登録"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        # チャンク内の重複
+        keep = ~pd.Series(hashes).duplicated(keep='first').to_numpy()
+        # 既出（メモリ・ディスク両方）
+        seen = _contains(self._memory, hashes)
+        for run in self._runs:
+            seen |= _contains(run, hashes)
+        keep &= ~seen
+
+        new_keys = hashes[keep]
+        if len(new_keys):
+            self._memory = np.union1d(self._memory, new_keys)
+            if len(self._memory) > self.max_keys_in_memory:
+                self._spill()
+        return keep
+
+    def _spill(self):
+        """メモリ上のハッシュをソート済みファイルに書き出してメモリを解放"""
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="csv_dedupe_", dir=self._spill_root)
+        path = os.path.join(self._spill_dir, f"run_{len(self._runs):05d}.npy")
+        np.save(path, self._memory)
+        self._runs.append(np.load(path, mmap_mode='r'))
+        self._memory = np.empty(0, dtype=np.uint64)
+
+    def close(self):
+        """退避ファイルを削除"""
+        self._runs = []
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _make_stats(rows_in, rows_out, seconds, spilled_runs):
+    return {
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'rows_removed': rows_in - rows_out,
+        'seconds': seconds,
+        'rows_per_sec': rows_in / seconds if seconds > 0 else 0.0,
+        'spilled_runs': spilled_runs,
+    }
+
+
+def dedupe_chunks(chunks, subset=None, max_keys_in_memory=DEFAULT_MAX_KEYS_IN_MEMORY,
+                  spill_dir=None, stats=None):
+    """チャンクごとに重複行を除いて返すジェネレーター
+
+    チャンク間で列の型が揺れるとハッシュが一致しないため、
+    チャンク読み込みは dtype=str で行うこと。
+    stats に辞書を渡すと終了時に件数とスループットが書き込まれる。
+    """
+    start = time.perf_counter()
+    rows_in = rows_out = 0
+    with SeenHashSet(max_keys_in_memory, spill_dir) as seen:
+        for chunk in chunks:
+            rows_in += len(chunk)
+            keep = seen.filter_new(row_hashes(chunk, subset))
+            result = chunk[keep]
+            rows_out += len(result)
+            yield result
+        spilled_runs = seen.spilled_runs
+    if stats is not None:
+        stats.update(_make_stats(rows_in, rows_out, time.perf_counter() - start, spilled_runs))
+
+
+def dedupe_dataframe(df, subset=None, max_keys_in_memory=DEFAULT_MAX_KEYS_IN_MEMORY):
+    """DataFrameから重複行を削除し、(結果, 統計) を返す"""
+    if subset:
+        missing = [col for col in subset if col not in df.columns]
+        if missing:
+            raise ValueError(f"重複判定の列が見つかりません: {', '.join(missing)}")
+    stats = {}
+    parts = list(dedupe_chunks([df], subset, max_keys_in_memory, stats=stats))
+    return parts[0].reset_index(drop=True), stats
@@ -0,0 +1,130 @@
+"""
+CSV Organizer Pro Excel書き出し
+openpyxl の write_only モードでチャンクごとに行を書き出し、ブック全体をメモリに作らない
+（Excel の行数上限を超える分は新しいシート、または新しいファイルに続けて書く）
+"""
+
+import os
+
+import pandas as pd
+
+from instrumentation import stage
+
+# Excel の1シートあたりの最大行数（ヘッダー行を含む）
+EXCEL_MAX_ROWS = 1_048_576
+
+# 1回に変換して書き出す行数
+DEFAULT_EXCEL_CHUNK = 10_000
+
+# 行数上限を超えたときの続け方
+ROLLOVER_MODES = {
+    'sheet': '同じファイルの新しいシート',
+    'file': '新しいファイル',
+}
+
+# Excel のシート名の最大文字数
+_SHEET_NAME_LENGTH = 31
+
+
+def _iter_slices(data, chunksize):
+    if isinstance(data, pd.DataFrame):
+        if len(data) == 0:
+            yield data
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start:start + chunksize]
+    else:
+        yield from data
+
+
+def sheet_name(base, index):
+    """index 番目（0から）のシート名（2枚目以降は 名前_2, 名前_3 ...）"""
+    if index == 0:
+        return base[:_SHEET_NAME_LENGTH]
+    suffix = f"_{index + 1}"
+    return base[:_SHEET_NAME_LENGTH - len(suffix)] + suffix
+
+
+def rollover_path(path, index):
+    """index 番目（0から）の出力ファイルのパス（2つ目以降は 名前_002.xlsx ...）"""
+    if index == 0:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{index + 1:03d}{ext}"
+
+
+def _cell_rows(chunk, illegal):
+    """openpyxl に渡す行（欠損は空セル、Excel で使えない制御文字は除く）"""
+    frame = chunk.astype(object).where(chunk.notna(), None)
+    for row in frame.itertuples(index=False, name=None):
+        yield [illegal.sub('', value) if isinstance(value, str) else value for value in row]
+
+
+class _Book:
+    """書き込み中のブック（write_only）とシートの行数"""
+
+    def __init__(self, openpyxl, target):
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.target = target
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def add_sheet(self, title, header):
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(header)
+        self.sheet_rows = 0
+
+    def save(self):
+        self.workbook.save(self.target)
+
+
+def write_excel(data, target, rollover='sheet', base_sheet_name='Sheet1', max_rows=EXCEL_MAX_ROWS,
+                chunksize=DEFAULT_EXCEL_CHUNK, progress=None):
+    """DataFrame またはチャンク列を .xlsx に書き出し、(行数, [(ファイル, シート名, 行数), ...]) を返す
+
+    target はファイルパスかバイナリのファイルオブジェクト。1シートに入りきらない行は
+    rollover='sheet' なら同じファイルの新しいシートに、'file' なら新しいファイル（パス指定時のみ）に続けて書く。
+    progress を渡すとチャンクごとに書き出し済みの行数で呼び出す。
+    """
+    if rollover not in ROLLOVER_MODES:
+        raise ValueError(f"未対応の分割方法です: {rollover}")
+    if rollover == 'file' and not isinstance(target, (str, os.PathLike)):
+        raise ValueError("ファイルを分けて書き出すには出力先のパスを指定してください")
+    import openpyxl  # Excel出力のときだけ読み込む
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    rows_per_sheet = max_rows - 1
+    book = None
+    header = None
+    parts = []
+    rows = 0
+
+    def next_sheet():
+        nonlocal book
+        if book is None or rollover == 'file':
+            if book is not None:
+                book.save()
+            book = _Book(openpyxl, rollover_path(target, len(parts)) if rollover == 'file' else target)
+        index = 0 if rollover == 'file' else len(parts)
+        book.add_sheet(sheet_name(base_sheet_name, index), header)
+        parts.append([book.target, book.sheet.title, 0])
+
+    for chunk in _iter_slices(data, chunksize):
+        if header is None:
+            header = [str(col) for col in chunk.columns]
+            next_sheet()
+        with stage('to_excel', rows=len(chunk)):
+            for values in _cell_rows(chunk, ILLEGAL_CHARACTERS_RE):
+                if book.sheet_rows == rows_per_sheet:
+                    next_sheet()
+                book.sheet.append(values)
+                book.sheet_rows += 1
+                parts[-1][2] += 1
+        rows += len(chunk)
+        if progress is not None:
+            progress(rows)
+    if book is None:
+        header = []
+        next_sheet()
+    with stage('save_excel'):
+        book.save()
+    return rows, [tuple(part) for part in parts]
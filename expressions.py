@@ -0,0 +1,354 @@
+"""
+CSV Organizer Pro 計算列
+安全な式（四則演算・比較・関数呼び出しのみ）を列単位のベクトル演算に変換して評価
+"""
+
+import ast
+import operator
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from numeric import as_integer_if_whole, to_numeric
+
+# `列 名` のように空白や記号を含む列名はバッククォートで囲む
+_QUOTED_COLUMN = re.compile(r'`([^`]+)`')
+
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+
+class ExpressionError(ValueError):
+    """式の構文・列名・関数の誤り"""
+
+
+# ---- 値の変換（列は pd.Series、定数は Python のスカラー） ----
+
+def _is_series(value):
+    return isinstance(value, pd.Series)
+
+
+def _num(value):
+    if _is_series(value):
+        return to_numeric(value)
+    if isinstance(value, (bool, np.bool_)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _text(value):
+    if _is_series(value):
+        if value.dtype == object or pd.api.types.is_string_dtype(value.dtype):
+            return value.fillna('').astype(str)
+        if pd.api.types.is_float_dtype(value.dtype):
+            value = as_integer_if_whole(value)
+        return value.astype(object).where(value.notna(), '').astype(str)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    return str(value)
+
+
+def _is_numeric_value(value):
+    if _is_series(value):
+        return (pd.api.types.is_numeric_dtype(value.dtype)
+                and not pd.api.types.is_bool_dtype(value.dtype))
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _as_series(value, text=True):
+    """文字列メソッド用に Series 化（定数は長さ1の Series）"""
+    if _is_series(value):
+        return _text(value) if text else value
+    return pd.Series([_text(value) if text else value])
+
+
+def _unwrap(result, original):
+    """定数だけの呼び出しならスカラーに戻す"""
+    if _is_series(original):
+        return result
+    return result.iloc[0]
+
+
+# ---- 関数 ----
+
+def _upper(x):
+    return _unwrap(_as_series(x).str.upper(), x)
+
+
+def _lower(x):
+    return _unwrap(_as_series(x).str.lower(), x)
+
+
+def _strip(x):
+    return _unwrap(_as_series(x).str.strip(), x)
+
+
+def _length(x):
+    return _unwrap(_as_series(x).str.len(), x)
+
+
+def _substr(x, start, length=None):
+    start = int(_num(start))
+    stop = None if length is None else start + int(_num(length))
+    return _unwrap(_as_series(x).str.slice(start, stop), x)
+
+
+def _replace(x, old, new):
+    return _unwrap(_as_series(x).str.replace(_text(old), _text(new), regex=False), x)
+
+
+def _concat(*values):
+    parts = [_text(value) for value in values]
+    result = parts[0]
+    for part in parts[1:]:
+        result = result + part
+    return result
+
+
+def _round(x, digits=0):
+    return _num(x).round(int(_num(digits))) if _is_series(x) else round(_num(x), int(_num(digits)))
+
+
+def _abs(x):
+    return abs(_num(x))
+
+
+def _date(x, out_format, in_format=None):
+    series = _as_series(x)
+    parsed = pd.to_datetime(series, format=None if in_format is None else _text(in_format),
+                            errors='coerce')
+    return _unwrap(parsed.dt.strftime(_text(out_format)).fillna(''), x)
+
+
+def _iif(condition, if_true, if_false):
+    if not _is_series(condition):
+        return if_true if condition else if_false
+    cond = condition.fillna(False).astype(bool)
+    if _is_numeric_value(if_true) and _is_numeric_value(if_false):
+        true_values, false_values = _num(if_true), _num(if_false)
+    else:
+        true_values, false_values = _text(if_true), _text(if_false)
+    return pd.Series(np.where(cond, true_values, false_values), index=condition.index)
+
+
+def _coalesce(*values):
+    result = _text(values[0])
+    for value in values[1:]:
+        text = _text(value)
+        if _is_series(result):
+            result = result.where(result != '', text)
+        elif result == '':
+            result = text
+    return result
+
+
+# 関数名: (最小引数, 最大引数, 実装, 説明)
+FUNCTIONS = {
+    'upper': (1, 1, _upper, "大文字に変換"),
+    'lower': (1, 1, _lower, "小文字に変換"),
+    'strip': (1, 1, _strip, "前後の空白を削除"),
+    'len': (1, 1, _length, "文字数"),
+    'substr': (2, 3, _substr, "部分文字列 substr(列, 開始位置(0から), 文字数)"),
+    'replace': (3, 3, _replace, "文字列置換 replace(列, 置換前, 置換後)"),
+    'concat': (1, None, _concat, "文字列として連結"),
+    'num': (1, 1, _num, "数値に変換"),
+    'text': (1, 1, _text, "文字列に変換"),
+    'round': (1, 2, _round, "四捨五入 round(列, 桁数)"),
+    'abs': (1, 1, _abs, "絶対値"),
+    'date': (2, 3, _date, "日付の書式変換 date(列, 出力書式, 入力書式)"),
+    'iif': (3, 3, _iif, "条件分岐 iif(条件, 真の値, 偽の値)"),
+    'coalesce': (1, None, _coalesce, "最初の空でない値"),
+}
+
+
+# ---- コンパイル ----
+
+def _compile_node(node, columns):
+    """AST ノードを df -> 値 の関数に変換"""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, columns)
+
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float, str)) or isinstance(node.value, bool):
+            raise ExpressionError(f"使用できない定数です: {node.value!r}")
+        value = node.value
+        return lambda df: value
+
+    if isinstance(node, ast.Name):
+        name = columns.get(node.id, node.id)
+
+        def column(df):
+            if name in df.columns:
+                return df[name]
+            return df[_nfkc_column(name, df.columns)]
+        return column
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+        func = _ARITHMETIC[type(node.op)]
+        left, right = _compile_node(node.left, columns), _compile_node(node.right, columns)
+        return lambda df: func(_num(left(df)), _num(right(df)))
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _compile_node(node.operand, columns)
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        return lambda df: sign * _num(operand(df))
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_node(node.operand, columns)
+
+        def negate(df):
+            value = operand(df)
+            return ~value.fillna(False).astype(bool) if _is_series(value) else not value
+        return negate
+
+    if isinstance(node, ast.Compare):
+        parts = [_compile_node(node.left, columns)] + [_compile_node(c, columns) for c in node.comparators]
+        funcs = []
+        for op in node.ops:
+            if type(op) not in _COMPARE:
+                raise ExpressionError("使用できない比較演算子です")
+            funcs.append(_COMPARE[type(op)])
+
+        def compare(df):
+            values = [part(df) for part in parts]
+            result = True
+            for func, left, right in zip(funcs, values, values[1:]):
+                if _is_numeric_value(left) or _is_numeric_value(right):
+                    step = func(_num(left), _num(right))
+                else:
+                    step = func(_text(left), _text(right))
+                result = step if result is True else result & step
+            return result
+        return compare
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_node(v, columns) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def boolean(df):
+            result = values[0](df)
+            for value in values[1:]:
+                result = (result & value(df)) if is_and else (result | value(df))
+            return result
+        return boolean
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            name = getattr(node.func, 'id', '?')
+            raise ExpressionError(f"使用できない関数です: {name}")
+        if node.keywords:
+            raise ExpressionError("関数の引数に名前付き引数は使えません")
+        min_args, max_args, impl, _description = FUNCTIONS[node.func.id]
+        if len(node.args) < min_args or (max_args is not None and len(node.args) > max_args):
+            raise ExpressionError(f"{node.func.id}() の引数の数が正しくありません")
+        args = [_compile_node(arg, columns) for arg in node.args]
+        return lambda df: impl(*[arg(df) for arg in args])
+
+    raise ExpressionError(f"使用できない構文です: {type(node).__name__}")
+
+
+def _nfkc_column(name, columns):
+    """全角・半角などの表記ゆれ（NFKC で同じになる列名）で列を探す（見つからない・複数あればエラー）"""
+    target = unicodedata.normalize('NFKC', name)
+    matches = [col for col in columns if isinstance(col, str) and unicodedata.normalize('NFKC', col) == target]
+    if not matches:
+        raise ExpressionError(f"列が見つかりません: {name}")
+    if len(matches) > 1:
+        raise ExpressionError(f"全角・半角の違いだけの列が複数あります（{', '.join(matches)}）。"
+                              f"`列名` のようにバッククォートで囲んで書いてください")
+    return matches[0]
+
+
+def _restore_names(tree, source, columns):
+    """Python が NFKC に正規化した名前（金額Ａ -> 金額A）を、式に書いたとおりの列名に戻す"""
+    functions = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    lines = source.splitlines(keepends=True)
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Name) or id(node) in functions or node.id in columns:
+            continue
+        if node.lineno != node.end_lineno:
+            continue
+        # 位置は UTF-8 のバイト単位
+        written = lines[node.lineno - 1].encode('utf-8')[node.col_offset:node.end_col_offset].decode('utf-8')
+        if written != node.id:
+            placeholder = f"__col{len(columns)}"
+            columns[placeholder] = written
+            node.id = placeholder
+
+
+def _parse(text):
+    """式を構文木と {置き換えた名前: バッククォートで囲まれた列名} に分解"""
+    if not text or not text.strip():
+        raise ExpressionError("式を入力してください")
+    columns = {}
+
+    def quote(match):
+        placeholder = f"__col{len(columns)}"
+        columns[placeholder] = match.group(1)
+        return placeholder
+    source = _QUOTED_COLUMN.sub(quote, text.strip())
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise ExpressionError(f"式の構文が正しくありません: {e.msg}") from None
+    _restore_names(tree, source, columns)
+    return tree, columns
+
+
+@lru_cache(maxsize=256)
+def referenced_columns(text):
+    """式が参照する列名の集合（構文が正しくなければ空）"""
+    try:
+        tree, columns = _parse(text)
+    except ExpressionError:
+        return frozenset()
+    functions = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    return frozenset(columns.get(node.id, node.id) for node in ast.walk(tree)
+                     if isinstance(node, ast.Name) and id(node) not in functions)
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text):
+    """式をコンパイルして df -> pd.Series の関数を返す（同じ式はキャッシュ）"""
+    tree, columns = _parse(text)
+    evaluate = _compile_node(tree, columns)
+
+    def run(df):
+        try:
+            value = evaluate(df)
+        except ExpressionError:
+            raise
+        except (ArithmeticError, TypeError, ValueError) as e:
+            # 桁あふれ・0 除算・型の合わない演算（文字列どうしの and など）も式の誤りとして返す
+            raise ExpressionError(f"式を評価できません: {e}") from None
+        if not _is_series(value):
+            value = pd.Series([value] * len(df), index=df.index)
+        return as_integer_if_whole(value)
+    return run
+
+
+def evaluate_expression(text, df):
+    """式を DataFrame に対して評価し、新しい列の値を返す"""
+    return compile_expression(text)(df)
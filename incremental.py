@@ -0,0 +1,287 @@
+"""
+CSV Organizer Pro 差分処理
+追記されていくCSV（日次のログなど）について、前回までに処理したバイト位置・行数と
+ヘッダー・先頭部分のチェックサムを状態ファイルに記録し、次回は追記された部分だけを処理する
+（出力ファイルへの追記、または差分だけの別ファイルへの書き出し）
+"""
+
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+import decompress
+from arrow_csv import DEFAULT_ENGINE
+from csv_writer import csv_options, write_csv
+from instrumentation import timed_iter
+from pipeline import DEFAULT_CHUNKSIZE, detect_encoding, iter_csv_chunks, split_steps, stream_template
+
+STATE_VERSION = 1
+
+# 処理済み部分の先頭からチェックサムを取るバイト数（書き換え・ローテーションの検出用）
+PREFIX_BYTES = 1024 * 1024
+
+# 最後の改行を探すときに末尾から読むバイト数
+_SCAN_BLOCK_SIZE = 64 * 1024
+
+
+def state_path(output_path):
+    """出力ファイルに対応する状態ファイルのパス"""
+    return output_path + '.state.json'
+
+
+def load_state(path):
+    """状態ファイルを読み込む（無い・壊れている・形式が古い場合は None）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+
+def save_state(path, state):
+    """状態ファイルを書き出す（書き込み途中で止まっても前回の状態が残るよう置き換えで保存）"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def supports_incremental(config):
+    """追記された行だけを処理しても全体を処理したのと同じ結果になるテンプレートか
+
+    重複削除・集計は以前の行に依存するので、差分処理できない。
+    """
+    return not split_steps(config)[1]
+
+
+def settings_digest(config, header_row, output_options):
+    """出力を左右する設定（テンプレート・ヘッダー行・出力形式）のチェックサム"""
+    text = json.dumps([config, header_row, output_options], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def header_end(path, header_row=0):
+    """ヘッダー行（とその前の行）の直後のバイト位置"""
+    with open(path, 'rb') as f:
+        for _ in range(header_row + 1):
+            if not f.readline():
+                break
+        return f.tell()
+
+
+def record_boundaries(block, quotes=0):
+    """block の中の行の区切り（クォートの外の改行）の位置の配列
+
+    quotes は block より前（行の先頭から）に出てきた " の数。クォートで囲んだ値の中の改行では区切らない
+    （"" のエスケープも含めて " の数の偶奇で判定する）。
+    """
+    if quotes % 2 == 0 and b'"' not in block:
+        data = np.frombuffer(block, dtype=np.uint8)
+        return np.flatnonzero(data == ord('\n'))
+    data = np.frombuffer(block, dtype=np.uint8)
+    even = (np.cumsum(data == ord('"')) + quotes) % 2 == 0
+    return np.flatnonzero((data == ord('\n')) & even)
+
+
+def complete_end(path, start, size):
+    """start（行の先頭）以降で最後の行の区切りの直後のバイト位置
+
+    改行で終わっていない最後の行や、クォートの中で終わっている行（書き込み中の複数行の値）は書き込み中とみなす。
+    """
+    end = start
+    quotes = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < size:
+            block = f.read(min(_SCAN_BLOCK_SIZE, size - pos))
+            if not block:
+                break
+            hits = record_boundaries(block, quotes)
+            if len(hits):
+                end = pos + int(hits[-1]) + 1
+            quotes += block.count(b'"')
+            pos += len(block)
+    return end
+
+
+def range_digest(path, start, end):
+    """ファイルの [start, end) のチェックサム"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(remaining, _SCAN_BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+class SegmentReader(io.RawIOBase):
+    """ヘッダー部分のバイト列のあとにファイルの [start, end) が続くように見せる読み取り専用ファイル
+
+    追記された部分だけを、ヘッダー付きのCSVとして pandas / pyarrow に読ませるためのもの。
+    """
+
+    def __init__(self, path, header, start, end):
+        self._header = header
+        self._file = open(path, 'rb')
+        self._start = start
+        self._size = len(header) + end - start
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(0, min(offset, self._size))
+        return self._pos
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        size = min(len(view), self._size - self._pos)
+        if size <= 0:
+            return 0
+        if self._pos < len(self._header):
+            size = min(size, len(self._header) - self._pos)
+            view[:size] = self._header[self._pos:self._pos + size]
+        else:
+            self._file.seek(self._start + self._pos - len(self._header))
+            size = self._file.readinto(view[:size])
+        self._pos += size
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def _resume_reason(state, input_path, size, header_checksum, settings, output_path, append):
+    """前回の続きから処理できなければその理由を返す（続きから処理できれば None）"""
+    if state is None:
+        return "前回の処理の記録がありません"
+    if state.get('source') != os.path.abspath(input_path):
+        return "前回と入力ファイルが異なります"
+    if state.get('settings') != settings:
+        return "テンプレートまたは出力の設定が変わっています"
+    if size < state['offset']:
+        return "入力ファイルが前回より小さくなっています"
+    if state.get('header_checksum') != header_checksum:
+        return "ヘッダー行が変わっています"
+    prefix_end = state['header_end'] + state['prefix_bytes']
+    if range_digest(input_path, state['header_end'], prefix_end) != state['prefix_checksum']:
+        return "処理済みの部分が書き換えられています"
+    if append:
+        if state.get('output_size') is None:
+            return "前回は差分ファイルに書き出しています"
+        if not os.path.exists(output_path):
+            return "出力ファイルがありません"
+        if os.path.getsize(output_path) < state['output_size']:
+            return "出力ファイルが前回より小さくなっています"
+    return None
+
+
+def _counted(chunks, counter):
+    for chunk in chunks:
+        counter['rows'] += len(chunk)
+        yield chunk
+
+
+def run(input_path, config, output_path, state_file=None, delta_path=None, chunksize=DEFAULT_CHUNKSIZE,
+        header_row=0, encoding=None, output_options=None, engine=DEFAULT_ENGINE):
+    """前回処理した位置から先だけにテンプレートを適用する
+
+    delta_path を渡すと新しい行だけをそのファイルに書き出し、無ければ output_path に追記する。
+    続きから処理できない場合（初回・ファイルの書き換え・設定の変更・差分処理できないテンプレート）は全体を処理する。
+    結果は {'mode': 'full'/'incremental', 'reason', 'rows'（出力行数）, 'input_rows'（処理した入力行数）,
+    'total_rows'（処理済みの入力行数の累計）, 'offset', 'pending_bytes', 'target'} の辞書。
+    """
+    if decompress.detect(input_path) is not None:
+        # 圧縮ファイルは途中の位置から読めない
+        raise ValueError("圧縮・アーカイブされた入力は差分処理できません（展開したファイルを指定してください）")
+    output_options = output_options or csv_options()
+    state_file = state_file or state_path(output_path)
+    append = delta_path is None
+    target = output_path if append else delta_path
+
+    size = os.path.getsize(input_path)
+    head_end = header_end(input_path, header_row)
+    header_checksum = range_digest(input_path, 0, head_end)
+    settings = settings_digest(config, header_row, output_options)
+    state = load_state(state_file)
+
+    if not supports_incremental(config):
+        reason = "重複削除・集計を含むテンプレートは差分処理できません"
+    else:
+        reason = _resume_reason(state, input_path, size, header_checksum, settings, output_path, append)
+    if reason is None:
+        start = state['offset']
+        encoding = state['encoding']
+        previous_rows = state['rows']
+        if append and os.path.getsize(output_path) > state['output_size']:
+            # 前回の途中で止まった追記の残りを取り除く
+            with open(output_path, 'r+b') as f:
+                f.truncate(state['output_size'])
+    else:
+        start = head_end
+        encoding = encoding or detect_encoding(input_path)
+        previous_rows = 0
+    end = complete_end(input_path, start, size)
+
+    # 新しい行が無くても、差分ファイルはヘッダーだけで作り直す（前回の差分を残さない）
+    with open(input_path, 'rb') as f:
+        header = f.read(head_end)
+    source = input_path if start == head_end and end == size else SegmentReader(input_path, header, start, end)
+    counter = {'rows': 0}
+    try:
+        chunks = timed_iter('read_csv', iter_csv_chunks(source, chunksize, header_row, encoding, engine))
+        rows = write_csv(stream_template(config, _counted(chunks, counter)), target,
+                         mode='a' if append and reason is None else 'w', **output_options)
+    finally:
+        if source is not input_path:
+            source.close()
+
+    prefix_bytes = min(PREFIX_BYTES, end - head_end)
+    save_state(state_file, {
+        'version': STATE_VERSION,
+        'source': os.path.abspath(input_path),
+        'settings': settings,
+        'encoding': encoding,
+        'header_row': header_row,
+        'header_end': head_end,
+        'header_checksum': header_checksum,
+        'prefix_bytes': prefix_bytes,
+        'prefix_checksum': range_digest(input_path, head_end, head_end + prefix_bytes),
+        'offset': end,
+        'rows': previous_rows + counter['rows'],
+        'output_size': os.path.getsize(output_path) if append else None,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    return {
+        'mode': 'full' if reason is not None else 'incremental',
+        'reason': reason,
+        'rows': rows,
+        'input_rows': counter['rows'],
+        'total_rows': previous_rows + counter['rows'],
+        'offset': end,
+        'pending_bytes': size - end,
+        'target': target,
+    }
@@ -0,0 +1,238 @@
+"""
+CSV Organizer Pro 計測
+処理工程ごとの所要時間とメモリ使用量を記録する（記録中でなければ何もしない）
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# 現在のスレッド（Streamlit のセッション）で有効な記録先
+_active = contextvars.ContextVar('csv_organizer_recorder', default=None)
+
+
+def current_rss_mb():
+    """現在の常駐メモリ(MB)。取得できない環境では None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        return None
+
+
+def peak_rss_mb():
+    """プロセス開始からのピーク常駐メモリ(MB)。取得できない環境では None"""
+    # Linux の ru_maxrss は exec 前の親プロセスの値を引き継ぐので VmHWM を優先
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+        except ImportError:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class MemoryPeak:
+    """ブロック実行中の常駐メモリを一定間隔で測り、ピークを記録する
+
+    ru_maxrss はプロセス開始からの最大値しか分からないため、区間のピークは別スレッドで測る。
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.before_mb = None
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.before_mb = current_rss_mb()
+        self.peak_mb = self.before_mb
+        if self.before_mb is not None:
+            self._thread = threading.Thread(target=self._run, name='memory-peak', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        return False
+
+    @property
+    def delta_mb(self):
+        """開始時から増えたピークのメモリ(MB)"""
+        return _difference(self.peak_mb, self.before_mb)
+
+
+def _difference(after, before):
+    if after is None or before is None:
+        return None
+    return after - before
+
+
+class Recorder:
+    """工程ごとの計測結果を記録する
+
+    工程は入れ子にでき、seconds は子工程を含む時間、self_seconds は子工程を除いた時間。
+    チャンク処理で同じ工程が何度も記録される場合は summary() で工程名ごとに合算する。
+    """
+
+    def __init__(self, label=''):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = datetime.now()
+        self.events = []
+        self._stack = []
+        self._start = time.perf_counter()
+
+    def begin(self, name):
+        self._stack.append({'stage': name, 'start': time.perf_counter(),
+                            'rss_before': current_rss_mb(), 'child_seconds': 0.0})
+
+    def end(self, **fields):
+        frame = self._stack.pop()
+        seconds = time.perf_counter() - frame['start']
+        if self._stack:
+            self._stack[-1]['child_seconds'] += seconds
+        rss_after = current_rss_mb()
+        self.events.append({
+            'stage': frame['stage'],
+            'parent': self._stack[-1]['stage'] if self._stack else None,
+            'offset_seconds': frame['start'] - self._start,
+            'seconds': seconds,
+            'self_seconds': seconds - frame['child_seconds'],
+            'rss_mb': rss_after,
+            'rss_delta_mb': _difference(rss_after, frame['rss_before']),
+            **fields,
+        })
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self._start
+
+    def summary(self):
+        """工程名ごとに回数・時間・メモリ増減・行数を合算（最初に現れた順）"""
+        stages = {}
+        for event in self.events:
+            row = stages.setdefault(event['stage'], {
+                'stage': event['stage'], 'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+                'rss_delta_mb': 0.0, 'max_rss_mb': None, 'rows': None,
+            })
+            row['calls'] += 1
+            row['seconds'] += event['seconds']
+            row['self_seconds'] += event['self_seconds']
+            row['rss_delta_mb'] += event['rss_delta_mb'] or 0.0
+            if event['rss_mb'] is not None:
+                row['max_rss_mb'] = max(row['max_rss_mb'] or 0.0, event['rss_mb'])
+            if event.get('rows') is not None:
+                row['rows'] = (row['rows'] or 0) + event['rows']
+        return list(stages.values())
+
+    def records(self):
+        """構造化ログ（工程ごとの記録と最後の集計）を辞書のリストで返す"""
+        common = {'run_id': self.run_id, 'label': self.label}
+        started_at = self.started_at.isoformat(timespec='milliseconds')
+        lines = [{'event': 'stage', **common, 'started_at': started_at, **event} for event in self.events]
+        lines.append({
+            'event': 'summary', **common, 'started_at': started_at,
+            'total_seconds': self.total_seconds,
+            'rss_mb': current_rss_mb(),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.summary(),
+        })
+        return lines
+
+    def to_jsonl(self):
+        """構造化ログを JSON Lines の文字列で返す"""
+        return ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in self.records())
+
+    def write_jsonl(self, path):
+        """構造化ログを JSON Lines ファイルに追記（'-' なら標準エラー出力）"""
+        if path == '-':
+            sys.stderr.write(self.to_jsonl())
+            return
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(self.to_jsonl())
+
+
+def set_recorder(recorder):
+    """現在のコンテキストの記録先を設定（None で記録を止める）して返す"""
+    _active.set(recorder)
+    return recorder
+
+
+@contextlib.contextmanager
+def recording(label=''):
+    """ブロック内の工程を新しい Recorder に記録する"""
+    recorder = Recorder(label)
+    token = _active.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """工程の時間とメモリを記録する（記録中でなければ何もしない）
+
+    yield される辞書に値を入れると記録に追加される（例: 処理後に分かる行数）。
+    """
+    fields = {} if rows is None else {'rows': rows}
+    recorder = _active.get()
+    if recorder is None:
+        yield fields
+        return
+    recorder.begin(name)
+    try:
+        yield fields
+    finally:
+        recorder.end(**fields)
+
+
+def timed_iter(name, iterable):
+    """イテレータから1件取り出すごとに工程として記録する（DataFrame なら行数も記録）"""
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as fields:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            if hasattr(item, 'shape'):
+                fields['rows'] = len(item)
+        yield item
@@ -0,0 +1,179 @@
+"""
+CSV Organizer Pro バックグラウンドジョブ
+時間のかかる読み込み・変換・出力をスレッドプールで実行し、進捗報告と取り消しに対応する
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import set_recorder
+
+DEFAULT_MAX_WORKERS = 2
+# 終了後この秒数を過ぎたジョブは prune() で破棄
+DEFAULT_KEEP_SECONDS = 60 * 60
+
+STATUS_LABELS = {
+    'queued': '待機中',
+    'running': '実行中',
+    'done': '完了',
+    'failed': 'エラー',
+    'cancelled': '取り消し',
+}
+
+
+class JobCancelled(Exception):
+    """ジョブが取り消されたことを処理側に伝える例外"""
+
+
+class Job:
+    """1つのバックグラウンド処理の状態・進捗・結果"""
+
+    def __init__(self, label='', unit='行'):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.unit = unit
+        self.status = 'queued'
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    @property
+    def progress(self):
+        """0〜1 の進捗。全体量が分からなければ None"""
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def report(self, done, total=None):
+        """進捗を報告する（取り消されていれば JobCancelled を送出）"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def iterate(self, chunks, total=None):
+        """チャンクを順に返しながら処理済み行数を報告する"""
+        done = self.done
+        for chunk in chunks:
+            self.report(done, total)
+            yield chunk
+            done += len(chunk)
+        self.report(done, total)
+
+    def cancel(self):
+        """取り消しを要求する（実行前なら即座に取り消し）"""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = 'cancelled'
+            self.finished_at = time.time()
+
+    def wait(self, timeout=None):
+        """終了を待つ（テスト・CLI 用）"""
+        if self._future is not None:
+            try:
+                self._future.result(timeout)
+            except Exception:
+                pass
+        return self
+
+
+class JobManager:
+    """ジョブの投入・参照・取り消しを行う（プロセス内で共有）"""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, keep_seconds=DEFAULT_KEEP_SECONDS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='csv-organizer-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+
+    def submit(self, func, *args, label='', unit='行', recorder=None, **kwargs):
+        """func(job, *args, **kwargs) をバックグラウンドで実行し、Job を返す
+
+        recorder を渡すとジョブ内の工程をその Recorder に記録する。
+        """
+        job = Job(label, unit)
+
+        def run():
+            if job.cancelled:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+            # ワーカースレッドは使い回されるので毎回設定し直す
+            set_recorder(recorder)
+            try:
+                job.result = func(job, *args, **kwargs)
+                job.status = 'done'
+            except JobCancelled:
+                job.status = 'cancelled'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = time.time()
+
+        self.prune()
+        with self._lock:
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def discard(self, job_id):
+        """ジョブを取り消して一覧から外す（結果のメモリを解放）"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and not job.finished:
+            job.cancel()
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def prune(self):
+        """終了から keep_seconds を過ぎたジョブを破棄"""
+        limit = time.time() - self.keep_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < limit]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait=False):
+        for job in self.jobs():
+            job.cancel()
+        self._executor.shutdown(wait=wait)
@@ -4,12 +4,36 @@ CSV Organizer Pro Launcher
 ローカルアプリケーションとして起動するためのランチャー
 """
 
+import multiprocessing
 import subprocess
 import sys
 import os
 import webbrowser
 import time
-import threading
+import urllib.error
+import urllib.request
+
+PORT = 8501
+APP_URL = f"http://localhost:{PORT}"
+
+# サーバーの起動を確認する間隔と待つ上限（秒）
+HEALTH_POLL_SECONDS = 0.1
+STARTUP_TIMEOUT = 60
+
+def wait_for_server(url=APP_URL, process=None, timeout=STARTUP_TIMEOUT, interval=HEALTH_POLL_SECONDS):
+    """Streamlit のヘルスチェック (/_stcore/health) が応答するまで待ち、起動できたかを返す"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(interval)
+    return False
 
 def main():
     print("🚀 CSV Organizer Pro を起動しています...")
@@ -22,19 +46,22 @@ def main():
     
     try:
         # Streamlitアプリを起動
+        start = time.perf_counter()
         process = subprocess.Popen([
             sys.executable, "-m", "streamlit", "run", app_path,
-            "--server.port", "8501",
+            "--server.port", str(PORT),
             "--server.headless", "true",
             "--browser.gatherUsageStats", "false"
         ])
         
-        print("✅ アプリケーションが起動しました")
-        print("🌐 ブラウザで http://localhost:8501 にアクセスしてください")
-        
-        # 少し待ってからブラウザを開く
-        time.sleep(3)
-        webbrowser.open("http://localhost:8501")
+        # サーバーが応答するようになったらすぐにブラウザを開く
+        if not wait_for_server(APP_URL, process):
+            print("❌ アプリケーションを起動できませんでした")
+            process.terminate()
+            return
+        print(f"✅ アプリケーションが起動しました（{time.perf_counter() - start:.1f} 秒）")
+        print(f"🌐 ブラウザで {APP_URL} にアクセスしてください")
+        webbrowser.open(APP_URL)
         
         print("\n📋 使用方法:")
         print("1. ブラウザでCSVまたはExcelファイルをアップロード")
@@ -55,4 +82,6 @@ def main():
         print("   pip install -r requirements.txt")
 
 if __name__ == "__main__":
+    # 複数シートの並列読み込み（プロセスプール）が実行ファイルにまとめても動くように
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+CSV Organizer Pro ファイル読み込み
+文字コード自動判定・圧縮ファイルの展開・列名の重複処理・欠損値の置換（Streamlit 非依存）
+"""
+
+import contextlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import arrow_csv
+import decompress
+from arrow_csv import DEFAULT_ENGINE, ArrowUnsupported
+from instrumentation import MemoryPeak, stage
+from pipeline import CSV_ENCODINGS
+from schema import DRIFT_SAMPLE_ROWS, arrow_types, category_columns, pandas_dtypes
+
+
+class ProgressReader(io.BufferedIOBase):
+    """読み込んだバイト数を progress(読み込み済み, 全体) で報告する読み込み用ラッパー
+
+    BytesIO と mmap のどちらも包める（mmap ならファイル全体をメモリにコピーしない）。
+    作成時に source を先頭に戻すので、文字コードを変えて読み直すときも同じ source を使える。
+    """
+
+    def __init__(self, source, size, progress=None):
+        super().__init__()
+        source.seek(0)
+        self._source = source
+        self._size = size
+        self._progress = progress
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._source.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # mmap.seek は None を返すので位置は tell で返す
+        self._source.seek(offset, whence)
+        return self._source.tell()
+
+    def read(self, size=-1):
+        data = self._source.read(-1 if size is None else size)
+        if self._progress is not None:
+            self._progress(self.tell(), self._size)
+        return data
+
+    # pandas は文字コード変換のため TextIOWrapper 経由で read1 を呼ぶ
+    read1 = read
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _read_csv(open_reader, header_row, engine=DEFAULT_ENGINE, source=None, schema=None):
+    """CSVを文字コードを順に試して読み込み、(DataFrame, 使ったエンジン, 型指定の有無) を返す
+
+    open_reader() は先頭から読む新しい読み込み口を返す。engine='pyarrow' のときは
+    source（パス・バイト列・新しいストリームを返す関数）を pyarrow で読み、読めなければ pandas で読み直す。
+    schema（テンプレートのスキーマ）があれば型指定して読み、その型で読めなければ型指定なしで読み直す。
+    """
+    for hints in ((schema, None) if schema else (None,)):
+        if engine == 'pyarrow' and source is not None:
+            try:
+                df = arrow_csv.read_csv(source, CSV_ENCODINGS, header_row, column_types=arrow_hints(hints))
+                return _categorize(df, hints), 'pyarrow', hints is not None
+            except ArrowUnsupported:
+                pass
+        try:
+            return _read_csv_pandas(open_reader, header_row, dtype=pandas_dtypes(hints)), 'pandas', hints is not None
+        except ValueError:
+            if hints is None:
+                raise
+
+
+def _read_csv_pandas(open_reader, header_row, **options):
+    for encoding in CSV_ENCODINGS[:-1]:
+        try:
+            return pd.read_csv(open_reader(), header=header_row, encoding=encoding, **options)
+        except UnicodeDecodeError:
+            continue
+    return pd.read_csv(open_reader(), header=header_row, encoding=CSV_ENCODINGS[-1], **options)
+
+
+def arrow_hints(schema):
+    if not schema:
+        return None
+    import pyarrow as pa
+    return arrow_types(schema, pa)
+
+
+def _categorize(df, schema):
+    # pyarrow ではカテゴリを文字列で読むので読んだ後で変換
+    for col in category_columns(schema):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def read_csv_file(path, engine=DEFAULT_ENGINE, header_row=0):
+    """CSVファイルを選んだエンジンで読み込む（pandas なら文字コードを順に試す。圧縮ファイルは展開しながら読む）"""
+    if decompress.detect(path) is not None:
+        return load_file(path, decompress.inner_name(os.path.basename(path)), header_row, engine=engine)
+    with _mapped(path) as mapped:
+        size = os.path.getsize(path)
+        return _read_csv(lambda: ProgressReader(mapped, size), header_row, engine, path)[0]
+
+
+def read_header(fileobj, file_name, header_row=0):
+    """ファイルのヘッダー行だけを読んで列名のリストを返す（列名は読み込み時と同じ）"""
+    return list(dedupe_column_names(read_sample(fileobj, file_name, header_row, nrows=0)).columns)
+
+
+def read_sample(fileobj, file_name, header_row=0, nrows=DRIFT_SAMPLE_ROWS):
+    """ファイルの先頭 nrows 行を文字列のまま読む（スキーマの差異確認用）
+
+    圧縮ファイルは先頭だけを展開して読む（ZIP は中の最初のCSVファイル）。
+    """
+    kind = decompress.detect(fileobj, file_name)
+    if kind == 'zip':
+        members = decompress.zip_members(fileobj)
+        if not members:
+            raise ValueError("ZIPファイルにCSVファイルがありません")
+        file_name = members[0].filename
+    else:
+        file_name = decompress.inner_name(file_name)
+
+    def open_reader():
+        fileobj.seek(0)
+        if kind == 'zip':
+            return decompress.open_member(fileobj, file_name)
+        return fileobj if kind is None else decompress.open_stream(fileobj, kind)
+
+    try:
+        if file_name.lower().endswith('.csv'):
+            return _read_csv_pandas(open_reader, header_row, nrows=nrows, dtype=str, keep_default_na=False)
+        with _seekable(open_reader, kind) as reader:
+            return pd.read_excel(reader, header=header_row, nrows=nrows, dtype=str).fillna('')
+    finally:
+        fileobj.seek(0)
+
+
+def dedupe_column_names(df):
+    """同じ名前の列を 名前, 名前_1, 名前_2 ... にリネーム"""
+    if df.columns.duplicated().any():
+        cols = pd.Series(df.columns)
+        for dup in cols[cols.duplicated()].unique():
+            cols[cols[cols == dup].index.values.tolist()] = [dup + f'_{i}' if i != 0 else dup for i in range(sum(cols == dup))]
+        df.columns = cols.tolist()
+    return df
+
+
+def fill_missing(df):
+    """欠損値を空文字にする
+
+    カテゴリの列は空文字をカテゴリに加え、空文字を入れられない型（nullable・Arrow の数値や真偽値）の列は object にする。
+    """
+    for col in df.columns[df.isna().any().values]:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            if '' not in dtype.categories:
+                df[col] = df[col].cat.add_categories('')
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and not pd.api.types.is_string_dtype(dtype):
+            df[col] = df[col].astype(object)
+    return df.fillna('')
+
+
+def _read_excel(open_reader, header_row, schema=None, sheet_name=0):
+    if schema:
+        try:
+            return pd.read_excel(open_reader(), sheet_name=sheet_name, header=header_row,
+                                 dtype=pandas_dtypes(schema)), True
+        except (ValueError, TypeError):
+            pass
+    return pd.read_excel(open_reader(), sheet_name=sheet_name, header=header_row), False
+
+
+def _load(open_reader, file_name, header_row, engine=DEFAULT_ENGINE, source=None, schema=None):
+    if file_name.lower().endswith('.csv'):
+        # CSV読み込み（エンコーディング自動判定）
+        with stage('read_csv') as fields:
+            df, fields['engine'], fields['schema_hints'] = _read_csv(open_reader, header_row, engine, source, schema)
+            fields['rows'] = len(df)
+    else:
+        # Excel読み込み
+        with stage('read_excel') as fields:
+            df, fields['schema_hints'] = _read_excel(open_reader, header_row, schema)
+            fields['rows'] = len(df)
+
+    # 列名の重複を処理
+    df = dedupe_column_names(df)
+
+    # データ型の最適化
+    with stage('fillna', rows=len(df)):
+        return fill_missing(df)
+
+
+# 圧縮されたExcelを一時ファイルに展開するときのブロックサイズ
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+
+@contextlib.contextmanager
+def _seekable(open_reader, kind):
+    """Excel（ZIP形式で末尾から読む）用に、圧縮されていれば一時ファイルに展開して開く"""
+    if kind is None:
+        yield open_reader()
+        return
+    with tempfile.TemporaryFile() as f:
+        with open_reader() as stream:
+            shutil.copyfileobj(stream, f, _COPY_BLOCK_SIZE)
+        f.seek(0)
+        yield f
+
+
+
+def load_table(file_content, file_name, header_row=0, progress=None, engine=DEFAULT_ENGINE, schema=None):
+    """アップロードされたファイルを DataFrame に読み込む
+
+    progress を渡すと読み込み済みのバイト数と全体のバイト数で呼び出す。
+    engine='pyarrow' ならCSVを pyarrow で読む（読めない場合は pandas。進捗は報告されない）。
+    schema（テンプレートに保存したスキーマ）を渡すと列の型を推論せずに指定して読む。
+    """
+    return _load(lambda: ProgressReader(io.BytesIO(file_content), len(file_content), progress),
+                 file_name, header_row, engine, file_content, schema)
+
+
+@contextlib.contextmanager
+def _mapped(path):
+    """ファイルを読み取り専用でメモリマップする（空ファイルは mmap できないので BytesIO）"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield io.BytesIO(b'')
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # 先頭から順に読むので先読みを促す（対応していない環境では何もしない）
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            yield mapped
+
+
+def _load_compressed(path, kind, file_name, header_row, progress, engine, schema):
+    """gzip・bzip2・xz・zstd のファイルを展開しながら読み込む（進捗は圧縮されたバイト数で報告）"""
+    file_name = decompress.inner_name(file_name)
+    size = os.path.getsize(path)
+    with _mapped(path) as mapped:
+        def open_reader():
+            return decompress.open_stream(ProgressReader(mapped, size, progress), kind)
+
+        if file_name.lower().endswith('.csv'):
+            return _load(open_reader, file_name, header_row, engine, open_reader, schema)
+        with _seekable(open_reader, kind) as reader:
+            def open_copy():
+                reader.seek(0)
+                return reader
+            return _load(open_copy, file_name, header_row, schema=schema)
+
+
+def _load_zip(path, header_row, progress, engine, schema, workers=None):
+    """ZIP の中のCSVファイルを並列に読み込み、アーカイブ内の順に縦につなげる（列が同じであること）
+
+    進捗は展開後のバイト数の合計で報告する。
+    """
+    members = decompress.zip_members(path)
+    if not members:
+        raise ValueError("ZIPファイルにCSVファイルがありません")
+    total = sum(info.file_size for info in members)
+    done = {}
+    lock = threading.Lock()
+
+    def member_progress(name):
+        def report(read, _size):
+            with lock:
+                done[name] = read
+                progress(sum(done.values()), total)
+        return report if progress is not None else None
+
+    def load_member(info):
+        def open_reader():
+            return ProgressReader(decompress.open_member(path, info.filename), info.file_size,
+                                  member_progress(info.filename))
+        return _load(open_reader, info.filename, header_row, engine, open_reader, schema)
+
+    with ThreadPoolExecutor(max_workers=min(len(members), workers or os.cpu_count() or 1)) as pool:
+        frames = list(pool.map(load_member, members))
+    for info, df in zip(members[1:], frames[1:]):
+        if list(df.columns) != list(frames[0].columns):
+            raise ValueError(f"ZIP内の {info.filename} の列が {members[0].filename} と一致しません")
+    if len(frames) == 1:
+        return frames[0]
+    with stage('concat', rows=sum(len(df) for df in frames)):
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_file(path, file_name=None, header_row=0, progress=None, stats=None, engine=DEFAULT_ENGINE,
+              schema=None, sheets=None, sheet_column=None):
+    """ディスク上のファイルをメモリマップ経由で DataFrame に読み込む
+
+    バイト列全体をメモリに持たないため、読み込み中のピークメモリは load_table より小さい。
+    圧縮ファイル（gzip・bzip2・xz・zstd）は展開しながら読み、ZIP は中のCSVファイルを並列に読んでつなげる。
+    Excel で sheets（シート名のリスト）を渡すとそれらのシートを並列に読んで縦につなげ、
+    sheet_column があれば元のシート名の列を加える（進捗は読み終えたシート数、stats['sheets'] にシートごとの時間）。
+    stats に辞書を渡すとファイルサイズ・所要時間・読み込み中のピークメモリ(MB)を記録する。
+    engine・schema は load_table と同じ。
+    """
+    file_name = file_name or os.path.basename(path)
+    size = os.path.getsize(path)
+    kind = decompress.detect(path, file_name)
+    measured_sheets = {}
+    start = time.perf_counter()
+    with stage('load_file') as fields:
+        with MemoryPeak() as memory:
+            if sheets:
+                import workbook  # 複数シートを読むときだけ読み込む
+                df, sheet_stats = workbook.read_sheets(path, sheets, header_row, schema, sheet_column,
+                                                       progress=progress)
+                measured_sheets = {'sheets': sheet_stats}
+            elif kind == 'zip':
+                df = _load_zip(path, header_row, progress, engine, schema)
+            elif kind is not None:
+                df = _load_compressed(path, kind, file_name, header_row, progress, engine, schema)
+            else:
+                with _mapped(path) as mapped:
+                    df = _load(lambda: ProgressReader(mapped, size, progress), file_name, header_row, engine,
+                               path, schema)
+        measured = {
+            'file_mb': size / 1024 / 1024,
+            'seconds': time.perf_counter() - start,
+            'rows': len(df),
+            'rss_before_mb': memory.before_mb,
+            'peak_rss_mb': memory.peak_mb,
+            'peak_delta_mb': memory.delta_mb,
+            **measured_sheets,
+        }
+        # 構造化ログにも読み込み中のピークを残す
+        fields.update(rows=len(df), file_mb=measured['file_mb'], peak_delta_mb=memory.delta_mb)
+    if stats is not None:
+        stats.update(measured)
+    return df
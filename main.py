@@ -2,29 +2,49 @@ import os
 import pandas as pd
 import PySimpleGUIQt as sg # type: ignore
 
-# テンプレート保存先
-TEMPLATE_DIR = "templates"
+from csv_writer import write_csv
+from excel_writer import write_excel
+
+# テンプレート保存先（アプリ・ジョブAPIと共有）
+from template_store import TEMPLATE_DIR
 os.makedirs(TEMPLATE_DIR, exist_ok=True)
 
-def load_file(path):
+def load_file(path, sheet_pattern=""):
     ext = os.path.splitext(path)[1].lower()
     if ext == ".csv":
         return pd.read_csv(path)
-    else:
+    elif not sheet_pattern.strip():
         return pd.read_excel(path)
+    else:
+        # シートのパターン（例: *支店, !集計）を指定したら、一致するシートを並列に読み込んで縦につなげる
+        from workbook import list_sheets, read_sheets, select_sheets
+        sheets = select_sheets(list_sheets(path), sheet_pattern)
+        if not sheets:
+            raise ValueError(f"パターンに一致するシートがありません: {sheet_pattern}")
+        return read_sheets(path, sheets)[0]
 
-def save_file(df, path):
+def save_file(df, path, encoding='utf-8', **csv_options):
     ext = os.path.splitext(path)[1].lower()
-    if ext == ".csv":
-        df.to_csv(path, index=False)
-    else:
-        df.to_excel(path, index=False)
+    # 途中で失敗しても書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える
+    tmp_path = path + ".tmp"
+    try:
+        if ext == ".csv":
+            write_csv(df, tmp_path, encoding=encoding, **csv_options)
+        else:
+            # 行数上限を超える分は新しいシートに続けて書く
+            write_excel(df, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
 
 def main():
     sg.theme("SystemDefault")
 
     layout = [
         [sg.Text("元ファイル"), sg.Input(key="-FILE-"), sg.FileBrowse(file_types=(("CSV/XLSX", "*.csv;*.xlsx"),))],
+        [sg.Text("シート（Excel・空欄なら先頭）"), sg.Input(key="-SHEETS-", tooltip="例: *支店, !集計")],
         [sg.Button("読み込み")],
         [sg.Listbox(values=[], key="-COLUMNS-", size=(30, 15), enable_events=True, select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE),
          sg.Column([
@@ -46,7 +66,7 @@ def main():
         if event == "読み込み":
             path = values["-FILE-"]
             try:
-                df = load_file(path)
+                df = load_file(path, values["-SHEETS-"])
                 window["-COLUMNS-"].update(list(df.columns))
             except Exception as e:
                 sg.popup_error(f"読み込みエラー:\n{e}")
@@ -0,0 +1,30 @@
+"""
+CSV Organizer Pro 数値変換ユーティリティ
+文字列列の一括数値化と整数表示の補助
+"""
+
+import pandas as pd
+
+
+def to_numeric(series):
+    """数値列に変換（高速な型変換を優先し、失敗時のみ要素ごとの変換）"""
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series
+    try:
+        return series.astype('float64')
+    except (TypeError, ValueError):
+        pass
+    try:
+        return series.mask(series == '').astype('float64')
+    except (TypeError, ValueError):
+        return pd.to_numeric(series, errors='coerce')
+
+
+def as_integer_if_whole(series):
+    """整数値だけなら Int64 にして「12.0」のような出力を避ける"""
+    if not pd.api.types.is_float_dtype(series.dtype):
+        return series
+    values = series.dropna()
+    if len(values) and (values % 1 == 0).all() and values.abs().max() < 2 ** 53:
+        return series.astype('Int64')
+    return series
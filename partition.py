@@ -0,0 +1,207 @@
+"""
+CSV Organizer Pro 値ごとのファイル分割
+キー列の値ごとに1ファイルへ振り分け（1パス・バッファ上限付き・外部マージソート対応）
+"""
+
+import csv
+import heapq
+import itertools
+import os
+import re
+import tempfile
+
+import pandas as pd
+
+from csv_writer import csv_options as make_csv_options, write_csv
+
+# 全パーティション合計でメモリに溜める行数の上限
+DEFAULT_MAX_BUFFERED_ROWS = 100_000
+# パーティション内ソートで一度にメモリへ載せる行数
+DEFAULT_SORT_MEMORY_ROWS = 500_000
+
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def safe_filename(value):
+    """キー値をファイル名に使える文字列に変換"""
+    text = _UNSAFE_CHARS.sub('_', str(value)).strip('._')
+    return text[:80] or '_empty'
+
+
+def partition_keys(chunk, column, by_month=False):
+    """振り分けキーを計算（by_month=True なら日付列を YYYY-MM に丸める）"""
+    if column not in chunk.columns:
+        raise ValueError(f"分割キーの列が見つかりません: {column}")
+    if by_month:
+        dates = pd.to_datetime(chunk[column], errors='coerce')
+        return dates.dt.strftime('%Y-%m').fillna('日付不明')
+    return chunk[column].astype(str)
+
+
+class PartitionWriter:
+    """チャンクを受け取り、キー値ごとのCSVファイルへ追記する"""
+
+    def __init__(self, out_dir, column, by_month=False, prefix='', csv_options=None,
+                 max_buffered_rows=DEFAULT_MAX_BUFFERED_ROWS):
+        self.out_dir = out_dir
+        self.column = column
+        self.by_month = by_month
+        self.prefix = prefix
+        self.csv_options = csv_options or make_csv_options()
+        self.max_buffered_rows = max_buffered_rows
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._paths = {}
+        self._used_names = set()
+        self._rows = {}
+        self._dtypes = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _path_for(self, key):
+        if key not in self._paths:
+            base = f"{self.prefix}_{safe_filename(key)}" if self.prefix else safe_filename(key)
+            name = base
+            i = 2
+            # Windows・macOS では大文字・小文字だけが違うファイル名は同じファイルになる
+            while name.casefold() in self._used_names:
+                name = f"{base}_{i}"
+                i += 1
+            self._used_names.add(name.casefold())
+            self._paths[key] = os.path.join(self.out_dir, f"{name}.csv")
+        return self._paths[key]
+
+    def write(self, chunk):
+        """チャンクをキーごとに振り分けてバッファに追加"""
+        keys = partition_keys(chunk, self.column, self.by_month)
+        if self._dtypes is None:
+            self._dtypes = chunk.dtypes.to_dict()
+        for key, part in chunk.groupby(keys, sort=False):
+            self._buffers.setdefault(key, []).append(part)
+            self._buffered_rows += len(part)
+        if self._buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def flush(self):
+        """バッファの内容をファイルへ追記（ファイルは書き込み後すぐ閉じる）"""
+        for key, parts in self._buffers.items():
+            path = self._path_for(key)
+            is_new = key not in self._rows
+            data = pd.concat(parts) if len(parts) > 1 else parts[0]
+            write_csv(data, path, mode='w' if is_new else 'a', **self.csv_options)
+            self._rows[key] = self._rows.get(key, 0) + len(data)
+        self._buffers = {}
+        self._buffered_rows = 0
+
+    def close(self, sort_by=None, sort_numeric=False, sort_memory_rows=DEFAULT_SORT_MEMORY_ROWS):
+        """残りを書き出し、必要なら各ファイル内をソートして {キー: (パス, 行数)} を返す"""
+        self.flush()
+        if sort_by:
+            for key in self._rows:
+                sort_csv_file(self._paths[key], sort_by, self.csv_options,
+                              numeric=sort_numeric, memory_rows=sort_memory_rows, dtypes=self._dtypes)
+        return {key: (self._paths[key], rows) for key, rows in self._rows.items()}
+
+
+def write_partitions(chunks, out_dir, column, by_month=False, prefix='', csv_options=None,
+                     sort_by=None, sort_numeric=False,
+                     max_buffered_rows=DEFAULT_MAX_BUFFERED_ROWS,
+                     sort_memory_rows=DEFAULT_SORT_MEMORY_ROWS):
+    """チャンク列をキー値ごとのファイルに書き出す"""
+    writer = PartitionWriter(out_dir, column, by_month, prefix, csv_options, max_buffered_rows)
+    for chunk in chunks:
+        writer.write(chunk)
+    return writer.close(sort_by, sort_numeric, sort_memory_rows)
+
+
+def _sort_frame(df, sort_by, numeric):
+    if numeric:
+        return df.sort_values(sort_by, kind='stable',
+                              key=lambda s: pd.to_numeric(s, errors='coerce'))
+    return df.sort_values(sort_by, kind='stable')
+
+
+def _merge_key(indexes, numeric):
+    def key(row):
+        values = [row[i] for i in indexes]
+        if not numeric:
+            return values
+        # 数値化できない値は末尾へ（pandas の NaN と同じ並び）
+        result = []
+        for value in values:
+            try:
+                result.append((0, float(value)))
+            except ValueError:
+                result.append((1, 0.0))
+        return result
+    return key
+
+
+def _restore_dtypes(df, dtypes):
+    """文字列で読み直した列を、書き出す前の数値・真偽値の型に戻す（「数値以外」のクォートを分割前と同じにする）"""
+    for col, dtype in (dtypes or {}).items():
+        if col not in df.columns:
+            continue
+        if pd.api.types.is_bool_dtype(dtype):
+            df[col] = df[col].map({'True': True, 'False': False})
+        elif pd.api.types.is_integer_dtype(dtype):
+            df[col] = pd.to_numeric(df[col]).astype(dtype)
+        elif pd.api.types.is_float_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
+
+
+def _frames(rows, columns, size, dtypes):
+    rows = iter(rows)
+    while True:
+        block = list(itertools.islice(rows, size))
+        if not block:
+            return
+        yield _restore_dtypes(pd.DataFrame(block, columns=columns), dtypes)
+
+
+def sort_csv_file(path, sort_by, csv_options=None, numeric=False,
+                  memory_rows=DEFAULT_SORT_MEMORY_ROWS, dtypes=None):
+    """CSVファイルを列でソート（メモリに収まらない場合は外部マージソート）
+
+    書き出しはソートしない場合と同じ csv_writer で行う（dtypes は分割前の列の型）。
+    """
+    options = csv_options or make_csv_options()
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, encoding=options['encoding'],
+                         chunksize=memory_rows)
+    first = next(reader, None)
+    if first is None:
+        return
+    missing = [col for col in sort_by if col not in first.columns]
+    if missing:
+        raise ValueError(f"ソート列が見つかりません: {', '.join(missing)}")
+    second = next(reader, None)
+    if second is None:
+        write_csv(_restore_dtypes(_sort_frame(first, sort_by, numeric), dtypes), path, **options)
+        return
+
+    # ソート済みランをテンポラリに書き出してからk-wayマージ
+    header = list(first.columns)
+    run_dir = tempfile.mkdtemp(prefix="csv_sort_", dir=os.path.dirname(path) or None)
+    run_paths = []
+    try:
+        for chunk in itertools.chain([first, second], reader):
+            run_path = os.path.join(run_dir, f"run_{len(run_paths):05d}.csv")
+            write_csv(_sort_frame(chunk, sort_by, numeric), run_path, encoding='utf-8',
+                      lineterminator='\n', header=False)
+            run_paths.append(run_path)
+
+        key = _merge_key([header.index(col) for col in sort_by], numeric)
+        files = [open(run_path, newline='', encoding='utf-8') for run_path in run_paths]
+        tmp_path = path + ".sorting"
+        try:
+            merged = heapq.merge(*(csv.reader(f) for f in files), key=key)
+            write_csv(_frames(merged, header, memory_rows, dtypes), tmp_path, **options)
+        finally:
+            for f in files:
+                f.close()
+        os.replace(tmp_path, path)
+    finally:
+        for run_path in run_paths:
+            os.remove(run_path)
+        os.rmdir(run_dir)
+
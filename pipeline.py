@@ -0,0 +1,275 @@
+"""
+CSV Organizer Pro 変換パイプライン
+テンプレート設定の適用（Streamlit 非依存・チャンク単位のストリーミング処理に対応）
+"""
+
+import codecs
+
+import pandas as pd
+
+import arrow_csv
+import decompress
+from aggregate import aggregate_chunks, aggregate_dataframe
+from dedupe import dedupe_chunks, dedupe_dataframe
+from expressions import evaluate_expression
+from arrow_csv import DEFAULT_ENGINE, ArrowUnsupported
+from instrumentation import stage, timed_iter
+
+# CSV の文字コード判定順（アプリの読み込みと同じ）
+CSV_ENCODINGS = ['utf-8', 'cp932', 'shift-jis']
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def merge_columns(df, columns, separator=''):
+    """空でない値だけを区切り文字で連結した列を返す"""
+    if not columns:
+        return pd.Series('', index=df.index)
+    with stage('merge', rows=len(df)):
+        result = None
+        for col in columns:
+            values = df[col].astype(str)
+            present = values.str.strip() != ''
+            values = values.where(present, '')
+            if result is None:
+                result = values
+            else:
+                joined = result + separator + values
+                result = joined.where(present & (result != ''), result.where(~present, values))
+        return result
+
+
+# 行単位で完結する操作（チャンクごと・シートごとに適用できる）
+ROW_OPERATIONS = ('merge_operations', 'split_operations', 'empty_columns', 'expression_columns')
+# 古いテンプレート（操作の順序を保存していないもの）で適用する順
+OPERATION_KINDS = ROW_OPERATIONS + ('dedupe_operations', 'aggregate_operations')
+
+
+def operation_steps(config):
+    """テンプレートの操作を適用する順に [種類, 操作] のリストで返す
+
+    operation_steps を保存したテンプレートは操作した順、古いテンプレートは
+    結合→分割→空列→計算列→重複削除→集計 の順（空列はまとめて1つの操作）。
+    """
+    if 'operation_steps' in config:
+        return [list(step) for step in config['operation_steps']]
+    steps = []
+    for kind in OPERATION_KINDS:
+        if kind == 'empty_columns':
+            if config.get(kind):
+                steps.append([kind, list(config[kind])])
+        else:
+            steps.extend([kind, op] for op in config.get(kind, []))
+    return steps
+
+
+def split_steps(config):
+    """操作を (先頭から続く行単位の操作, 残りの操作) に分ける"""
+    steps = operation_steps(config)
+    index = next((i for i, (kind, _) in enumerate(steps) if kind not in ROW_OPERATIONS), len(steps))
+    return steps[:index], steps[index:]
+
+
+def apply_step(df, kind, operation):
+    """操作を1つ適用"""
+    if kind == 'merge_operations':
+        # 結合処理
+        if all(col in df.columns for col in operation['columns']):
+            df[operation['new_column']] = merge_columns(df, operation['columns'], operation.get('separator', ''))
+    elif kind == 'split_operations':
+        # 分割処理
+        if operation['column'] in df.columns:
+            with stage('split', rows=len(df)):
+                split_data = df[operation['column']].astype(str).str.split(operation['delimiter'], expand=True)
+                for i, new_col in enumerate(operation['new_columns']):
+                    if i < split_data.shape[1]:
+                        df[new_col] = split_data[i].fillna('')
+    elif kind == 'empty_columns':
+        # 空列追加
+        for empty_col in operation:
+            if empty_col not in df.columns:
+                df[empty_col] = ''
+    elif kind == 'expression_columns':
+        # 計算列
+        with stage('expression', rows=len(df)):
+            df[operation['new_column']] = evaluate_expression(operation['expression'], df)
+    elif kind == 'dedupe_operations':
+        # 重複削除
+        subset = [col for col in operation.get('columns', []) if col in df.columns]
+        with stage('dedupe', rows=len(df)):
+            df, _stats = dedupe_dataframe(df, subset or None)
+    elif kind == 'aggregate_operations':
+        # 集計
+        with stage('aggregate', rows=len(df)):
+            df = aggregate_dataframe(df, operation['group_by'], operation['aggregations'])
+    else:
+        raise ValueError(f"未対応の操作です: {kind}")
+    return df
+
+
+def apply_row_operations(config, df):
+    """先頭から続く行単位の操作（結合・分割・空列・計算列）を適用"""
+    for kind, operation in split_steps(config)[0]:
+        df = apply_step(df, kind, operation)
+    return df
+
+
+def output_columns(config, columns):
+    """テンプレートの列順序・選択から出力列を決める"""
+    order = config.get('column_order') or list(columns)
+    selected = config.get('selected_columns')
+    selected = set(order) if selected is None else set(selected)
+    return [col for col in order if col in selected and col in columns]
+
+
+def final_frame(df, column_order, selected_columns):
+    """選択列を列順序どおりに並べた出力用 DataFrame と列名リストを返す（存在しない列は空で追加）"""
+    final_columns = [col for col in column_order if col in selected_columns]
+    for col in final_columns:
+        if col not in df.columns:
+            df[col] = ''
+    with stage('final_frame', rows=len(df)):
+        return df[final_columns].copy(), final_columns
+
+
+def apply_table_operations(config, df):
+    """重複削除・集計とそれより後の操作を適用（apply_row_operations の続き）"""
+    for kind, operation in split_steps(config)[1]:
+        df = apply_step(df, kind, operation)
+    return df
+
+
+def apply_template_config(config, df):
+    """テンプレートを操作の順に適用し (DataFrame, 列順序, 選択列) を返す"""
+    for kind, operation in operation_steps(config):
+        df = apply_step(df, kind, operation)
+
+    # 列順序と選択を適用
+    available_columns = [col for col in config.get('column_order', []) if col in df.columns]
+    selected_columns = set(col for col in config.get('selected_columns', []) if col in df.columns)
+    return df, available_columns, selected_columns
+
+
+def detect_encoding(path, candidates=CSV_ENCODINGS, block_size=1 << 20):
+    """ファイル全体を少しずつデコードして最初に成功した文字コードを返す
+
+    path には、呼ぶたびに先頭から読む新しいストリームを返す関数（圧縮ファイルの展開など）も渡せる。
+    """
+    open_source = path if callable(path) else lambda: open(path, 'rb')
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open_source() as f:
+                while True:
+                    block = f.read(block_size)
+                    if not block:
+                        decoder.decode(b'', final=True)
+                        break
+                    decoder.decode(block)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"文字コードを判定できません（{', '.join(candidates)} のいずれでもありません）")
+
+
+def iter_csv_chunks(path, chunksize=DEFAULT_CHUNKSIZE, header_row=0, encoding=None, engine=DEFAULT_ENGINE):
+    """CSV（パスまたはシーク可能なファイルオブジェクト）を文字列のままチャンク単位で読み込む
+
+    engine='pyarrow' なら pyarrow のストリーミングリーダーで読む（読み始められなければ pandas）。
+    圧縮されたパス（gzip・bzip2・xz・zstd）は展開しながら読み、ZIP は中のCSVファイルを並列に読んで
+    アーカイブ内の順につなげる（ZIP 内のファイルは列が同じであること）。
+    """
+    kind = decompress.detect(path) if isinstance(path, str) else None
+    if kind == 'zip':
+        return _iter_zip_chunks(path, chunksize, header_row, encoding, engine)
+    if kind is not None:
+        return _iter_stream_chunks(lambda: decompress.open_stream(path, kind), chunksize, header_row, encoding,
+                                   engine)
+    encoding = encoding or detect_encoding(path)
+    if engine == 'pyarrow':
+        try:
+            return arrow_csv.iter_csv_chunks(path, chunksize, header_row, encoding)
+        except ArrowUnsupported:
+            pass
+    return pd.read_csv(path, header=header_row, encoding=encoding, dtype=str,
+                       keep_default_na=False, chunksize=chunksize)
+
+
+def _iter_stream_chunks(open_stream, chunksize, header_row, encoding, engine):
+    """呼ぶたびに先頭から読む新しいストリームを返す open_stream をチャンク単位で読む（読み終えたら閉じる）"""
+    encoding = encoding or detect_encoding(open_stream)
+    if engine == 'pyarrow':
+        try:
+            return arrow_csv.iter_csv_chunks(open_stream, chunksize, header_row, encoding)
+        except ArrowUnsupported:
+            pass
+    return _closing_chunks(open_stream(), chunksize, header_row, encoding)
+
+
+def _closing_chunks(stream, chunksize, header_row, encoding):
+    with stream:
+        yield from pd.read_csv(stream, header=header_row, encoding=encoding, dtype=str,
+                               keep_default_na=False, chunksize=chunksize)
+
+
+def _iter_zip_chunks(path, chunksize, header_row, encoding, engine, workers=None):
+    """ZIP の中のCSVファイルを並列に展開・解析し、アーカイブ内の順にチャンクを返す（行番号は通しで振る）"""
+    members = [info.filename for info in decompress.zip_members(path)]
+    if not members:
+        raise ValueError("ZIPファイルにCSVファイルがありません")
+
+    def producer(name):
+        def chunks():
+            for chunk in _iter_stream_chunks(lambda: decompress.open_member(path, name), chunksize, header_row,
+                                             encoding, engine):
+                yield name, chunk
+        return chunks
+
+    columns = None
+    offset = 0
+    for name, chunk in decompress.iter_parallel([producer(name) for name in members], workers):
+        if columns is None:
+            columns = list(chunk.columns)
+        elif list(chunk.columns) != columns:
+            raise ValueError(f"ZIP内の {name} の列が {members[0]} と一致しません")
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+def _dedupe_stream(chunks, columns):
+    """存在する列だけで重複判定する dedupe_chunks"""
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return
+    subset = [col for col in columns if col in first.columns]
+
+    def all_chunks():
+        yield first
+        yield from chunks
+    yield from timed_iter('dedupe', dedupe_chunks(all_chunks(), subset or None))
+
+
+def _map_step(chunks, kind, operation):
+    for chunk in chunks:
+        yield apply_step(chunk, kind, operation)
+
+
+def stream_template(config, chunks):
+    """テンプレートをチャンクごとに操作の順に適用し、出力列に絞ったチャンクを返す"""
+    stream = chunks
+    aggregated = False
+    for kind, operation in operation_steps(config):
+        if kind == 'dedupe_operations':
+            stream = _dedupe_stream(stream, operation.get('columns', []))
+        elif kind == 'aggregate_operations' and not aggregated:
+            # 最初の集計はチャンクの部分集計、以降の操作は集計済みの小さな表に適用
+            with stage('aggregate'):
+                result = aggregate_chunks(stream, operation['group_by'], operation['aggregations'])
+            stream = [result]
+            aggregated = True
+        else:
+            stream = _map_step(stream, kind, operation)
+
+    for chunk in stream:
+        yield chunk[output_columns(config, chunk.columns)]
@@ -0,0 +1,181 @@
+"""
+CSV Organizer Pro スキーマ
+読み込んだデータから列ごとの型（整数・小数・真偽値・文字列・カテゴリ）と日付の書式を推定してテンプレートに保存し、
+次回の読み込みで型指定として使う（型の推論を省く）。新しいファイルとの差異（列の増減・型の変化）も確認する
+"""
+
+import pandas as pd
+
+SCHEMA_VERSION = 1
+
+# 推定・差異確認に使う行数（先頭から）
+INFER_SAMPLE_ROWS = 10_000
+DRIFT_SAMPLE_ROWS = 1_000
+
+# 異なる値がこの数以下かつ行数のこの割合以下の文字列列をカテゴリ候補にする
+CATEGORY_MAX_UNIQUE = 1_000
+CATEGORY_MAX_RATIO = 0.5
+CATEGORY_MIN_ROWS = 20
+
+# 日付として認識する書式（日付の列は出力の書式を変えないよう文字列のまま読み、書式だけ記録する）
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y/%m/%d', '%Y%m%d',
+    '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M',
+    '%Y年%m月%d日',
+]
+
+TYPE_LABELS = {
+    'int': '整数',
+    'float': '小数',
+    'bool': '真偽値',
+    'string': '文字列',
+    'category': 'カテゴリ',
+}
+
+# 読み込み時の pandas の型（欠損なし, 欠損あり）。pandas の nullable 整数は解析が遅いので、
+# 欠損のある整数列は型を推論したときと同じ float64 で読む
+_PANDAS_DTYPES = {
+    'int': ('int64', 'float64'),
+    'float': ('float64', 'float64'),
+    'bool': ('bool', 'boolean'),
+    'string': (str, str),
+    'category': ('category', 'category'),
+}
+
+# 型ごとに、どの推定結果なら同じ指定で読めるか
+_READABLE = {
+    'int': {'int', 'empty'},
+    'float': {'int', 'float', 'empty'},
+    'bool': {'bool', 'empty'},
+    'string': set(TYPE_LABELS) | {'empty'},
+    'category': set(TYPE_LABELS) | {'empty'},
+}
+
+_BOOL_VALUES = {'True', 'False', 'true', 'false', 'TRUE', 'FALSE'}
+
+
+def _texts(series):
+    """空でない値を文字列にして返す"""
+    values = series[series.notna()].astype(str).str.strip()
+    return values[values != '']
+
+
+def _date_format(texts):
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(texts, format=fmt, errors='coerce').notna().all():
+            return fmt
+    return None
+
+
+def classify(series):
+    """列の値から (型, 日付の書式) を推定する（値が無ければ型は 'empty'）"""
+    texts = _texts(series)
+    if texts.empty:
+        return 'empty', None
+    if texts.isin(_BOOL_VALUES).all():
+        return 'bool', None
+    # 先頭が 0 の番号（郵便番号・電話番号など）は数値にすると桁が落ちるので文字列
+    if not texts.str.match(r'^[+-]?0\d').any():
+        numbers = pd.to_numeric(texts, errors='coerce')
+        if numbers.notna().all():
+            return ('int', None) if (numbers == numbers.round()).all() else ('float', None)
+    date_format = _date_format(texts)
+    if date_format is None and len(series) >= CATEGORY_MIN_ROWS:
+        unique = texts.nunique()
+        if unique <= CATEGORY_MAX_UNIQUE and unique <= len(series) * CATEGORY_MAX_RATIO:
+            return 'category', None
+    return 'string', date_format
+
+
+def infer_schema(df, columns=None, sample_rows=INFER_SAMPLE_ROWS):
+    """DataFrame の先頭 sample_rows 行から列ごとの型を推定する"""
+    sample = df.head(sample_rows)
+    schema = {'version': SCHEMA_VERSION, 'columns': {}}
+    for col in columns if columns is not None else df.columns:
+        kind, date_format = classify(sample[col])
+        entry = {'type': 'string' if kind == 'empty' else kind,
+                 'nullable': len(_texts(sample[col])) < len(sample)}
+        if date_format:
+            entry['date_format'] = date_format
+        schema['columns'][col] = entry
+    return schema
+
+
+def pandas_dtypes(schema):
+    """pd.read_csv / pd.read_excel の dtype に渡す辞書"""
+    if not schema:
+        return None
+    return {col: _PANDAS_DTYPES[entry['type']][bool(entry.get('nullable', True))]
+            for col, entry in schema['columns'].items()}
+
+
+def arrow_types(schema, pa):
+    """pyarrow の ConvertOptions.column_types に渡す辞書（カテゴリは文字列で読んでから変換）"""
+    if not schema:
+        return {}
+    types = {'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(),
+             'string': pa.string(), 'category': pa.string()}
+    return {col: types[entry['type']] for col, entry in schema['columns'].items()}
+
+
+def category_columns(schema):
+    if not schema:
+        return []
+    return [col for col, entry in schema['columns'].items() if entry['type'] == 'category']
+
+
+def check_drift(schema, sample):
+    """保存済みスキーマと新しいデータ（先頭の数行で可）の差異を返す
+
+    差異は {'column', 'kind': missing/extra/type/nullable/date_format, 'expected', 'actual'} のリスト。
+    type は保存済みの型で読めない変化だけを報告する（整数→小数列 などは読めるので報告しない）。
+    nullable は欠損の無かった列に空欄が現れたもの。
+    """
+    issues = []
+    expected_columns = schema['columns']
+    for col, entry in expected_columns.items():
+        if col not in sample.columns:
+            issues.append({'column': col, 'kind': 'missing', 'expected': entry['type'], 'actual': None})
+            continue
+        kind, date_format = classify(sample[col])
+        if kind not in _READABLE[entry['type']]:
+            # 読めるかどうかの判定ではカテゴリと文字列を区別しない
+            actual = 'string' if kind == 'category' else kind
+            issues.append({'column': col, 'kind': 'type', 'expected': entry['type'], 'actual': actual})
+        elif not entry.get('nullable', True) and len(_texts(sample[col])) < len(sample):
+            issues.append({'column': col, 'kind': 'nullable', 'expected': entry['type'], 'actual': kind})
+        elif entry.get('date_format') and kind != 'empty' and date_format != entry['date_format']:
+            issues.append({'column': col, 'kind': 'date_format',
+                           'expected': entry['date_format'], 'actual': date_format})
+    for col in sample.columns:
+        if col not in expected_columns:
+            issues.append({'column': col, 'kind': 'extra', 'expected': None, 'actual': None})
+    return issues
+
+
+def compatible_schema(schema, issues):
+    """型が変わった列・無くなった列を除き、空欄が現れた列を欠損ありにしたスキーマ
+
+    読み込みの型指定で失敗しないようにするためのもの。
+    """
+    dropped = {issue['column'] for issue in issues if issue['kind'] in ('missing', 'type')}
+    nullable = {issue['column'] for issue in issues if issue['kind'] == 'nullable'}
+    return {**schema, 'columns': {
+        col: {**entry, 'nullable': True} if col in nullable else entry
+        for col, entry in schema['columns'].items() if col not in dropped
+    }}
+
+
+def describe_issue(issue):
+    """差異の説明文"""
+    col = issue['column']
+    if issue['kind'] == 'missing':
+        return f"列「{col}」がありません"
+    if issue['kind'] == 'extra':
+        return f"テンプレートに無い列「{col}」があります"
+    if issue['kind'] == 'type':
+        actual = TYPE_LABELS.get(issue['actual'], issue['actual'])
+        return f"列「{col}」の型が {TYPE_LABELS[issue['expected']]} から {actual} に変わっています"
+    if issue['kind'] == 'nullable':
+        return f"列「{col}」に空欄があります（保存時は空欄なし）"
+    return f"列「{col}」の日付の書式が {issue['expected']} ではありません（{issue['actual'] or '不明'}）"
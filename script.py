@@ -1,13 +1,53 @@
+import argparse
+
 import pandas as pd
 
+import decompress
+from arrow_csv import DEFAULT_ENGINE, ENGINES
+from csv_writer import ENCODINGS, ERROR_POLICIES, LINE_TERMINATOR_NAMES, QUOTING, csv_options, write_csv
+from excel_writer import ROLLOVER_MODES, write_excel
+from instrumentation import recording, stage
+from loader import read_csv_file
+
 def main():
+    parser = argparse.ArgumentParser(description="列を選んで CSV/XLSX を出力します（対話式）")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="工程ごとの時間とメモリを JSON Lines で追記するファイル（- で標準エラー出力）")
+    parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_ENGINE,
+                        help="CSVの読み込みエンジン（既定: pandas。pyarrow で読めない場合は pandas で読み直す）")
+    parser.add_argument("--excel-rollover", choices=list(ROLLOVER_MODES), default='sheet',
+                        help="XLSX出力で1シートの行数上限を超えたときの続け方（sheet: 新しいシート, file: 新しいファイル）")
+    parser.add_argument("--out-encoding", choices=list(ENCODINGS), default='utf-8',
+                        help="CSV出力の文字コード（既定: utf-8。Excel で開くなら utf-8-sig）")
+    parser.add_argument("--errors", choices=list(ERROR_POLICIES), default='strict',
+                        help="出力の文字コードで表現できない文字の扱い（既定: strict）")
+    parser.add_argument("--line-terminator", choices=list(LINE_TERMINATOR_NAMES),
+                        help="改行コード（既定: OS標準）")
+    parser.add_argument("--quoting", choices=list(QUOTING), default='minimal', help="クォート（既定: minimal）")
+    args = parser.parse_args()
+
+    output_options = csv_options(args.out_encoding, args.errors, quoting=args.quoting)
+    if args.line_terminator:
+        output_options['lineterminator'] = LINE_TERMINATOR_NAMES[args.line_terminator]
+
+    with recording('script') as recorder:
+        try:
+            run(args.engine, args.excel_rollover, output_options)
+        finally:
+            if args.profile:
+                recorder.write_jsonl(args.profile)
+
+def run(engine=DEFAULT_ENGINE, excel_rollover='sheet', output_options=None):
     # 1. ファイル読み込み
     path = input("読み込む CSV/XLSX ファイルのパスを入力してください: ").strip()
     try:
-        if path.lower().endswith(".csv"):
-            df = pd.read_csv(path)
-        else:
-            df = pd.read_excel(path)
+        # 圧縮ファイルは中身の名前（data.csv.gz -> data.csv）、ZIP は中のCSVとして扱う
+        is_csv = decompress.inner_name(path).lower().endswith(".csv") or path.lower().endswith(".zip")
+        with stage('read_csv' if is_csv else 'read_excel'):
+            if is_csv:
+                df = read_csv_file(path, engine)
+            else:
+                df = pd.read_excel(path)
     except Exception as e:
         print(f"ファイルが見つからないか、読み込みに失敗しました: {e}")
         return
@@ -43,10 +83,14 @@ def main():
     # 7. 保存
     try:
         if out.lower().endswith(".csv"):
-            df[selected_cols].to_csv(out, index=False)
+            write_csv(df[selected_cols], out, **(output_options or csv_options('utf-8')))
+            print(f"\n完了しました。{out} を生成しました。")
         else:
-            df[selected_cols].to_excel(out, index=False)
-        print(f"\n完了しました。{out} を生成しました。")
+            _rows, parts = write_excel(df[selected_cols], out, rollover=excel_rollover)
+            files = list(dict.fromkeys(part[0] for part in parts))
+            print(f"\n完了しました。{', '.join(files)} を生成しました。")
+            if len(parts) > 1:
+                print(f"（Excel の行数上限を超えたため {len(parts)} 個のシート/ファイルに分けました）")
     except Exception as e:
         print(f"ファイルの書き出しに失敗しました: {e}")
 
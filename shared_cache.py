@@ -0,0 +1,305 @@
+"""
+CSV Organizer Pro 共有キャッシュ
+同じ内容の読み込み結果・出力データをセッション間で共有する
+（内容ハッシュをキーに、参照数・メモリ上限・有効期限を管理し、上限を超えた分はディスクへ退避）
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+# 環境変数で上書きできる既定値
+DEFAULT_MAX_MEMORY = int(os.environ.get('CSV_ORGANIZER_CACHE_MB', 1024)) * 1024 * 1024
+DEFAULT_TTL_SECONDS = int(os.environ.get('CSV_ORGANIZER_CACHE_TTL', 60 * 60))
+
+# メモリ使用量の見積もりに使う行数（文字列列の全行を走査しないため）
+_SIZE_SAMPLE_ROWS = 1000
+
+
+def _json_default(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def content_key(*parts):
+    """内容から決まるキー（bytes はそのまま、それ以外は JSON にしてハッシュ）"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            data = part
+        else:
+            data = json.dumps(part, ensure_ascii=False, sort_keys=True, default=_json_default).encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def estimate_size(value):
+    """値のおおよそのメモリ使用量(バイト)"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        size = int(value.memory_usage(index=True, deep=False).sum())
+        if len(value) and (value.dtypes == object).any():
+            # 文字列の中身は先頭の行から1行あたりの量を見積もる
+            sample = value.head(_SIZE_SAMPLE_ROWS)
+            extra = (sample.memory_usage(index=False, deep=True).sum()
+                     - sample.memory_usage(index=False, deep=False).sum())
+            size += int(extra / len(sample) * len(value))
+        return size
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    return 64
+
+
+def _share(value):
+    # DataFrame は浅いコピーを渡す（列の追加はセッション側だけに反映される）
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return value
+
+
+class _Entry:
+    def __init__(self, value):
+        self.value = value
+        self.size = estimate_size(value)
+        self.path = None
+        self.dtypes = None
+        self.created_at = self.last_access = time.time()
+        # 参照しているセッション -> 最終参照時刻（有効期限を過ぎたら参照を外す）
+        self.owners = {}
+
+
+class SharedCache:
+    """プロセス全体で共有する内容アドレス方式のキャッシュ
+
+    - get_or_create は同じキーの生成を1回にまとめる（同時に来た他のセッションは完成を待つ）
+    - DataFrame は浅いコピーを返すので、列の追加などはセッションごとに独立する
+    - 参照中（acquire したセッションがある）のエントリは削除しない
+    - メモリ上限を超えると、参照されていないもの、参照中のものの順に、それぞれ古い順でディスクへ退避
+      （DataFrame は Parquet、書けない型が含まれる場合は pickle。退避ファイルの読み込みはロックの外で行う）
+    - 有効期限を過ぎて参照されていないエントリはディスクからも削除
+    """
+
+    def __init__(self, max_memory=DEFAULT_MAX_MEMORY, ttl_seconds=DEFAULT_TTL_SECONDS, spill_dir=None):
+        self.max_memory = max_memory
+        self.ttl_seconds = ttl_seconds
+        self._spill_dir = spill_dir
+        self._own_spill_dir = spill_dir is None
+        self._entries = {}
+        self._creating = {}
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'spills': 0, 'evictions': 0}
+        atexit.register(self.close)
+
+    # ---- 参照 ----
+
+    def get(self, key, owner=None):
+        """キャッシュの値（無ければ None）。owner を渡すと参照として登録"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            entry.last_access = time.time()
+            if owner is not None:
+                entry.owners[owner] = entry.last_access
+            if entry.value is not None:
+                self.stats['hits'] += 1
+                return _share(entry.value)
+            path, dtypes = entry.path, entry.dtypes
+        # 退避ファイルはロックを持たずに読む（読んでいる間も他のセッションはキャッシュを使える）
+        try:
+            value = self._read_spill(path, dtypes)
+        except (OSError, ValueError, pickle.UnpicklingError):
+            with self._lock:
+                # 読んでいる間に削除・置き換えられたエントリには触らない
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+                self.stats['misses'] += 1
+            return None
+        with self._lock:
+            if self._entries.get(key) is entry and entry.value is None:
+                entry.value = value
+                self._enforce_limits(keep=key)
+            self.stats['disk_hits'] += 1
+            self.stats['hits'] += 1
+        return _share(value)
+
+    def put(self, key, value, owner=None):
+        """値を登録し、共有用の値（DataFrame なら浅いコピー）を返す"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._delete_spill(old)
+            entry = _Entry(value)
+            if owner is not None:
+                entry.owners[owner] = entry.last_access
+            self._entries[key] = entry
+            self._enforce_limits(keep=key)
+            return _share(value)
+
+    def get_or_create(self, key, factory, owner=None):
+        """キャッシュにあれば返し、無ければ factory() で作って登録"""
+        value = self.get(key, owner)
+        if value is not None:
+            return value
+        with self._lock:
+            creating = self._creating.setdefault(key, threading.Lock())
+        try:
+            with creating:
+                value = self.get(key, owner)
+                if value is not None:
+                    return value
+                return self.put(key, factory(), owner)
+        finally:
+            with self._lock:
+                if self._creating.get(key) is creating:
+                    del self._creating[key]
+
+    def acquire(self, key, owner):
+        """owner の参照を登録・更新（有効期限内は退避されない）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.owners[owner] = time.time()
+            return entry is not None
+
+    def release(self, key, owner):
+        """owner の参照を外す"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.owners.pop(owner, None)
+            self._enforce_limits()
+
+    # ---- 管理 ----
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values() if entry.value is not None)
+
+    def summary(self):
+        """件数・メモリ/ディスク使用量・ヒット数などを返す"""
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                'entries': len(entries),
+                'memory_mb': sum(e.size for e in entries if e.value is not None) / 1024 / 1024,
+                'disk_mb': sum(os.path.getsize(e.path) for e in entries if e.path and os.path.exists(e.path)) / 1024 / 1024,
+                'referenced': sum(1 for e in entries if e.owners),
+                **self.stats,
+            }
+
+    def _enforce_limits(self, keep=None):
+        now = time.time()
+        # 有効期限切れの参照を外し、参照も利用もされていないエントリを削除
+        for key, entry in list(self._entries.items()):
+            entry.owners = {owner: seen for owner, seen in entry.owners.items() if now - seen < self.ttl_seconds}
+            if key != keep and not entry.owners and now - entry.last_access >= self.ttl_seconds:
+                self._remove(key)
+
+        # メモリ上限を超えていれば、参照されていないものから古い順にディスクへ退避し、退避できなかった分は削除
+        used = self.memory_bytes
+        if used <= self.max_memory:
+            return
+        used = self._spill_oldest(used, keep, referenced=False)
+        for key, entry in list(self._entries.items()):
+            if used <= self.max_memory:
+                break
+            if key != keep and entry.value is not None and not entry.owners:
+                used -= entry.size
+                self._remove(key)
+        # まだ超えていれば参照中のものも古い順に退避する（削除はしない。次の get でディスクから戻る）
+        if used > self.max_memory:
+            self._spill_oldest(used, keep, referenced=True)
+
+    def _spill_oldest(self, used, keep, referenced):
+        """参照中か否かが referenced のエントリを古い順に退避し、退避後のメモリ使用量を返す"""
+        candidates = sorted(
+            (entry for key, entry in self._entries.items()
+             if key != keep and entry.value is not None and bool(entry.owners) == referenced),
+            key=lambda entry: entry.last_access
+        )
+        for entry in candidates:
+            if used <= self.max_memory:
+                break
+            if self._spill(entry):
+                used -= entry.size
+        return used
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._delete_spill(entry)
+        self.stats['evictions'] += 1
+
+    # ---- ディスク退避 ----
+
+    def _spill_path(self, suffix):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="csv_organizer_cache_")
+        os.makedirs(self._spill_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self._spill_dir)
+        os.close(fd)
+        return path
+
+    def _spill(self, entry):
+        """値をディスクに書き出してメモリから外す（失敗したら False）"""
+        if entry.path is None:
+            try:
+                entry.path = self._write_spill(entry.value)
+            except OSError:
+                return False
+            if isinstance(entry.value, pd.DataFrame):
+                entry.dtypes = entry.value.dtypes.to_dict()
+        entry.value = None
+        self.stats['spills'] += 1
+        return True
+
+    def _write_spill(self, value):
+        if isinstance(value, pd.DataFrame):
+            path = self._spill_path('.parquet')
+            try:
+                value.to_parquet(path)
+                return path
+            except (ImportError, ValueError, TypeError):
+                # pyarrow が無い・型の混在した列がある場合は pickle で退避
+                os.remove(path)
+        path = self._spill_path('.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @staticmethod
+    def _read_spill(path, dtypes):
+        if path.endswith('.parquet'):
+            # Parquet から戻すと文字列列が string 型になるので元の型に揃える
+            return pd.read_parquet(path).astype(dtypes)
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _delete_spill(self, entry):
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            entry.path = None
+
+    def close(self):
+        """すべてのエントリと退避ファイルを削除"""
+        with self._lock:
+            self._entries.clear()
+            if self._own_spill_dir and self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
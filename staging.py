@@ -0,0 +1,66 @@
+"""
+CSV Organizer Pro アップロードの一時保存
+アップロードされたファイルを一時ファイルに書き出し、メモリマップで読み込めるようにする
+（バイト列のコピー・BytesIO・DataFrame が同時にメモリに載らないようにする）
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+# 書き出し・ハッシュ計算で一度に読むバイト数
+COPY_BLOCK_SIZE = 1024 * 1024
+
+# 一時ファイルの保存先（未指定ならOSの一時ディレクトリ）
+STAGING_DIR = os.environ.get('CSV_ORGANIZER_STAGING_DIR') or None
+
+
+def file_digest(fileobj, block_size=COPY_BLOCK_SIZE):
+    """ファイルオブジェクトの内容のハッシュ（ブロックごとに読むので全体をコピーしない）"""
+    digest = hashlib.blake2b(digest_size=20)
+    fileobj.seek(0)
+    while True:
+        block = fileobj.read(block_size)
+        if not block:
+            break
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class StagedFile:
+    """一時ファイルに書き出したアップロード
+
+    with で使うとブロックを抜けたときに一時ファイルを削除する。
+    """
+
+    def __init__(self, fileobj, file_name, dir=STAGING_DIR):
+        self.file_name = file_name
+        suffix = os.path.splitext(file_name)[1].lower()
+        fd, self.path = tempfile.mkstemp(prefix='csv_organizer_upload_', suffix=suffix, dir=dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                fileobj.seek(0)
+                shutil.copyfileobj(fileobj, f, COPY_BLOCK_SIZE)
+            fileobj.seek(0)
+        except BaseException:
+            self.cleanup()
+            raise
+        self.size = os.path.getsize(self.path)
+
+    def cleanup(self):
+        """一時ファイルを削除"""
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+        return False
@@ -0,0 +1,131 @@
+"""
+CSV Organizer Pro テンプレートの照合
+ファイルのヘッダー行だけを見て、保存済みテンプレートとの列の一致度を計算する
+（列名 -> テンプレート の転置インデックスを作っておき、テンプレートが多くてもすぐに照合できる）
+"""
+
+from aggregate import output_column
+from expressions import referenced_columns
+
+
+def produced_columns(config):
+    """テンプレートの操作で作られる列"""
+    produced = set(config.get('empty_columns', []))
+    produced.update(op['new_column'] for op in config.get('merge_operations', []))
+    for op in config.get('split_operations', []):
+        produced.update(op['new_columns'])
+    produced.update(op['new_column'] for op in config.get('expression_columns', []))
+    for op in config.get('aggregate_operations', []):
+        produced.update(output_column(spec) for spec in op['aggregations'])
+    return produced
+
+
+def required_columns(config):
+    """出力と操作に必要な入力ファイルの列（無いと空になる・操作が適用されない列）"""
+    needed = set(config.get('selected_columns', []))
+    for op in config.get('merge_operations', []):
+        needed.update(op['columns'])
+    needed.update(op['column'] for op in config.get('split_operations', []))
+    for op in config.get('expression_columns', []):
+        needed.update(referenced_columns(op['expression']))
+    for op in config.get('dedupe_operations', []):
+        needed.update(op.get('columns', []))
+    for op in config.get('aggregate_operations', []):
+        needed.update(op['group_by'])
+        needed.update(spec['column'] for spec in op['aggregations'])
+    return needed - produced_columns(config)
+
+
+def expected_columns(config):
+    """テンプレートが想定する入力ファイルのヘッダー（スキーマがあればその列、無ければ列順序などから推定）"""
+    if config.get('schema'):
+        return set(config['schema']['columns'])
+    return (set(config.get('column_order', [])) | required_columns(config)) - produced_columns(config)
+
+
+class TemplateIndex:
+    """テンプレートの想定ヘッダーを列名ごとの転置インデックスにしたもの
+
+    sync() で保存済みテンプレートとの差分だけを更新する。
+    match() はヘッダーの列ごとにインデックスを引くので、テンプレートの数ではなく
+    ヘッダーの列数と一致したテンプレートの数に比例した時間で照合できる。
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._expected = {}
+        self._required = {}
+        self._configs = {}
+
+    def __len__(self):
+        return len(self._expected)
+
+    def add(self, name, config):
+        self.remove(name)
+        expected = frozenset(expected_columns(config))
+        self._expected[name] = expected
+        self._required[name] = frozenset(required_columns(config))
+        self._configs[name] = config
+        for col in expected:
+            self._postings.setdefault(col, set()).add(name)
+
+    def remove(self, name):
+        for col in self._expected.pop(name, ()):
+            names = self._postings[col]
+            names.discard(name)
+            if not names:
+                del self._postings[col]
+        self._required.pop(name, None)
+        self._configs.pop(name, None)
+
+    def sync(self, templates):
+        """{名前: {'config': ...}} に合わせて追加・削除・変更のあった分だけ更新"""
+        for name in [name for name in self._configs if name not in templates]:
+            self.remove(name)
+        for name, info in templates.items():
+            if self._configs.get(name) is not info['config']:
+                self.add(name, info['config'])
+        return self
+
+    def match(self, header, limit=None):
+        """ヘッダーとの一致度が高い順に照合結果を返す
+
+        結果は {'name', 'matched', 'missing', 'extra', 'score', 'missing_required'} の辞書のリスト。
+        missing / extra / missing_required は列名のリスト、score は Jaccard 係数（0〜1）。
+        limit を渡すと上位 limit 件だけ列名のリストを作る（件数・スコアは全件計算）。
+        """
+        header = list(dict.fromkeys(header))
+        counts = dict.fromkeys(self._expected, 0)
+        for col in header:
+            for name in self._postings.get(col, ()):
+                counts[name] += 1
+
+        def score(name):
+            matched = counts[name]
+            union = len(self._expected[name]) + len(header) - matched
+            return matched / union if union else 0.0
+
+        ranked = sorted(counts, key=lambda name: (-score(name), -counts[name], name))
+        results = []
+        for rank, name in enumerate(ranked):
+            if limit is None or rank < limit:
+                results.append(self.compare(name, header))
+            else:
+                results.append({'name': name, 'matched': counts[name], 'score': score(name)})
+        return results
+
+    def compare(self, name, header):
+        """1つのテンプレートとヘッダーの照合結果（match() と同じ形式）"""
+        header = list(dict.fromkeys(header))
+        expected = self._expected[name]
+        header_set = set(header)
+        matched = len(expected & header_set)
+        union = len(expected) + len(header) - matched
+        return {
+            'name': name,
+            'matched': matched,
+            'score': matched / union if union else 0.0,
+            'missing': sorted(expected - header_set),
+            'extra': [col for col in header if col not in expected],
+            'missing_required': sorted(self._required[name] - header_set),
+        }
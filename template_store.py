@@ -0,0 +1,109 @@
+"""
+CSV Organizer Pro テンプレートの保存先
+テンプレートを1つずつJSONファイルとしてディレクトリに保存し、アプリ・ジョブAPI・CLI で共有する
+（ファイルの形式はアプリの「📤 JSON出力」と同じなので、batch.py --template にもそのまま渡せる）
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from partition import safe_filename
+
+# テンプレートの保存先（環境変数で変更可能）
+TEMPLATE_DIR = os.environ.get('CSV_ORGANIZER_TEMPLATE_DIR') or "templates"
+
+
+def template_filename(name):
+    """テンプレート名に対応するファイル名（ファイル名に使えない文字を含む名前はハッシュを付けて区別する）"""
+    safe = safe_filename(name)
+    if safe != name:
+        safe += '_' + hashlib.blake2b(name.encode('utf-8'), digest_size=4).hexdigest()
+    return safe + '.json'
+
+
+class TemplateStore:
+    """ディレクトリに保存されたテンプレート（{名前: {'config', 'created_at', 'description'}}）
+
+    一覧はディレクトリの更新時刻が変わったときだけ読み直し、変わっていなければ前回と同じ辞書を返す
+    （保存・削除はファイルの置き換えで行うので、他のプロセスの変更も更新時刻で分かる）。
+    """
+
+    def __init__(self, directory=TEMPLATE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._templates = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, template_filename(name))
+
+    def _read(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(data, dict) or 'config' not in data:
+                continue
+            name = data.get('name') or entry.name[:-len('.json')]
+            entries.append((data.get('created_at') or '', name, {
+                'config': data['config'],
+                'created_at': data.get('created_at', ''),
+                'description': data.get('description', ''),
+            }))
+        # 作成日時の順（アプリで保存した順）
+        return {name: info for _, name, info in sorted(entries, key=lambda e: (e[0], e[1]))}
+
+    def load_all(self):
+        """保存済みテンプレートの辞書（ディレクトリが無ければ空）"""
+        try:
+            stamp = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if stamp != self._stamp:
+                templates = self._read()
+                # 内容が変わっていないテンプレートは前回と同じ辞書を使う（照合インデックスの更新を省く）
+                for name, info in templates.items():
+                    previous = self._templates.get(name)
+                    if previous is not None and previous == info:
+                        templates[name] = previous
+                self._templates = templates
+                self._stamp = stamp
+            return dict(self._templates)
+
+    def get(self, name):
+        """名前のテンプレート（無ければ None）"""
+        return self.load_all().get(name)
+
+    def save(self, name, config, description=None, created_at=None):
+        """テンプレートを保存する（同じ名前があれば上書き。書き込み途中で止まっても前の内容が残る）"""
+        os.makedirs(self.directory, exist_ok=True)
+        info = {
+            'name': name,
+            'config': config,
+            'created_at': created_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'description': config.get('description', '') if description is None else description,
+        }
+        path = self._path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        self._stamp = None
+        return info
+
+    def delete(self, name):
+        """テンプレートを削除する（無ければ何もしない）"""
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+        self._stamp = None
@@ -0,0 +1,133 @@
+"""ジョブAPIの呼び出し制限（トークン・Origin・Host・パスの範囲・本文の大きさ・待ち行列）のテスト"""
+
+import json
+import socket
+
+import pytest
+
+from api_server import JobService, start_in_thread
+from jobs import JobManager
+from template_store import TemplateStore
+
+TOKEN = 'test-token'
+CONFIG = {'column_order': ['a', 'b'], 'selected_columns': ['a', 'b']}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, headers=None, body=b'', send_body=True):
+    """生のリクエストを送って (ステータス, 本文) を返す（Host・Content-Length を自由に指定するため socket で送る）"""
+    headers = {'Host': f'127.0.0.1:{port}', 'X-API-Token': TOKEN, 'Content-Length': str(len(body)),
+               **(headers or {})}
+    head = f"{method} {path} HTTP/1.1\r\n" + ''.join(
+        f"{key}: {value}\r\n" for key, value in headers.items() if value is not None) + "\r\n"
+    with socket.create_connection(('127.0.0.1', port), timeout=10) as s:
+        s.sendall(head.encode('latin-1') + (body if send_body else b''))
+        data = b''
+        while chunk := s.recv(65536):
+            data += chunk
+    status = int(data.split(b' ', 2)[1])
+    return status, data.split(b'\r\n\r\n', 1)[1]
+
+
+def json_body(params):
+    return {'Content-Type': 'application/json'}, json.dumps(params).encode('utf-8')
+
+
+@pytest.fixture
+def roots(tmp_path):
+    inputs, outputs = tmp_path / 'in', tmp_path / 'out'
+    inputs.mkdir()
+    outputs.mkdir()
+    (inputs / 'data.csv').write_text('a,b\n1,2\n', encoding='utf-8')
+    (tmp_path / 'secret.csv').write_text('a,b\n1,2\n', encoding='utf-8')
+    return tmp_path
+
+
+def start(roots, max_queue=4):
+    store = TemplateStore(str(roots / 'templates'))
+    store.save('t', CONFIG)
+    work = roots / 'work'
+    work.mkdir(exist_ok=True)
+    service = JobService(JobManager(max_workers=1), store, max_queue=max_queue, work_dir=str(work),
+                         input_roots=[str(roots / 'in')], output_roots=[str(roots / 'out')])
+    port = free_port()
+    start_in_thread(service, TOKEN, port=port)
+    return service, port
+
+
+@pytest.fixture
+def server(roots):
+    service, port = start(roots)
+    yield port
+    service.close()
+
+
+@pytest.mark.parametrize('token', [None, '', 'wrong-token'])
+def test_token_required(server, token):
+    status, body = request(server, 'GET', '/jobs', {'X-API-Token': token})
+    assert status == 401
+    assert 'X-API-Token' in json.loads(body)['error']
+
+
+def test_health_does_not_need_token(server):
+    assert request(server, 'GET', '/health', {'X-API-Token': None})[0] == 200
+
+
+def test_browser_origin_is_rejected(server):
+    # トークンが正しくてもブラウザ経由（Origin 付き）は断る
+    assert request(server, 'GET', '/jobs', {'Origin': 'http://example.com'})[0] == 403
+    assert request(server, 'GET', '/health', {'Origin': 'http://example.com'})[0] == 403
+
+
+@pytest.mark.parametrize('host', ['evil.example.com', 'evil.example.com:8600', ''])
+def test_non_local_host_is_rejected(server, host):
+    assert request(server, 'GET', '/jobs', {'Host': host})[0] == 403
+
+
+@pytest.mark.parametrize('params', [
+    {'template': 't', 'input': '../secret.csv'},
+    {'template': 't', 'input': None},
+    {'template': 't', 'input': 'data.csv', 'output': '../out.csv'},
+    {'template': 't', 'input': 'data.csv', 'output': None},
+])
+def test_paths_outside_roots_are_rejected(server, roots, params):
+    params = {key: value if value is not None else str(roots / 'secret.csv') for key, value in params.items()}
+    status, body = request(server, 'POST', '/jobs', *json_body(params))
+    assert status == 403
+    assert '許可' in json.loads(body)['error']
+
+
+def test_path_inside_roots_is_accepted(server, roots):
+    status, body = request(server, 'POST', '/jobs?wait=1', *json_body(
+        {'template': 't', 'input': 'data.csv', 'output': 'result.csv'}))
+    assert status == 200
+    assert json.loads(body)['status'] == 'done'
+    assert (roots / 'out' / 'result.csv').exists()
+
+
+def test_upload(server):
+    status, body = request(server, 'POST', '/jobs?template=t&wait=1', body=b'a,b\n1,2\n3,4\n')
+    assert status == 200
+    assert body.decode('utf-8-sig').splitlines() == ['a,b', '1,2', '3,4']
+
+
+def test_oversized_upload_is_rejected_before_reading(server):
+    status, body = request(server, 'POST', '/jobs?template=t', {'Content-Length': str(1 << 40)}, send_body=False)
+    assert status == 413
+    assert '大きすぎ' in json.loads(body)['error']
+
+
+def test_full_queue_is_rejected_before_reading(roots):
+    service, port = start(roots, max_queue=0)
+    try:
+        # 本文を送らなくても待ち行列がいっぱいならすぐに 503 が返り、一時ファイルも作らない
+        status, _ = request(port, 'POST', '/jobs?template=t', {'Content-Length': '1000000'}, send_body=False)
+        assert status == 503
+        assert list((roots / 'work').iterdir()) == []
+    finally:
+        service.close()
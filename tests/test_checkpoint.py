@@ -0,0 +1,71 @@
+"""チェックポイントの part の区切りと、続きからの再開のテスト"""
+
+import pandas as pd
+import pytest
+
+import checkpoint
+from csv_writer import csv_options
+
+CONFIG = {
+    'column_order': ['id', 'memo', 'x'],
+    'selected_columns': ['id', 'memo', 'x'],
+    'expression_columns': [{'new_column': 'x', 'expression': 'v * 2'}],
+}
+
+
+def test_record_end_skips_newlines_inside_quotes(tmp_path):
+    path = tmp_path / 'in.csv'
+    data = b'a,b\n1,"x\n""y""\nz"\n2,w\n'
+    path.write_bytes(data)
+    # 2行目のクォート内の改行では区切らず、その行の終わりで区切る
+    assert checkpoint.record_end(str(path), 4, 6, len(data)) == data.index(b'2,w')
+    assert checkpoint.record_end(str(path), 4, len(data) - 1, len(data)) == len(data)
+
+
+def test_resume_reads_from_last_part_offset(tmp_path, monkeypatch):
+    n = 3000
+    pd.DataFrame({
+        'id': [str(i) for i in range(n)],
+        'memo': [f'行{i}\n"続き"' if i % 5 == 0 else f'メモ{i}' for i in range(n)],
+        'v': [str(i % 11) for i in range(n)],
+    }).to_csv(tmp_path / 'in.csv', index=False)
+    input_path, output_path = str(tmp_path / 'in.csv'), str(tmp_path / 'out.csv')
+    options = csv_options()
+    settings = checkpoint.settings_for(CONFIG, 0, options, 200)
+
+    write_part = checkpoint._write_part
+    calls = []
+
+    def crash_on_third_part(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return write_part(*args, **kwargs)
+
+    monkeypatch.setattr(checkpoint, '_write_part', crash_on_third_part)
+    with pytest.raises(KeyboardInterrupt):
+        checkpoint.apply_to_file(CONFIG, input_path, output_path, checkpoint.Manifest(str(tmp_path / 'ck'), settings),
+                                 200, commit_chunks=2)
+    monkeypatch.setattr(checkpoint, '_write_part', write_part)
+
+    manifest = checkpoint.Manifest(str(tmp_path / 'ck'), settings)
+    parts = manifest.files[input_path]['parts']
+    assert len(parts) == 2 and parts[0]['end'] == parts[1]['start']
+
+    # 続きから読むときは、記録した位置より前を読み込まない
+    segments = []
+    reader = checkpoint.SegmentReader
+
+    def recording_reader(path, header, start, end):
+        segments.append(start)
+        return reader(path, header, start, end)
+
+    monkeypatch.setattr(checkpoint, 'SegmentReader', recording_reader)
+    result = checkpoint.apply_to_file(CONFIG, input_path, output_path, manifest, 200, commit_chunks=2)
+    assert segments[0] == parts[1]['end']
+    assert result['resumed_rows'] == parts[0]['input_rows'] + parts[1]['input_rows']
+
+    expected = pd.read_csv(input_path, dtype=str, keep_default_na=False)
+    actual = pd.read_csv(output_path, dtype=str, keep_default_na=False)
+    assert actual['id'].tolist() == expected['id'].tolist()
+    assert actual['memo'].tolist() == expected['memo'].tolist()
@@ -0,0 +1,50 @@
+"""重複行削除がメモリ上限を超えてディスクへ退避しても drop_duplicates と同じ結果になるかのテスト"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dedupe import dedupe_chunks, dedupe_dataframe
+
+
+def sample(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'store': rng.choice(['A', 'B', 'C', '東京'], rows),
+        'code': rng.integers(0, 150, rows).astype(str),
+        'memo': rng.choice(['', 'x', 'y,z'], rows),
+    })
+
+
+def run_chunks(df, chunksize, **kwargs):
+    stats = {}
+    chunks = [df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize)]
+    result = pd.concat(list(dedupe_chunks(chunks, stats=stats, **kwargs)))
+    return result, stats
+
+
+@pytest.mark.parametrize('subset', [None, ['store', 'code']])
+def test_tiny_memory_budget_spills_and_matches_drop_duplicates(tmp_path, subset):
+    df = sample()
+    result, stats = run_chunks(df, 100, subset=subset, max_keys_in_memory=16, spill_dir=str(tmp_path))
+    assert stats['spilled_runs'] > 1
+    pd.testing.assert_frame_equal(result, df.drop_duplicates(subset=subset))
+    assert stats['rows_out'] == len(result)
+    # 退避ファイルは終了時に削除される
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilled_and_in_memory_results_are_identical(tmp_path):
+    df = sample(seed=1)
+    spilled, spilled_stats = run_chunks(df, 50, max_keys_in_memory=1, spill_dir=str(tmp_path))
+    in_memory, memory_stats = run_chunks(df, 50)
+    assert spilled_stats['spilled_runs'] > 0
+    assert memory_stats['spilled_runs'] == 0
+    pd.testing.assert_frame_equal(spilled, in_memory)
+
+
+def test_dedupe_dataframe_with_tiny_budget():
+    df = sample(seed=2)
+    result, stats = dedupe_dataframe(df, max_keys_in_memory=1)
+    pd.testing.assert_frame_equal(result, df.drop_duplicates().reset_index(drop=True))
+    assert stats['rows_removed'] == len(df) - len(result)
@@ -0,0 +1,76 @@
+"""計算列の式で使える構文・関数の制限と、評価時のエラーのテスト"""
+
+import pandas as pd
+import pytest
+
+from expressions import FUNCTIONS, ExpressionError, evaluate_expression, referenced_columns
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'code': ['a1', 'b2'], 'price': ['100', '250'], 'qty': ['2', '3']})
+
+
+@pytest.mark.parametrize('text', [
+    'price.__class__',
+    'code.upper()',
+    '().__class__.__bases__',
+    '[1, 2][0]',
+    'lambda: 1',
+    'price if qty else code',
+    '{"a": 1}',
+    'f"{price}"',
+])
+def test_rejects_syntax_outside_whitelist(df, text):
+    with pytest.raises(ExpressionError):
+        evaluate_expression(text, df)
+
+
+@pytest.mark.parametrize('text', [
+    '__import__("os")',
+    'eval("1")',
+    'open("x")',
+    'getattr(price, "__class__")',
+    'int(price)',
+])
+def test_rejects_calls_outside_functions(df, text):
+    name = text.split('(')[0]
+    assert name not in FUNCTIONS
+    with pytest.raises(ExpressionError, match='使用できない関数'):
+        evaluate_expression(text, df)
+
+
+def test_dunder_names_are_only_column_lookups(df):
+    # 名前はすべて列名として扱うので、組み込みのオブジェクトには届かない
+    with pytest.raises(ExpressionError, match='列が見つかりません'):
+        evaluate_expression('__builtins__', df)
+
+
+@pytest.mark.parametrize('text', ['9**9**9**9', 'code and price', '1 / 0'])
+def test_runtime_errors_become_expression_errors(df, text):
+    with pytest.raises(ExpressionError, match='式を評価できません'):
+        evaluate_expression(text, df)
+
+
+def test_whitelisted_expression(df):
+    assert evaluate_expression('price * qty', df).tolist() == [200, 750]
+    assert evaluate_expression('upper(`code`)', df).tolist() == ['A1', 'B2']
+    assert referenced_columns('round(price / qty, 1)') == {'price', 'qty'}
+
+
+def test_full_width_and_half_width_column_names():
+    # Python は名前を NFKC で正規化するが、式に書いたとおりの列名で参照する
+    df = pd.DataFrame({'金額Ａ': ['100', '200'], 'ｶﾅ': ['ab', 'c']})
+    assert evaluate_expression('金額Ａ * 2', df).tolist() == [200, 400]
+    assert evaluate_expression('upper(ｶﾅ)', df).tolist() == ['AB', 'C']
+    assert referenced_columns('金額Ａ + len(ｶﾅ)') == {'金額Ａ', 'ｶﾅ'}
+    # 表記が違っても、NFKC で同じになる列が1つだけならその列を使う
+    assert evaluate_expression('金額A + 1', df).tolist() == [101, 201]
+
+
+def test_ambiguous_width_variants_require_backticks():
+    df = pd.DataFrame({'ＡＢ': ['1'], 'AB': ['2']})
+    assert evaluate_expression('ＡＢ', df).tolist() == ['1']
+    assert evaluate_expression('AB', df).tolist() == ['2']
+    with pytest.raises(ExpressionError, match='バッククォート'):
+        evaluate_expression('AＢ', df)
@@ -0,0 +1,35 @@
+"""差分処理で、書き込み中の行を処理しないことのテスト"""
+
+import pandas as pd
+
+import incremental
+from csv_writer import csv_options
+
+CONFIG = {'column_order': ['id', 'memo'], 'selected_columns': ['id', 'memo']}
+
+
+def test_complete_end_ignores_newlines_inside_quotes(tmp_path):
+    path = tmp_path / 'in.csv'
+    data = b'id,memo\n1,"a\nb"\n2,"line1\nline2'
+    path.write_bytes(data)
+    assert incremental.complete_end(str(path), 8, len(data)) == data.index(b'2,')
+
+
+def test_partially_written_quoted_record_waits_for_next_run(tmp_path):
+    input_path, output_path = tmp_path / 'in.csv', tmp_path / 'out.csv'
+    input_path.write_bytes(b'id,memo\n1,x\n')
+    options = csv_options('utf-8')
+    incremental.run(str(input_path), CONFIG, str(output_path), output_options=options)
+
+    # 複数行の値を書き込んでいる途中（クォートが閉じていない）
+    with open(input_path, 'ab') as f:
+        f.write(b'2,"line1\nline2')
+    result = incremental.run(str(input_path), CONFIG, str(output_path), output_options=options)
+    assert result['input_rows'] == 0 and result['pending_bytes'] > 0
+
+    with open(input_path, 'ab') as f:
+        f.write(b'"\n3,y\n')
+    result = incremental.run(str(input_path), CONFIG, str(output_path), output_options=options)
+    assert result['mode'] == 'incremental' and result['input_rows'] == 2
+    output = pd.read_csv(output_path, dtype=str, keep_default_na=False)
+    assert output.to_dict('list') == {'id': ['1', '2', '3'], 'memo': ['x', 'line1\nline2', 'y']}
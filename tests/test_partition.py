@@ -0,0 +1,37 @@
+"""値ごとのファイル分割のテスト"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from csv_writer import csv_options
+from partition import write_partitions
+
+
+def test_keys_differing_only_in_case_get_distinct_files(tmp_path):
+    df = pd.DataFrame({'city': ['Tokyo', 'TOKYO', 'tokyo', 'Tokyo'], 'n': ['1', '2', '3', '4']})
+    result = write_partitions([df], str(tmp_path), 'city', csv_options=csv_options('utf-8'), max_buffered_rows=1)
+    names = [os.path.basename(path).casefold() for path, _rows in result.values()]
+    assert len(set(names)) == 3
+    for key, (path, rows) in result.items():
+        written = pd.read_csv(path, dtype=str)
+        assert written['city'].tolist() == [key] * rows
+
+
+@pytest.mark.parametrize('quoting', ['minimal', 'all', 'nonnumeric'])
+def test_sorted_output_matches_unsorted_format(tmp_path, quoting):
+    df = pd.DataFrame({
+        'city': ['Osaka', 'Tokyo'] * 6,
+        'name': [f'n,{i}' if i % 3 == 0 else f'n{i}' for i in range(12)],
+        'amount': [12 - i for i in range(12)],
+        'ratio': [i / 4 for i in range(12)],
+    })
+    options = csv_options('utf-8', quoting=quoting)
+    sorted_files = write_partitions([df], str(tmp_path / 'sorted'), 'city', csv_options=options,
+                                    sort_by=['amount'], sort_numeric=True, sort_memory_rows=2)
+    expected_dir = tmp_path / 'expected'
+    expected = write_partitions([df.sort_values('amount')], str(expected_dir), 'city', csv_options=options)
+    for key, (path, _rows) in sorted_files.items():
+        with open(path, 'rb') as f, open(expected[key][0], 'rb') as g:
+            assert f.read() == g.read()
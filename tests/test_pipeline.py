@@ -0,0 +1,81 @@
+"""テンプレートの操作を保存した順に再現するかのテスト"""
+
+import pandas as pd
+import pytest
+
+from expressions import ExpressionError
+from pipeline import apply_template_config, operation_steps, stream_template
+
+AGGREGATE = {'group_by': ['store'], 'aggregations': [{'column': 'amt', 'func': 'sum'}]}
+
+
+def sales():
+    return pd.DataFrame({'store': ['A', 'A', 'B'], 'amt': ['100', '200', '50']})
+
+
+def run_stream(config, df, chunksize=1):
+    chunks = [df.iloc[i:i + chunksize].copy() for i in range(0, len(df), chunksize)]
+    return pd.concat(list(stream_template(config, chunks)), ignore_index=True)
+
+
+# 集計した列を使う計算列（集計より後に適用しないと列が無い）
+AGGREGATE_THEN_EXPRESSION = {
+    'column_order': ['store', 'amt_sum', 'with_tax'],
+    'selected_columns': ['store', 'amt_sum', 'with_tax'],
+    'aggregate_operations': [AGGREGATE],
+    'expression_columns': [{'new_column': 'with_tax', 'expression': 'amt_sum * 2'}],
+    'operation_steps': [
+        ['aggregate_operations', AGGREGATE],
+        ['expression_columns', {'new_column': 'with_tax', 'expression': 'amt_sum * 2'}],
+    ],
+}
+
+
+def test_in_memory_replays_saved_order():
+    df, order, selected = apply_template_config(AGGREGATE_THEN_EXPRESSION, sales())
+    df = df.set_index('store')
+    assert df.loc['A', 'with_tax'] == 600
+    assert df.loc['B', 'with_tax'] == 100
+    assert order == ['store', 'amt_sum', 'with_tax']
+
+
+def test_stream_replays_saved_order():
+    result = run_stream(AGGREGATE_THEN_EXPRESSION, sales()).set_index('store')
+    assert list(result.columns) == ['amt_sum', 'with_tax']
+    assert result.loc['A', 'with_tax'] == 600
+    assert result.loc['B', 'with_tax'] == 100
+
+
+def test_stream_dedupe_after_row_operation():
+    # 結合で作った列での重複削除（結合より前に重複削除すると列が無く全列で判定される）
+    config = {
+        'column_order': ['key'],
+        'merge_operations': [{'columns': ['a', 'b'], 'new_column': 'key', 'separator': '-'}],
+        'dedupe_operations': [{'columns': ['key']}],
+        'operation_steps': [
+            ['merge_operations', {'columns': ['a', 'b'], 'new_column': 'key', 'separator': '-'}],
+            ['dedupe_operations', {'columns': ['key']}],
+        ],
+    }
+    df = pd.DataFrame({'a': ['1', '1', '2'], 'b': ['x', 'x', 'y'], 'c': ['p', 'q', 'r']})
+    assert run_stream(config, df)['key'].tolist() == ['1-x', '2-y']
+    assert apply_template_config(config, df.copy())[0]['key'].tolist() == ['1-x', '2-y']
+
+
+def test_old_template_uses_bucket_order():
+    config = {
+        'merge_operations': [{'columns': ['a'], 'new_column': 'm'}],
+        'empty_columns': ['e1', 'e2'],
+        'aggregate_operations': [AGGREGATE],
+        'expression_columns': [{'new_column': 'x', 'expression': 'a'}],
+    }
+    assert [kind for kind, _ in operation_steps(config)] == [
+        'merge_operations', 'empty_columns', 'expression_columns', 'aggregate_operations']
+    assert operation_steps(config)[1] == ['empty_columns', ['e1', 'e2']]
+
+
+def test_old_template_expression_on_aggregate_fails():
+    # 順序を保存していないテンプレートは従来どおり計算列を集計より前に適用する
+    config = {key: value for key, value in AGGREGATE_THEN_EXPRESSION.items() if key != 'operation_steps'}
+    with pytest.raises(ExpressionError, match='列が見つかりません: amt_sum'):
+        apply_template_config(config, sales())
@@ -0,0 +1,119 @@
+"""共有キャッシュの参照数・有効期限・ディスク退避のテスト"""
+
+import threading
+import types
+
+import pandas as pd
+import pytest
+
+import shared_cache
+from shared_cache import SharedCache, estimate_size
+
+TTL = 60
+
+
+def frame(n=1000, start=0):
+    return pd.DataFrame({'x': range(start, start + n)})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """有効期限を待たずに試すための時計（now[0] を進める）"""
+    now = [1000.0]
+    monkeypatch.setattr(shared_cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedCache(max_memory=estimate_size(frame()) * 2, ttl_seconds=TTL, spill_dir=str(tmp_path))
+    yield cache
+    cache.close()
+
+
+def test_referenced_entry_outlives_ttl_until_released(cache, clock):
+    cache.put('a', frame(), owner='s1')
+    cache.acquire('a', 's2')
+    cache.put('b', frame(start=1))
+    clock[0] += TTL - 1
+    cache.acquire('a', 's1')
+    cache.release('a', 's2')
+    clock[0] += 2
+    cache.put('c', frame(start=2))
+    # 参照されていない b は期限切れで削除、s1 が参照し続けている a は残る
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.summary()['referenced'] == 1
+    cache.release('a', 's1')
+    clock[0] += TTL
+    cache.release('c', 's1')
+    assert cache.summary()['entries'] == 0
+
+
+def test_owner_reference_expires_after_ttl(cache, clock):
+    cache.put('a', frame(), owner='s1')
+    clock[0] += TTL
+    # 参照を外し忘れたセッションも、有効期限が過ぎれば参照数に数えない
+    cache.put('b', frame(start=1))
+    assert cache.get('a') is None
+
+
+def test_unreferenced_entries_are_spilled_first(cache, clock):
+    cache.put('pinned', frame(), owner='s1')
+    clock[0] += 1
+    cache.put('free', frame(start=1))
+    clock[0] += 1
+    cache.put('new', frame(start=2))
+    assert cache.memory_bytes <= cache.max_memory
+    assert cache.stats['spills'] == 1
+    assert cache._entries['free'].value is None
+    assert cache._entries['pinned'].value is not None
+
+
+def test_referenced_entries_are_spilled_to_keep_the_limit(cache, clock):
+    for i, key in enumerate(['a', 'b', 'c', 'd']):
+        clock[0] += 1
+        cache.put(key, frame(start=i), owner=f's{i}')
+    # すべて参照中でもメモリ上限は守られ、削除はされない
+    assert cache.memory_bytes <= cache.max_memory
+    assert cache.summary()['entries'] == 4
+    assert cache.stats['evictions'] == 0
+    for i, key in enumerate(['a', 'b', 'c', 'd']):
+        pd.testing.assert_frame_equal(cache.get(key), frame(start=i))
+    assert cache.stats['disk_hits'] >= 2
+    assert cache.memory_bytes <= cache.max_memory
+
+
+def test_spill_keeps_dtypes(cache):
+    df = pd.DataFrame({'s': pd.Series(['あ', 'い'], dtype=object), 'n': [1.5, None], 'b': [True, False]})
+    cache.put('a', df)
+    cache._spill(cache._entries['a'])
+    pd.testing.assert_frame_equal(cache.get('a'), df)
+
+
+def test_missing_spill_file_is_a_miss(cache):
+    cache.put('a', frame())
+    entry = cache._entries['a']
+    cache._spill(entry)
+    shared_cache.os.remove(entry.path)
+    assert cache.get('a') is None
+    assert 'a' not in cache._entries
+
+
+def test_spill_file_is_read_without_the_lock(cache, monkeypatch):
+    cache.put('a', frame())
+    cache._spill(cache._entries['a'])
+    read_spill = cache._read_spill
+    lock_free = []
+
+    def read_and_check(path, dtypes):
+        # 読み込み中に別のスレッドがキャッシュのロックを取れること
+        thread = threading.Thread(target=lambda: lock_free.append(cache._lock.acquire(timeout=5)
+                                                                  and cache._lock.release() is None))
+        thread.start()
+        thread.join()
+        return read_spill(path, dtypes)
+
+    monkeypatch.setattr(cache, '_read_spill', read_and_check)
+    pd.testing.assert_frame_equal(cache.get('a'), frame())
+    assert lock_free == [True]
@@ -0,0 +1,226 @@
+"""
+CSV Organizer Pro 入力チェック
+テンプレートに保存したルール（必須・正規表現・文字数・数値の範囲・許可する値）を列ごとのベクトル演算で評価する
+（チャンク単位の変換と同じ流れの中で違反件数を数え、違反した行を別ファイルに書き出すので、データを読み直さない）
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from csv_writer import csv_options, write_csv
+from instrumentation import stage
+from numeric import to_numeric
+
+# ルールの種類と表示名
+RULE_TYPES = {
+    'required': '必須',
+    'regex': '正規表現',
+    'length': '文字数',
+    'range': '数値の範囲',
+    'allowed': '許可する値',
+}
+
+# 違反した行のファイルで先頭に加える列
+ROW_COLUMN = '行番号'
+ERROR_COLUMN = 'エラー内容'
+
+# 集計結果に残す違反した値の例の数
+SAMPLE_VALUES = 5
+
+
+def _bound(value):
+    return '' if value is None else f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def describe_rule(rule):
+    """ルールの説明（例: 商品コード: 正規表現 [A-Z]{3}\\d+）"""
+    kind = rule['type']
+    if kind == 'regex':
+        detail = rule['pattern']
+    elif kind in ('length', 'range'):
+        detail = f"{_bound(rule.get('min'))}〜{_bound(rule.get('max'))}"
+    elif kind == 'allowed':
+        values = rule['values']
+        detail = ', '.join(values[:SAMPLE_VALUES]) + (' ...' if len(values) > SAMPLE_VALUES else '')
+    else:
+        detail = ''
+    return f"{rule['column']}: {RULE_TYPES[kind]}" + (f" {detail}" if detail else '')
+
+
+def check_rule(rule):
+    """ルールの設定が正しいか確かめる（正しくなければ ValueError）"""
+    if rule.get('type') not in RULE_TYPES:
+        raise ValueError(f"未対応のルールです: {rule.get('type')}")
+    if not rule.get('column'):
+        raise ValueError("ルールを適用する列を指定してください")
+    kind = rule['type']
+    if kind == 'regex':
+        if not rule.get('pattern'):
+            raise ValueError("正規表現を入力してください")
+        try:
+            re.compile(rule['pattern'])
+        except re.error as e:
+            raise ValueError(f"正規表現が正しくありません: {e}") from None
+    elif kind in ('length', 'range'):
+        low, high = rule.get('min'), rule.get('max')
+        if low is None and high is None:
+            raise ValueError("最小値・最大値のどちらかを指定してください")
+        if low is not None and high is not None and low > high:
+            raise ValueError("最小値が最大値より大きくなっています")
+    elif kind == 'allowed' and not rule.get('values'):
+        raise ValueError("許可する値を1つ以上入力してください")
+
+
+def _as_text(series):
+    """欠損を空文字にした文字列の列（数値の列もそのまま文字として評価する）"""
+    return series.astype(str).where(series.notna(), '')
+
+
+def failure_mask(text, rule):
+    """ルールに違反する行が True の配列（text は _as_text の結果）
+
+    必須以外のルールは空欄を違反にしない（空欄を許さないときは必須と組み合わせる）。
+    """
+    blank = (text.str.strip() == '').to_numpy()
+    kind = rule['type']
+    if kind == 'required':
+        return blank
+    if kind == 'regex':
+        bad = ~text.str.fullmatch(rule['pattern'], na=False).to_numpy(bool)
+    elif kind == 'length':
+        lengths = text.str.len().to_numpy()
+        bad = np.zeros(len(text), dtype=bool)
+        if rule.get('min') is not None:
+            bad |= lengths < rule['min']
+        if rule.get('max') is not None:
+            bad |= lengths > rule['max']
+    elif kind == 'range':
+        numbers = to_numeric(text.str.strip()).to_numpy('float64', na_value=np.nan)
+        # 数値として読めない値も違反にする（NaN との比較は False なので範囲の判定では違反にならない）
+        bad = np.isnan(numbers)
+        if rule.get('min') is not None:
+            bad |= numbers < rule['min']
+        if rule.get('max') is not None:
+            bad |= numbers > rule['max']
+    elif kind == 'allowed':
+        bad = ~text.isin(rule['values']).to_numpy(bool)
+    else:
+        raise ValueError(f"未対応のルールです: {kind}")
+    return bad & ~blank
+
+
+class Validator:
+    """チャンクごとにルールを評価し、違反件数を数えて違反した行を書き出す
+
+    error_target（パスまたはバイナリのファイルオブジェクト）を渡すと、違反した行に行番号とエラー内容の列を
+    加えて書き出す（違反が無くてもヘッダーだけのファイルを作る）。close() でファイルを閉じる。
+    """
+
+    def __init__(self, rules, error_target=None, output_options=None):
+        self.rules = list(rules)
+        self.labels = [describe_rule(rule) for rule in self.rules]
+        self.rows = 0
+        self.invalid_rows = 0
+        self.counts = [0] * len(self.rules)
+        self.samples = [[] for _ in self.rules]
+        self.missing_columns = []
+        self._target = error_target
+        self._file = None
+        self._output_options = output_options or csv_options()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._file is not None and self._file is not self._target:
+            self._file.close()
+        self._file = None
+
+    def check(self, chunk):
+        """チャンクを評価し、違反した行（先頭に行番号・エラー内容の列を加えたもの）を返す"""
+        with stage('validate', rows=len(chunk)) as fields:
+            failed = np.zeros(len(chunk), dtype=bool)
+            hits = []
+            texts = {}
+            for i, rule in enumerate(self.rules):
+                column = rule['column']
+                if column not in chunk.columns:
+                    if column not in self.missing_columns:
+                        self.missing_columns.append(column)
+                    continue
+                if column not in texts:
+                    # 同じ列の複数のルールは1回だけ文字列にしたものを使う
+                    texts[column] = _as_text(chunk[column])
+                mask = failure_mask(texts[column], rule)
+                count = int(mask.sum())
+                if not count:
+                    continue
+                self.counts[i] += count
+                if len(self.samples[i]) < SAMPLE_VALUES:
+                    for value in pd.unique(texts[column].to_numpy()[mask][:SAMPLE_VALUES * 4]):
+                        if len(self.samples[i]) < SAMPLE_VALUES and value not in self.samples[i]:
+                            self.samples[i].append(value)
+                hits.append((mask, self.labels[i]))
+                failed |= mask
+
+            positions = np.flatnonzero(failed)
+            messages = np.full(len(positions), '', dtype=object)
+            for mask, label in hits:
+                selected = mask[positions]
+                messages[selected] = np.where(messages[selected] == '', label, messages[selected] + ' / ' + label)
+            errors = chunk.iloc[positions].copy()
+            errors.insert(0, ERROR_COLUMN, messages)
+            errors.insert(0, ROW_COLUMN, self.rows + positions + 1)
+            self.rows += len(chunk)
+            self.invalid_rows += len(positions)
+            fields['invalid_rows'] = len(positions)
+        self._write(errors)
+        return errors
+
+    def _write(self, errors):
+        if self._target is None:
+            return
+        if self._file is None:
+            self._file = open(self._target, 'wb') if isinstance(self._target, str) else self._target
+        # 2回目以降は追記になるので、ヘッダーと BOM は最初の1回だけ書く
+        write_csv(errors, self._file, mode='a', **self._output_options)
+
+    def validated(self, chunks):
+        """チャンクをそのまま返しながら評価する（変換・書き出しと同じ流れで1回だけ読む）"""
+        for chunk in chunks:
+            self.check(chunk)
+            yield chunk
+
+    def summary(self):
+        """{'rows', 'invalid_rows', 'rules': [{'rule', 'column', 'type', 'count', 'samples'}], 'missing_columns'}"""
+        return {
+            'rows': self.rows,
+            'invalid_rows': self.invalid_rows,
+            'rules': [{
+                'rule': label,
+                'column': rule['column'],
+                'type': rule['type'],
+                'count': count,
+                'samples': [str(value) for value in samples],
+            } for rule, label, count, samples in zip(self.rules, self.labels, self.counts, self.samples)],
+            'missing_columns': list(self.missing_columns),
+        }
+
+
+def validate_frame(df, rules):
+    """DataFrame 全体を評価し、(集計結果, 違反した行) を返す"""
+    validator = Validator(rules)
+    errors = validator.check(df)
+    return validator.summary(), errors
+
+
+def error_rows_path(output_path):
+    """出力ファイルに対応する違反した行のファイルのパス（売上.csv -> 売上_errors.csv）"""
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_errors{ext or '.csv'}"
@@ -0,0 +1,260 @@
+"""
+CSV Organizer Pro 複数シートのExcel
+シートの中身を読まずにシート名の一覧を取得し、パターンで選んだシートをプロセスプールで並列に読み込み・変換する
+（結果は1つの表に結合するか、シートごとのファイルにする。シートごとの所要時間も返す）
+"""
+
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from csv_writer import csv_options, write_csv
+from instrumentation import stage
+from loader import _read_excel, dedupe_column_names, fill_missing
+from partition import safe_filename
+from pipeline import apply_row_operations, apply_table_operations, output_columns
+
+# 複数シートを結合するときに追加する、元のシート名の列
+SHEET_COLUMN = 'シート名'
+
+# ブックとして扱う拡張子（.xlsx/.xlsm はシート一覧を ZIP 内の XML から直接読む）
+WORKBOOK_SUFFIXES = ('.xlsx', '.xlsm', '.xls')
+
+# シートの行数の目安（<dimension>）を探すために読むシートXMLの先頭バイト数
+_DIMENSION_PROBE_BYTES = 4096
+
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PACKAGE_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_DIMENSION = re.compile(rb'<(?:\w+:)?dimension\s+ref="[A-Z]*(\d+)(?::[A-Z]*(\d+))?"')
+
+
+def is_workbook(file_name):
+    return file_name.lower().endswith(WORKBOOK_SUFFIXES)
+
+
+def _xlsx_sheets(source):
+    import xml.etree.ElementTree as ET
+    import zipfile  # ブックを読むときだけ読み込む
+
+    with zipfile.ZipFile(source) as archive:
+        book = ET.fromstring(archive.read('xl/workbook.xml'))
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{_NS_PACKAGE_REL}Relationship')}
+        members = set(archive.namelist())
+        sheets = []
+        for sheet in book.iter(f'{_NS_MAIN}sheet'):
+            target = targets.get(sheet.get(f'{_NS_REL}id'), '')
+            if 'chartsheets/' in target:
+                continue  # グラフだけのシートは読み込めない
+            part = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+            rows = None
+            if part in members:
+                # シート全体は読まず、先頭にある使用範囲（A1:K500 など）から行数の目安を求める
+                with archive.open(part) as f:
+                    match = _DIMENSION.search(f.read(_DIMENSION_PROBE_BYTES))
+                if match:
+                    rows = int(match.group(2) or match.group(1)) - int(match.group(1)) + 1
+            sheets.append({'name': sheet.get('name'), 'hidden': sheet.get('state', 'visible') != 'visible',
+                           'rows': rows})
+        return sheets
+
+
+def _xls_sheets(source):
+    import xlrd  # .xls を読むときだけ読み込む
+    if isinstance(source, (str, os.PathLike)):
+        book = xlrd.open_workbook(source, on_demand=True)
+    else:
+        source.seek(0)
+        book = xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+    try:
+        return [{'name': name, 'hidden': False, 'rows': None} for name in book.sheet_names()]
+    finally:
+        book.release_resources()
+
+
+def list_sheets(source, file_name=None):
+    """ブックのシート一覧 [{'name', 'hidden', 'rows'（ヘッダーを含む行数の目安。不明なら None）}, ...]
+
+    source はパスまたはシーク可能なファイルオブジェクト。シートの中身は読み込まない。
+    """
+    file_name = file_name or os.fspath(source)
+    try:
+        if file_name.lower().endswith('.xls'):
+            return _xls_sheets(source)
+        return _xlsx_sheets(source)
+    finally:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
+
+def select_sheets(sheets, pattern=None):
+    """pattern に一致するシート名をブック内の順に返す
+
+    pattern はカンマ区切りのワイルドカード（大文字・小文字は区別しない）で、! で始まるものは除外。
+    空なら先頭のシートだけ（従来どおり）。非表示のシートはワイルドカードでは選ばず、名前をそのまま書いたときだけ選ぶ。
+    """
+    if not sheets:
+        return []
+    terms = [term.strip() for term in (pattern or '').split(',') if term.strip()]
+    if not terms:
+        return [sheets[0]['name']]
+    includes = [term for term in terms if not term.startswith('!')] or ['*']
+    excludes = [term[1:].strip() for term in terms if term.startswith('!')]
+
+    def matches(name, patterns, hidden=False):
+        return any(name == p or (not hidden and fnmatch.fnmatchcase(name.casefold(), p.casefold()))
+                   for p in patterns)
+
+    return [sheet['name'] for sheet in sheets
+            if matches(sheet['name'], includes, sheet['hidden']) and not matches(sheet['name'], excludes)]
+
+
+def template_output(config, df):
+    """テンプレートの重複削除・集計と出力列の選択を適用（行単位の操作は適用済みのもの）"""
+    df = apply_table_operations(config, df)
+    return df[output_columns(config, df.columns)]
+
+
+def _process_sheet(path, sheet, header_row, schema, config, per_sheet):
+    # プロセスプールで実行するのでモジュールの関数にする
+    started = time.perf_counter()
+    df, _hinted = _read_excel(lambda: path, header_row, schema, sheet_name=sheet)
+    df = fill_missing(dedupe_column_names(df))
+    read_done = time.perf_counter()
+    if config is not None:
+        df = apply_row_operations(config, df)
+        if per_sheet:
+            df = template_output(config, df)
+    return df, {
+        'sheet': sheet,
+        'rows': len(df),
+        'read_seconds': read_done - started,
+        'transform_seconds': time.perf_counter() - read_done,
+        'pid': os.getpid(),
+    }
+
+
+def process_sheets(path, sheets, header_row=0, config=None, per_sheet=False, schema=None, workers=None,
+                   progress=None):
+    """シートを並列に読み込み、シートの順に [(DataFrame, 時間), ...] を返す
+
+    config を渡すと各シートに行単位の操作（結合・分割・空列・計算列）を適用し、per_sheet なら
+    重複削除・集計・出力列の選択まで適用する（結合する場合はそれらを結合後に行う）。
+    時間は {'sheet', 'rows', 'read_seconds', 'transform_seconds', 'pid'}。
+    workers（既定: CPU 数）が1ならプロセスを起動せずに順に読む。progress(読み終えたシート数, 全体) で進捗を報告する。
+    """
+    workers = min(len(sheets), workers or os.cpu_count() or 1)
+    results = {}
+    if workers <= 1:
+        for sheet in sheets:
+            results[sheet] = _process_sheet(path, sheet, header_row, schema, config, per_sheet)
+            if progress is not None:
+                progress(len(results), len(sheets))
+        return [results[sheet] for sheet in sheets]
+
+    # fork だとスレッド（Streamlit・ジョブ）の状態を引き継いで固まることがあるので spawn で起動する
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futures = {pool.submit(_process_sheet, path, sheet, header_row, schema, config, per_sheet): sheet
+                   for sheet in sheets}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(len(results), len(sheets))
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return [results[sheet] for sheet in sheets]
+
+
+def merge_sheets(results, sheet_column=SHEET_COLUMN):
+    """シートごとの表を縦につなげる（列が異なる場合は列をそろえて空欄で埋める）
+
+    sheet_column を渡すと、元のシート名の列を先頭に加える。
+    """
+    frames = []
+    for df, timing in results:
+        if sheet_column:
+            if sheet_column in df.columns:
+                raise ValueError(f"シート名の列 '{sheet_column}' と同じ名前の列があります。別の列名を指定してください")
+            df.insert(0, sheet_column, timing['sheet'])
+        frames.append(df)
+    if len(frames) == 1:
+        return frames[0]
+    with stage('concat', rows=sum(len(df) for df in frames)):
+        return fill_missing(pd.concat(frames, ignore_index=True))
+
+
+def read_sheets(path, sheets, header_row=0, schema=None, sheet_column=SHEET_COLUMN, workers=None, progress=None):
+    """選んだシートを並列に読み込んで1つの表にし、(DataFrame, シートごとの時間) を返す
+
+    シートが1つならシート名の列は加えない（先頭のシートだけを読んでいたときと同じ表になる）。
+    """
+    with stage('read_sheets') as fields:
+        results = process_sheets(path, sheets, header_row, schema=schema, workers=workers, progress=progress)
+        fields['sheets'] = len(sheets)
+    df = merge_sheets(results, sheet_column if len(sheets) > 1 else None)
+    return df, [timing for _, timing in results]
+
+
+def sheet_output_path(output_path, sheet):
+    """シートごとの出力ファイルのパス（売上.csv -> 売上_シート名.csv）
+
+    ファイル名に使えない文字を含むシート名はハッシュを付けて区別する（「.A」と「A」が同じファイルにならないように）。
+    """
+    base, ext = os.path.splitext(output_path)
+    name = safe_filename(sheet)
+    if name != sheet:
+        name += '_' + hashlib.blake2b(sheet.encode('utf-8'), digest_size=4).hexdigest()
+    return f"{base}_{name}{ext or '.csv'}"
+
+
+def run(input_path, config, output_path, pattern=None, per_sheet=False, sheet_column=SHEET_COLUMN, header_row=0,
+        output_options=None, workers=None, validator=None):
+    """ブックの選んだシートにテンプレートを適用してCSVに書き出す
+
+    pattern を省くとテンプレートの sheet_pattern（無ければ先頭のシート）を使う。
+    per_sheet ならシートごとのファイル、そうでなければ1つのファイルに結合して書き出す。
+    validator（validation.Validator）を渡すと、書き出す表を入力チェックする。
+    結果は {'sheets'（シートごとの時間）, 'outputs'（[(パス, 行数), ...]）, 'rows', 'seconds'} の辞書。
+    """
+    start = time.perf_counter()
+    output_options = output_options or csv_options()
+    sheets = select_sheets(list_sheets(input_path), pattern or config.get('sheet_pattern'))
+    if not sheets:
+        raise ValueError(f"パターンに一致するシートがありません: {pattern or config.get('sheet_pattern')}")
+    with stage('read_sheets') as fields:
+        results = process_sheets(input_path, sheets, header_row, config, per_sheet, workers=workers)
+        fields['sheets'] = len(sheets)
+    timings = [timing for _, timing in results]
+
+    outputs = []
+    if per_sheet:
+        for df, timing in results:
+            path = sheet_output_path(output_path, timing['sheet'])
+            if validator is not None:
+                validator.check(df)
+            outputs.append((path, write_csv(df, path, **output_options)))
+    else:
+        sheet_column = sheet_column if len(sheets) > 1 else None
+        df = apply_table_operations(config, merge_sheets(results, sheet_column))
+        columns = output_columns(config, df.columns)
+        if sheet_column in df.columns and sheet_column not in columns:
+            columns = [sheet_column] + columns
+        if validator is not None:
+            validator.check(df[columns])
+        outputs.append((output_path, write_csv(df[columns], output_path, **output_options)))
+    return {
+        'sheets': timings,
+        'outputs': outputs,
+        'rows': sum(rows for _, rows in outputs),
+        'seconds': time.perf_counter() - start,
+    }